@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Product, ProductImage, Category, Tag, VisitLog, UserFeedback, MainCategory, SubCategory, AbuseReport, Advertisement, Request, AdminAlert, UserProfile
+from .models import Product, ProductImage, ProductComment, Notification, Broadcast, Category, Tag, VisitLog, UserFeedback, MainCategory, SubCategory, AbuseReport, Advertisement, Request, AdminAlert, UserProfile
 
 @admin.register(MainCategory)
 class MainCategoryAdmin(admin.ModelAdmin):
@@ -51,6 +51,37 @@ class VisitLogAdmin(admin.ModelAdmin):
     list_display = ('product', 'visit_count', 'date')
     list_filter = ('date',)
 
+@admin.register(ProductComment)
+class ProductCommentAdmin(admin.ModelAdmin):
+    list_display = ('product', 'email', 'short_message', 'created_at', 'user')
+    list_filter = ('created_at',)
+    search_fields = ('email', 'message')
+    raw_id_fields = ('product', 'user')
+    ordering = ('-created_at',)
+
+    def short_message(self, obj):
+        return obj.message[:100] + '...' if len(obj.message) > 100 else obj.message
+    short_message.short_description = 'نظر'
+
+@admin.register(Notification)
+class NotificationAdmin(admin.ModelAdmin):
+    list_display = ('user', 'kind', 'message', 'is_read', 'created_at')
+    list_filter = ('kind', 'is_read', 'created_at')
+    search_fields = ('message', 'user__username')
+    raw_id_fields = ('user',)
+    ordering = ('-created_at',)
+
+@admin.register(Broadcast)
+class BroadcastAdmin(admin.ModelAdmin):
+    list_display = ('message', 'created_by', 'created_at')
+    search_fields = ('message',)
+    readonly_fields = ('created_by', 'created_at')
+    ordering = ('-created_at',)
+
+    def has_add_permission(self, request):
+        # ارسال از صفحه send_notification_to_all_users (notifications.broadcast) تا شمارنده‌ها باطل شوند
+        return False
+
 @admin.register(UserFeedback)
 class UserFeedbackAdmin(admin.ModelAdmin):
     list_display = ('email', 'subject', 'short_message', 'timestamp', 'user', 'get_user_contact')
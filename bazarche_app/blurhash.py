@@ -0,0 +1,75 @@
+"""
+کدگذاری BlurHash (https://blurha.sh) برای placeholder عکس‌ها
+
+یک رشته حدود 28 کاراکتری که چند مولفه DCT تصویر را نگه می‌دارد و در مرورگر
+(static/js/blurhash.js) به یک تصویر تار تبدیل می‌شود. ورودی یک تصویر RGB کوچک است
+(images.py نسخه 32 پیکسلی می‌دهد)؛ با پایتون خالص و جدول cos از پیش محاسبه شده.
+"""
+import math
+
+BASE83 = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz#$%*+,-.:;=?@[]^_{|}~'
+# مولفه‌های افقی و عمودی (4x3: رشته 28 کاراکتری)
+COMPONENTS = (4, 3)
+
+
+def base83(value, length):
+    return ''.join(BASE83[(value // 83 ** (length - i - 1)) % 83] for i in range(length))
+
+
+def srgb_to_linear(value):
+    v = value / 255
+    return v / 12.92 if v <= 0.04045 else ((v + 0.055) / 1.055) ** 2.4
+
+
+def linear_to_srgb(value):
+    v = max(0.0, min(1.0, value))
+    if v <= 0.0031308:
+        return int(v * 12.92 * 255 + 0.5)
+    return int((1.055 * v ** (1 / 2.4) - 0.055) * 255 + 0.5)
+
+
+def sign_pow(value, exponent):
+    return math.copysign(abs(value) ** exponent, value)
+
+
+def encode(img, components=COMPONENTS):
+    """BlurHash یک تصویر RGB (کوچک؛ هزینه متناسب با تعداد پیکسل‌ها)"""
+    nx, ny = components
+    width, height = img.size
+    linear = [srgb_to_linear(v) for v in range(256)]
+    pixels = [(linear[r], linear[g], linear[b]) for r, g, b in img.getdata()]
+    cos_x = [[math.cos(math.pi * i * x / width) for x in range(width)] for i in range(nx)]
+    cos_y = [[math.cos(math.pi * j * y / height) for y in range(height)] for j in range(ny)]
+
+    factors = []
+    for j in range(ny):
+        for i in range(nx):
+            r = g = b = 0.0
+            for y in range(height):
+                row = y * width
+                basis_y = cos_y[j][y]
+                for x in range(width):
+                    basis = cos_x[i][x] * basis_y
+                    pr, pg, pb = pixels[row + x]
+                    r += basis * pr
+                    g += basis * pg
+                    b += basis * pb
+            scale = (1 if i == 0 and j == 0 else 2) / (width * height)
+            factors.append((r * scale, g * scale, b * scale))
+
+    dc, ac = factors[0], factors[1:]
+    result = base83((nx - 1) + (ny - 1) * 9, 1)
+    if ac:
+        actual_max = max(abs(v) for factor in ac for v in factor)
+        quantised_max = max(0, min(82, int(actual_max * 166 - 0.5)))
+        maximum = (quantised_max + 1) / 166
+        result += base83(quantised_max, 1)
+    else:
+        maximum = 1
+        result += base83(0, 1)
+
+    result += base83((linear_to_srgb(dc[0]) << 16) + (linear_to_srgb(dc[1]) << 8) + linear_to_srgb(dc[2]), 4)
+    for factor in ac:
+        r, g, b = (max(0, min(18, int(sign_pow(v / maximum, 0.5) * 9 + 9.5))) for v in factor)
+        result += base83(r * 19 * 19 + g * 19 + b, 2)
+    return result
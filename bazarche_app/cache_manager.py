@@ -2,11 +2,42 @@ from django.core.cache import cache
 from django.core.cache import caches
 from django.db.models import Q
 from .models import Product, Category, MainCategory
+from .counters import get_counts
+from .product_page import build_product_page
 import json
 import hashlib
+import time
 
 class CacheManager:
-    """مدیریت کش برای بهبود عملکرد سایت"""
+    """
+    مدیریت کش برای بهبود عملکرد سایت
+
+    هر خانواده کلید (لیست محصولات، دسته‌بندی، شهر، جزئیات) یک شماره نسخه دارد که در کلیدها
+    قرار می‌گیرد. باطل کردن یک خانواده فقط یک INCR اتمیک است و کلیدهای قدیمی خودشان منقضی
+    می‌شوند؛ نیازی به delete_pattern (اسکن کلیدهای Redis) نیست.
+    """
+
+    NAMESPACES = ('products', 'category', 'city', 'detail')
+
+    @staticmethod
+    def namespace_version(namespace):
+        """نسخه فعلی یک خانواده کلید"""
+        # مقدار اولیه زمان به نانوثانیه: اگر کلید نسخه از Redis بیرون رانده شود، نسخه جدید
+        # از نسخه‌های قبلی بزرگ‌تر است مگر اینکه از زمان ساخت بیشتر از یک INCR در هر نانوثانیه
+        # انجام شده باشد (با ثانیه، هر بیش از یک INCR در ثانیه کلیدهای قدیمی را دوباره زنده می‌کرد).
+        # حدود 1.8e18 و در بازه 64 بیتی INCR ردیس
+        return cache.get_or_set(f'ns:{namespace}', time.time_ns(), None)
+
+    @staticmethod
+    def bump_namespace(namespace):
+        """باطل کردن همه کلیدهای یک خانواده با یک INCR"""
+        key = f'ns:{namespace}'
+        try:
+            return cache.incr(key)
+        except ValueError:
+            # کلید نسخه هنوز ساخته نشده
+            cache.add(key, time.time_ns(), None)
+            return cache.incr(key)
     
     @staticmethod
     def get_cache_key(prefix, *args):
@@ -17,11 +48,11 @@ class CacheManager:
     @staticmethod
     def get_products_cache_key(category_id=None, city_id=None, search_query=None, page=1):
         """کلید کش برای محصولات"""
-        cache_key = f"products:list"
+        cache_key = f"products:list:v{CacheManager.namespace_version('products')}"
         if category_id:
-            cache_key += f":cat_{category_id}"
+            cache_key += f":cat_{category_id}_v{CacheManager.namespace_version('category')}"
         if city_id:
-            cache_key += f":city_{city_id}"
+            cache_key += f":city_{city_id}_v{CacheManager.namespace_version('city')}"
         if search_query:
             # استفاده از hash برای جستجوهای طولانی
             search_hash = hashlib.md5(search_query.encode()).hexdigest()[:8]
@@ -44,7 +75,7 @@ class CacheManager:
                 'price': str(product.price),
                 'city_name': product.city.name if product.city else None,
                 'category_name': product.category.name_fa if product.category else None,
-                'image_url': product.image.url if hasattr(product, 'image') and product.image else None,
+                'image_url': product.primary_image_url,
                 'created_at': product.created_at.isoformat(),
                 'is_suggested': product.is_suggested,
             })
@@ -60,44 +91,59 @@ class CacheManager:
     
     @staticmethod
     def clear_products_cache():
-        """پاک کردن کش محصولات"""
-        # پاک کردن تمام کلیدهای مربوط به محصولات
-        cache_keys = [
-            'products:list',
-            'products:count',
-            'products:categories',
-        ]
-        for key in cache_keys:
-            try:
-                cache.delete_pattern(f"{key}*")
-            except AttributeError:
-                # اگر delete_pattern وجود نداشت (مثلاً LocMemCache)
-                # همه کلیدهای کش را بگیر و کلیدهای مربوط به محصولات را پاک کن
-                if hasattr(cache, 'keys'):
-                    keys = cache.keys(f"{key}*")
-                    for k in keys:
-                        cache.delete(k)
+        """باطل کردن کش لیست‌ها و تعداد محصولات (یک INCR)"""
+        CacheManager.bump_namespace('products')
+
+    @staticmethod
+    def clear_categories_cache():
+        """باطل کردن کش دسته‌بندی‌ها و لیست‌های فیلتر شده با دسته‌بندی"""
+        CacheManager.bump_namespace('category')
+
+    @staticmethod
+    def clear_cities_cache():
+        """باطل کردن کش لیست‌های فیلتر شده با شهر"""
+        CacheManager.bump_namespace('city')
+
+    @staticmethod
+    def clear_product_details_cache():
+        """باطل کردن کش جزئیات همه محصولات"""
+        CacheManager.bump_namespace('detail')
+
+    @staticmethod
+    def get_categories_cache_key(name='categories'):
+        return f"{name}:all:v{CacheManager.namespace_version('category')}"
+
+    @staticmethod
+    def get_product_count_cache_key():
+        return f"products:total_count:v{CacheManager.namespace_version('products')}"
+
+    @staticmethod
+    def get_product_detail_cache_key(product_id):
+        # page2: مدل صفحه با شناسه کارت‌ها (product_page.page_cards)؛ مدل‌های قدیمی خوانده نمی‌شوند
+        return f"product:page2:v{CacheManager.namespace_version('detail')}:{product_id}"
     
     @staticmethod
     def cache_categories(categories, timeout=1800):  # 30 دقیقه
         """کش کردن دسته‌بندی‌ها"""
         categories_data = []
+        counts = get_counts('category')
         for category in categories:
             categories_data.append({
                 'id': category.id,
                 'name': category.name,
                 'name_en': category.name_en,
                 'name_fa': category.name_fa,
-                'product_count': category.product_set.count(),
+                'product_count': counts.get(category.id, 0),
             })
         
-        cache.set('categories:all', categories_data, timeout)
-        return 'categories:all'
+        cache_key = CacheManager.get_categories_cache_key()
+        cache.set(cache_key, categories_data, timeout)
+        return cache_key
     
     @staticmethod
     def get_cached_categories():
         """دریافت دسته‌بندی‌ها از کش"""
-        return cache.get('categories:all')
+        return cache.get(CacheManager.get_categories_cache_key())
     
     @staticmethod
     def cache_main_categories(categories, timeout=1800):
@@ -112,57 +158,46 @@ class CacheManager:
                 'product_count': category.product_set.count(),
             })
         
-        cache.set('main_categories:all', categories_data, timeout)
-        return 'main_categories:all'
+        cache_key = CacheManager.get_categories_cache_key('main_categories')
+        cache.set(cache_key, categories_data, timeout)
+        return cache_key
     
     @staticmethod
     def get_cached_main_categories():
         """دریافت دسته‌بندی‌های اصلی از کش"""
-        return cache.get('main_categories:all')
+        return cache.get(CacheManager.get_categories_cache_key('main_categories'))
     
     @staticmethod
     def cache_product_count(count, timeout=300):
         """کش کردن تعداد محصولات"""
-        cache.set('products:total_count', count, timeout)
+        cache.set(CacheManager.get_product_count_cache_key(), count, timeout)
     
     @staticmethod
     def get_cached_product_count():
         """دریافت تعداد محصولات از کش"""
-        return cache.get('products:total_count')
+        return cache.get(CacheManager.get_product_count_cache_key())
     
     @staticmethod
     def invalidate_product_cache(product_id):
         """باطل کردن کش محصول خاص"""
-        # پاک کردن کش محصول
-        cache.delete(f'product:detail:{product_id}')
+        # پاک کردن کش محصول (یک کلید مشخص، بدون اسکن)
+        cache.delete(CacheManager.get_product_detail_cache_key(product_id))
         
         # پاک کردن کش لیست محصولات
         CacheManager.clear_products_cache()
     
     @staticmethod
-    def cache_product_detail(product, timeout=600):
-        """کش کردن جزئیات محصول"""
-        product_data = {
-            'id': product.id,
-            'title': product.name_fa,
-            'description': product.description_fa,
-            'price': str(product.price),
-            'city_name': product.city.name if product.city else None,
-            'category_name': product.category.name_fa if product.category else None,
-            'image_url': product.image.url if hasattr(product, 'image') and product.image else None,
-            'created_at': product.created_at.isoformat(),
-            'is_suggested': product.is_suggested,
-            'owner_name': product.owner.username if hasattr(product, 'owner') and product.owner else None,
-        }
-        
-        cache_key = f'product:detail:{product.id}'
-        cache.set(cache_key, product_data, timeout)
-        return cache_key
+    def cache_product_detail(product_id, timeout=600):
+        """ساخت و کش مدل صفحه جزئیات محصول (product_page)؛ برای محصول ناموجود None"""
+        product_page = build_product_page(product_id)
+        if product_page is not None:
+            cache.set(CacheManager.get_product_detail_cache_key(product_id), product_page, timeout)
+        return product_page
     
     @staticmethod
     def get_cached_product_detail(product_id):
         """دریافت جزئیات محصول از کش"""
-        return cache.get(f'product:detail:{product_id}')
+        return cache.get(CacheManager.get_product_detail_cache_key(product_id))
     
     @staticmethod
     def clear_all_cache():
@@ -0,0 +1,95 @@
+"""
+چت خریدار و فروشنده
+
+هر گفتگو (محصول، خریدار، فروشنده) یک ردیف Conversation است و پیام‌ها در Message با ایندکس
+(conversation_id, id). دریافت پیام‌های جدید در polling فقط یک پیمایش بازه روی همین ایندکس
+است و هزینه آن به حجم کل پیام‌ها یا UserFeedback بستگی ندارد.
+
+تعداد خوانده نشده هر طرف روی خود گفتگو نگه داشته می‌شود (UPDATE با F)، پس شمارش پیام‌ها لازم نیست.
+پیام‌های جدید بعد از commit از طریق push.py به اتصال‌های SSE هر دو طرف فرستاده می‌شوند.
+"""
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Conversation, Message
+from .push import publish, user_channel
+
+# حداکثر پیام‌های بارگذاری شده در باز کردن صفحه چت
+HISTORY_LIMIT = 100
+
+
+def unread_field(conversation, user):
+    return 'buyer_unread' if user.id == conversation.buyer_id else 'seller_unread'
+
+
+def user_conversations(user):
+    """گفتگوهایی که کاربر در آن‌ها طرف است"""
+    return Conversation.objects.filter(Q(buyer=user) | Q(seller=user))
+
+
+def find_conversation(user, product, conversation_id=None):
+    """گفتگوی مشخص شده یا گفتگوی کاربر به عنوان خریدار این محصول (None اگر وجود ندارد)"""
+    conversations = user_conversations(user).filter(product=product).select_related('buyer', 'seller')
+    if conversation_id:
+        return conversations.filter(pk=conversation_id).first()
+    return conversations.filter(buyer=user).first()
+
+
+def get_or_start_conversation(product, buyer):
+    conversation, _created = Conversation.objects.get_or_create(
+        product=product, buyer=buyer, defaults={'seller': product.user},
+    )
+    return conversation
+
+
+def post_message(conversation, sender, body):
+    """ثبت پیام و افزایش خوانده نشده‌های طرف مقابل"""
+    now = timezone.now()
+    other_unread = 'seller_unread' if sender.id == conversation.buyer_id else 'buyer_unread'
+    with transaction.atomic():
+        message = Message.objects.create(conversation=conversation, sender=sender, body=body, created_at=now)
+        Conversation.objects.filter(pk=conversation.pk).update(
+            last_message_at=now, **{other_unread: F(other_unread) + 1}
+        )
+        transaction.on_commit(lambda: publish_message(message, conversation))
+    return message
+
+
+def publish_message(message, conversation):
+    """ارسال پیام به هر دو طرف گفتگو (is_own برای هر کدام جدا)"""
+    for user in (conversation.buyer, conversation.seller):
+        data = serialize_message(message, conversation, user)
+        data['conversation_id'] = conversation.id
+        publish(user_channel(user.id), 'chat', data)
+
+
+def recent_messages(conversation, limit=HISTORY_LIMIT):
+    """آخرین پیام‌ها به ترتیب ارسال"""
+    messages = list(conversation.messages.order_by('-id')[:limit])
+    messages.reverse()
+    return messages
+
+
+def messages_after(conversation, last_message_id):
+    """پیام‌های جدیدتر از last_message_id (پیمایش بازه روی chat_message_idx)"""
+    return Message.objects.filter(conversation=conversation, id__gt=last_message_id).order_by('id')
+
+
+def mark_read(conversation, user):
+    """صفر کردن خوانده نشده‌های کاربر؛ فقط اگر چیزی خوانده نشده باشد می‌نویسد"""
+    field = unread_field(conversation, user)
+    if getattr(conversation, field):
+        Conversation.objects.filter(pk=conversation.pk).update(**{field: 0})
+        setattr(conversation, field, 0)
+
+
+def serialize_message(message, conversation, user):
+    sender = conversation.buyer if message.sender_id == conversation.buyer_id else conversation.seller
+    return {
+        'id': message.id,
+        'message': message.body,
+        'sender': sender.username,
+        'is_own': message.sender_id == user.id,
+        'timestamp': timezone.localtime(message.created_at).strftime('%H:%M'),
+    }
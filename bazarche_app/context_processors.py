@@ -1,7 +1,8 @@
 from django.contrib.auth.models import User
-from .models import VisitLog, MainCategory, Advertisement
+from .models import VisitLog
+from .reference_data import get_snapshot, active_advertisements
 from django.db.models import Sum
-from django.utils import timezone
+from django.conf import settings
 
 def site_stats(request):
     user_count = User.objects.count()
@@ -9,7 +10,7 @@ def site_stats(request):
     return {"user_count": user_count, "total_visits": total_visits}
 
 def main_categories(request):
-    return {"main_categories": MainCategory.objects.all().order_by('order', 'name_fa')}
+    return {"main_categories": get_snapshot()['main_categories']}
 
 def search_query(request):
     """Always provide search_query to all templates"""
@@ -17,10 +18,9 @@ def search_query(request):
 
 def sidebar_advertisements(request):
     """Provide sidebar advertisements to all templates"""
-    sidebar_ads = Advertisement.objects.filter(
-        location='sidebar',
-        is_active=True,
-        start_date__lte=timezone.now(),
-        end_date__gte=timezone.now()
-    ).order_by('display_order', '-created_at')[:3]
-    return {"sidebar_advertisements": sidebar_ads}
\ No newline at end of file
+    sidebar_ads = active_advertisements('sidebar')[:3]
+    return {"sidebar_advertisements": sidebar_ads}
+
+def push_events(request):
+    """آدرس رویدادهای SSE (پروسه events)؛ بدون آن navbar اتصالی باز نمی‌کند"""
+    return {"push_events_url": getattr(settings, 'PUSH_EVENTS_URL', None)}
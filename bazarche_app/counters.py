@@ -0,0 +1,105 @@
+"""
+شمارنده‌های محصولات تایید شده به ازای شهر، دسته‌بندی و برچسب
+
+صفحاتی که تعداد محصولات هر شهر/دسته/برچسب را نشان می‌دهند به جای COUNT روی کل جدول
+محصولات از جدول کوچک ProductCounter می‌خوانند. signals هر تغییر تایید، شهر، دسته‌بندی
+یا برچسب‌های محصول را با UPDATE ... SET count = count + delta اعمال می‌کنند.
+
+تغییراتی که از signals عبور نمی‌کنند (مثل queryset.update(is_approved=...)) با دستور
+reconcile_product_counters اصلاح می‌شوند.
+"""
+from collections import Counter
+
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from .models import Product, ProductCounter
+
+
+def adjust_counts(dimension, deltas):
+    """deltas: {object_id: تغییر}؛ ردیف‌های ناموجود ساخته می‌شوند"""
+    deltas = {object_id: delta for object_id, delta in deltas.items() if object_id is not None and delta}
+    if not deltas:
+        return
+    ProductCounter.objects.bulk_create(
+        [ProductCounter(dimension=dimension, object_id=object_id) for object_id in deltas],
+        ignore_conflicts=True,
+    )
+    # گروه‌بندی بر اساس مقدار تغییر: معمولا یک UPDATE برای همه
+    by_delta = {}
+    for object_id, delta in deltas.items():
+        by_delta.setdefault(delta, []).append(object_id)
+    for delta, object_ids in by_delta.items():
+        ProductCounter.objects.filter(dimension=dimension, object_id__in=object_ids).update(count=F('count') + delta)
+
+
+def get_counts(dimension):
+    """{object_id: تعداد} برای یک نوع؛ یک کوئری روی جدول کوچک شمارنده‌ها"""
+    return dict(
+        ProductCounter.objects.filter(dimension=dimension).values_list('object_id', 'count')
+    )
+
+
+def with_product_count(queryset, dimension):
+    """annotation product_count از جدول شمارنده‌ها (جستجوی ایندکس یکتا به ازای هر ردیف)"""
+    counter = ProductCounter.objects.filter(dimension=dimension, object_id=OuterRef('pk')).values('count')[:1]
+    return queryset.annotate(product_count=Coalesce(Subquery(counter), Value(0)))
+
+
+def product_state(product):
+    """وضعیت مؤثر محصول در شمارنده‌ها: (تایید شده، شهر، دسته‌بندی)"""
+    return (product.is_approved, product.city_id, product.category_id)
+
+
+def apply_state_change(old_state, new_state, tag_ids=()):
+    """اعمال تفاوت دو وضعیت یک محصول (None = محصول وجود ندارد)"""
+    old_approved, old_city, old_category = old_state or (False, None, None)
+    new_approved, new_city, new_category = new_state or (False, None, None)
+    for dimension, old_id, new_id in (('city', old_city, new_city), ('category', old_category, new_category)):
+        deltas = Counter()
+        if old_approved:
+            deltas[old_id] -= 1
+        if new_approved:
+            deltas[new_id] += 1
+        adjust_counts(dimension, deltas)
+    if old_approved != new_approved:
+        adjust_counts('tag', {tag_id: 1 if new_approved else -1 for tag_id in tag_ids})
+
+
+def compute_counts():
+    """شمارش دقیق از جدول محصولات: {(dimension, object_id): count}"""
+    approved = Product.objects.filter(is_approved=True).order_by()
+    exact = {}
+    for dimension, field in (('city', 'city_id'), ('category', 'category_id'), ('tag', 'tags')):
+        rows = approved.filter(**{f'{field}__isnull': False}).values_list(field).annotate(count=Count('pk'))
+        exact.update({(dimension, object_id): count for object_id, count in rows})
+    return exact
+
+
+def reconcile_counts(dry_run=False):
+    """اصلاح انحراف شمارنده‌ها؛ خروجی: لیست (dimension, object_id, مقدار قبلی, مقدار درست)"""
+    exact = compute_counts()
+    stored = {
+        (dimension, object_id): (pk, count)
+        for pk, dimension, object_id, count in ProductCounter.objects.values_list('pk', 'dimension', 'object_id', 'count')
+    }
+    drift = []
+    for key in sorted(set(exact) | set(stored)):
+        current = stored.get(key, (None, 0))[1]
+        correct = exact.get(key, 0)
+        if current != correct:
+            drift.append((*key, current, correct))
+    if dry_run or not drift:
+        return drift
+
+    to_update = []
+    to_create = []
+    for dimension, object_id, current, correct in drift:
+        pk = stored.get((dimension, object_id), (None, 0))[0]
+        if pk is None:
+            to_create.append(ProductCounter(dimension=dimension, object_id=object_id, count=correct))
+        else:
+            to_update.append(ProductCounter(pk=pk, count=correct))
+    ProductCounter.objects.bulk_create(to_create, batch_size=1000)
+    ProductCounter.objects.bulk_update(to_update, ['count'], batch_size=1000)
+    return drift
@@ -0,0 +1,85 @@
+"""
+شمارش فیلترهای صفحه لیست و صفحه دسته‌بندی محصولات (شهر، دسته‌بندی، بازه قیمت، وضعیت)
+
+همه شمارش‌ها از یک کوئری GROUP BY روی ترکیب (شهر، دسته‌بندی، بازه قیمت، وضعیت) به دست می‌آیند.
+هر بُعد با فیلترهای انتخاب شده در بقیه ابعاد محدود می‌شود (نه فیلتر خودش)، تا کاربر بتواند
+گزینه دیگری از همان بُعد را ببیند. ردیف‌های گروه‌بندی شده به ازای فیلترهای غیر بُعدی
+(جستجو، برچسب، ویژه، تخفیف‌دار) کش می‌شوند و تغییر شهر/دسته/قیمت/وضعیت کوئری جدیدی نمی‌زند.
+"""
+import hashlib
+
+from django.core.cache import cache
+from django.db.models import Case, When, Value, CharField, Count, Q
+
+from .text_normalization import normalize_text
+
+FACET_CACHE_TIMEOUT = 60 * 5
+
+# بازه‌های قیمت بر اساس ستون price (همان شرط‌های فیلتر product_list)
+PRICE_RANGE_FILTERS = {
+    '0-1000': Q(price__gte=0, price__lte=1000),
+    '1000-5000': Q(price__gt=1000, price__lte=5000),
+    '5000-10000': Q(price__gt=5000, price__lte=10000),
+    '10000-50000': Q(price__gt=10000, price__lte=50000),
+    '50000-100000': Q(price__gt=50000, price__lte=100000),
+    '100000+': Q(price__gt=100000),
+}
+
+PRICE_BUCKET = Case(
+    *[When(condition, then=Value(key)) for key, condition in PRICE_RANGE_FILTERS.items()],
+    default=Value(None),
+    output_field=CharField(),
+)
+
+FACET_DIMENSIONS = ('city', 'category', 'price', 'condition')
+
+
+def facet_signature(search_query=None, tag_id=None, is_featured=False, is_discounted=False, category_id=None):
+    """
+    کلید کش ردیف‌های گروه‌بندی شده؛ فقط فیلترهای غیر بُعدی در آن هستند
+    (category_id: صفحه دسته‌بندی که دسته در آن فیلتر پایه است، نه بُعد)
+    """
+    raw = '|'.join([
+        normalize_text(search_query), str(tag_id or ''), str(int(is_featured)), str(int(is_discounted)),
+        str(category_id or ''),
+    ])
+    return 'facets:' + hashlib.md5(raw.encode()).hexdigest()
+
+
+def facet_rows(base_queryset, signature):
+    """[(city_id, category_id, price_bucket, condition, count), ...] با یک کوئری یا از کش"""
+    rows = cache.get(signature)
+    if rows is None:
+        rows = list(
+            base_queryset.order_by()
+            .annotate(price_bucket=PRICE_BUCKET)
+            .values_list('city_id', 'category_id', 'price_bucket', 'condition')
+            .annotate(count=Count('pk'))
+        )
+        cache.set(signature, rows, FACET_CACHE_TIMEOUT)
+    return rows
+
+
+def count_facets(rows, selected):
+    """
+    selected: {'city': ..., 'category': ..., 'price': ..., 'condition': ...} (None = بدون فیلتر)
+    خروجی: {'city': {id: n}, 'category': {...}, 'price': {...}, 'condition': {...}, 'total': n}
+    """
+    selected = {dim: str(value) for dim, value in selected.items() if value not in (None, '')}
+    counts = {dim: {} for dim in FACET_DIMENSIONS}
+    total = 0
+    for *values, count in rows:
+        mismatched = [
+            dim for dim, value in zip(FACET_DIMENSIONS, values)
+            if dim in selected and str(value) != selected[dim]
+        ]
+        if not mismatched:
+            total += count
+        if len(mismatched) > 1:
+            continue
+        for dim, value in zip(FACET_DIMENSIONS, values):
+            # هر بُعد فقط با فیلتر بقیه ابعاد محدود می‌شود
+            if value is not None and (not mismatched or mismatched == [dim]):
+                counts[dim][value] = counts[dim].get(value, 0) + count
+    counts['total'] = total
+    return counts
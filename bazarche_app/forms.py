@@ -221,7 +221,7 @@ class RequestForm(forms.ModelForm):
 
 
 class ProductCommentForm(forms.Form):
-    """فرم کامنت محصول با UserFeedback"""
+    """فرم کامنت محصول"""
     comment_text = forms.CharField(
         widget=forms.Textarea(attrs={
             'class': 'form-control',
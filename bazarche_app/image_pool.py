@@ -0,0 +1,107 @@
+"""
+پردازش عکس‌های محصولات خارج از درخواست
+
+register_product فقط فایل‌های اصلی را ذخیره می‌کند و schedule_derivatives شناسه آن‌ها را بعد از
+commit به یک ProcessPoolExecutor با PROCESSING_THREADS پروسه می‌دهد؛ زمان درخواست به نوشتن فایل
+روی دیسک محدود است. پروسه‌ها (spawn) فقط images.render_file را اجرا می‌کنند و به Django و
+دیتابیس دسترسی ندارند. نتیجه در یک thread جدا در پروسه اصلی ذخیره و روی مدل ثبت می‌شود.
+تا آن موقع کارت‌ها و صفحه محصول تصویر جایگزین نشان می‌دهند.
+
+کارهای در صف حافظه پروسه وب هستند؛ اگر سرور وسط کار restart شود، عکس بدون نسخه می‌ماند و
+دستور generate_image_derivatives آن را می‌سازد. PROCESSING_THREADS=0 یعنی پردازش در همان
+پروسه بعد از commit (تست‌ها و محیط‌های بدون fork).
+
+pool در هر پروسه وب جدا است و با اولین آپلود ساخته می‌شود: gunicorn با ۲ worker تا
+2 × PROCESSING_THREADS پروسه اضافه دارد. پیش‌فرض ۲ است تا روی سرور کوچک پردازش عکس هسته‌های
+پاسخ به درخواست‌ها را نگیرد؛ برای ساخت دسته‌ای از generate_image_derivatives --workers استفاده کنید.
+"""
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.db import connections, transaction
+
+from .images import image_settings, render_config, render_file, render_source, store_variants, generate_derivatives, mark_failed
+from .models import ProductImage
+
+# هر پروسه بعد از این تعداد عکس با پروسه تازه عوض می‌شود (حافظه Pillow)
+MAX_TASKS_PER_CHILD = 50
+
+_pool = None
+_writer = None
+_lock = threading.Lock()
+
+
+def pool_size():
+    return image_settings().get('PROCESSING_THREADS', 2)
+
+
+def get_pool():
+    global _pool, _writer
+    with _lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=pool_size(),
+                mp_context=multiprocessing.get_context('spawn'),
+                max_tasks_per_child=MAX_TASKS_PER_CHILD,
+            )
+            # ذخیره نتایج: یک thread با اتصال دیتابیس خودش
+            _writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='image-writer')
+        return _pool, _writer
+
+
+def reset_pool():
+    """کنار گذاشتن pool خراب؛ درخواست بعدی pool تازه می‌سازد"""
+    global _pool, _writer
+    with _lock:
+        pool, _pool = _pool, None
+        _writer = None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def schedule_derivatives(image_ids):
+    """ساخت نسخه‌های عکس‌ها بعد از commit تراکنش جاری"""
+    image_ids = list(image_ids)
+    transaction.on_commit(lambda: submit(image_ids))
+
+
+def submit(image_ids):
+    images = list(ProductImage.objects.filter(pk__in=image_ids))
+    if pool_size() <= 0:
+        for product_image in images:
+            generate_derivatives(product_image)
+        return
+
+    config = render_config()
+    for product_image in images:
+        try:
+            pool, writer = get_pool()
+            future = pool.submit(render_file, render_source(product_image), config)
+        except (BrokenProcessPool, RuntimeError, OSError) as e:
+            # بدون pool عکس در همین درخواست پردازش می‌شود، نه اینکه بدون نسخه بماند
+            print(f"خطا در ارسال عکس {product_image.pk} به pool: {e}")
+            reset_pool()
+            generate_derivatives(product_image)
+            continue
+        future.add_done_callback(
+            lambda future, product_image=product_image, writer=writer: writer.submit(finish, product_image, future)
+        )
+
+
+def finish(product_image, future):
+    try:
+        result = future.result()
+        if result is not None:
+            store_variants(product_image, result)
+        else:
+            mark_failed(product_image)
+    except BrokenProcessPool as e:
+        print(f"پروسه پردازش عکس {product_image.pk} از کار افتاد: {e}")
+        reset_pool()
+    except Exception as e:
+        print(f"خطا در ذخیره نسخه‌های عکس {product_image.pk}: {e}")
+    finally:
+        # اتصال‌های همین thread (writer)، نه اتصال درخواست‌ها
+        connections.close_all()
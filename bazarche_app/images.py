@@ -0,0 +1,356 @@
+"""
+نسخه‌های مشتق (derivative) عکس محصولات
+
+هر ProductImage علاوه بر فایل اصلی چند نسخه با اندازه‌های ثابت (thumb, card, full) و در دو
+قالب WebP و JPEG دارد که یک بار بعد از آپلود ساخته و در ProductImage.variants ثبت می‌شوند:
+
+    {'card': {'width': 600, 'height': 450, 'webp': 'product_images/variants/12_card.webp',
+              'jpeg': 'product_images/variants/12_card.jpg'}, ...}
+
+اندازه‌ها و کیفیت‌ها از settings.IMAGE_PROCESSING خوانده می‌شوند. قالب‌ها و فید JSON کوچک‌ترین
+نسخه کافی را با srcset انتخاب می‌کنند. عکسی که در صف پردازش است (is_processing) تصویر جایگزین
+(placeholder) دارد و عکس‌های قدیمی بدون نسخه فایل اصلی.
+
+کار سنگین (decode، resize، encode) در render_file انجام می‌شود که به Django وابسته نیست و در
+پروسه‌های image_pool.py اجرا می‌شود؛ ذخیره فایل‌ها و ثبت روی مدل (store_variants) در پروسه اصلی.
+
+- JPEG با draft در کوچک‌ترین مقیاس کافی (1/2، 1/4، 1/8) decode می‌شود، نه با اندازه کامل.
+- چرخش EXIF اعمال، پروفایل رنگ به sRGB تبدیل و همه metadata (EXIF، GPS، ICC) حذف می‌شود.
+- کیفیت هر نسخه با جستجوی دودویی تا سقف BYTE_BUDGETS پایین می‌آید (نه کمتر از MIN_QUALITY).
+- ابعاد و حجم فایل اصلی، رنگ غالب و BlurHash همان موقع محاسبه و روی ProductImage ذخیره می‌شوند
+  تا قالب‌ها و فید JSON بدون خواندن فایل، ابعاد و placeholder داشته باشند.
+scripts/benchmark_images.py این مسیر را با compress_image قدیمی مقایسه می‌کند.
+"""
+import io
+import os
+import time
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import ExifTags, Image, ImageOps, UnidentifiedImageError
+
+from . import blurhash
+
+try:
+    from PIL import ImageCms
+    SRGB_PROFILE = ImageCms.createProfile('sRGB')
+except ImportError:
+    # Pillow بدون littlecms: پروفایل رنگ فقط حذف می‌شود
+    ImageCms = None
+
+VARIANTS_DIR = 'product_images/variants'
+# از بزرگ به کوچک: هر نسخه از نسخه قبلی کوچک می‌شود
+VARIANT_NAMES = ('full', 'card', 'thumb')
+EXTENSIONS = {'WEBP': 'webp', 'JPEG': 'jpg'}
+# جهت‌های EXIF که عرض و ارتفاع را جابه‌جا می‌کنند
+TRANSPOSED_ORIENTATIONS = (5, 6, 7, 8)
+# اندازه تصویر ورودی BlurHash و رنگ غالب
+PLACEHOLDER_SIZE = (32, 32)
+DOMINANT_COLORS = 5
+
+
+def image_settings():
+    return getattr(settings, 'IMAGE_PROCESSING', {})
+
+
+def render_config():
+    """تنظیمات لازم برای render (قابل pickle برای پروسه‌های pool)"""
+    return {
+        'sizes': variant_sizes(),
+        'formats': {fmt: save_options(fmt) for fmt in variant_formats()},
+        'budgets': byte_budgets(),
+        'min_quality': image_settings().get('MIN_QUALITY', 40),
+    }
+
+
+def variant_sizes():
+    config = image_settings()
+    return {
+        'full': tuple(config.get('MAX_SIZE', (800, 800))),
+        'card': tuple(config.get('CARD_SIZE', (600, 600))),
+        'thumb': tuple(config.get('THUMBNAIL_SIZE', (300, 300))),
+    }
+
+
+def byte_budgets():
+    """سقف حجم هر نسخه (بایت) برای هر قالب"""
+    budgets = image_settings().get('BYTE_BUDGETS', {})
+    return {name: budgets.get(name) for name in VARIANT_NAMES}
+
+
+def variant_formats():
+    """قالب‌های مشتق (از FORMATS فقط WebP و JPEG؛ JPEG همیشه به عنوان fallback)"""
+    formats = [fmt for fmt in image_settings().get('FORMATS', ()) if fmt in EXTENSIONS]
+    if 'JPEG' not in formats:
+        formats.append('JPEG')
+    return formats
+
+
+def format_key(fmt):
+    return fmt.lower()
+
+
+def save_options(fmt):
+    config = image_settings()
+    if fmt == 'WEBP':
+        return {'quality': config.get('WEBP_QUALITY', 80), 'method': 4}
+    return {'quality': config.get('QUALITY', 75), 'optimize': True, 'progressive': True}
+
+
+def to_rgb(img):
+    """حذف شفافیت روی زمینه سفید (JPEG آلفا ندارد)"""
+    if img.mode in ('RGBA', 'LA', 'P'):
+        img = img.convert('RGBA')
+        background = Image.new('RGB', img.size, (255, 255, 255))
+        background.paste(img, mask=img.getchannel('A'))
+        return background
+    if img.mode != 'RGB':
+        return img.convert('RGB')
+    return img
+
+
+def to_srgb(img):
+    """تبدیل رنگ‌ها به sRGB قبل از حذف پروفایل ICC (عکس‌های Display P3 یا CMYK)"""
+    icc = img.info.get('icc_profile')
+    if not icc or ImageCms is None or img.mode not in ('RGB', 'CMYK'):
+        return img
+    try:
+        return ImageCms.profileToProfile(img, ImageCms.ImageCmsProfile(io.BytesIO(icc)), SRGB_PROFILE, outputMode='RGB')
+    except (ImageCms.PyCMSError, OSError):
+        return img
+
+
+def is_transposed(img):
+    return img.getexif().get(ExifTags.Base.Orientation) in TRANSPOSED_ORIENTATIONS
+
+
+def oriented_size(img):
+    """ابعاد فایل اصلی بعد از چرخش EXIF (از header، بدون decode)"""
+    return (img.height, img.width) if is_transposed(img) else img.size
+
+
+def draft_size(img, box):
+    """کوچک‌ترین اندازه decode که بعد از چرخش EXIF هنوز box را پر می‌کند"""
+    if is_transposed(img):
+        box = (box[1], box[0])
+    scale = min(box[0] / img.width, box[1] / img.height, 1)
+    return max(1, int(img.width * scale)), max(1, int(img.height * scale))
+
+
+def encode(img, fmt, options):
+    output = io.BytesIO()
+    # بدون exif و icc_profile: metadata در خروجی نوشته نمی‌شود
+    img.save(output, format=fmt, **options)
+    return output.getvalue()
+
+
+def encode_within(img, fmt, options, budget, min_quality):
+    """
+    بالاترین کیفیت (تا کیفیت تنظیم شده) که حجمش از budget بیشتر نشود؛ جستجوی دودویی،
+    معمولا 3 تا 5 بار encode. اگر حتی min_quality جا نشود، خروجی min_quality.
+    """
+    data = encode(img, fmt, options)
+    if not budget or len(data) <= budget:
+        return data
+    low, high = min_quality, options['quality'] - 1
+    best = None
+    while low <= high:
+        quality = (low + high) // 2
+        data = encode(img, fmt, {**options, 'quality': quality})
+        if len(data) <= budget:
+            best = data
+            low = quality + 1
+        else:
+            high = quality - 1
+    if best is None:
+        best = encode(img, fmt, {**options, 'quality': min_quality})
+    return best
+
+
+def open_for_variants(original, box):
+    """decode با draft، چرخش EXIF، sRGB و RGB؛ خروجی بدون metadata"""
+    if original.format == 'JPEG':
+        original.draft('RGB', draft_size(original, box))
+    img = ImageOps.exif_transpose(original)
+    img = to_rgb(to_srgb(img))
+    img.info = {}
+    return img
+
+
+def dominant_color(img):
+    """رنگ پرتکرار بعد از کاهش به چند رنگ (median cut)، به شکل #rrggbb"""
+    quantized = img.quantize(colors=DOMINANT_COLORS)
+    _count, index = max(quantized.getcolors())
+    r, g, b = quantized.getpalette()[index * 3:index * 3 + 3]
+    return f'#{r:02x}{g:02x}{b:02x}'
+
+
+def placeholder_data(img):
+    """رنگ غالب و BlurHash از یک تصویر RGB (معمولا نسخه thumb)"""
+    small = img.copy()
+    small.thumbnail(PLACEHOLDER_SIZE, Image.Resampling.BILINEAR)
+    return {'dominant_color': dominant_color(small), 'blurhash': blurhash.encode(small)}
+
+
+def read_metadata(source):
+    """
+    فقط ابعاد، رنگ غالب و BlurHash (backfill عکس‌هایی که نسخه‌هایشان از قبل ساخته شده)؛
+    JPEG با draft در کوچک‌ترین مقیاس decode می‌شود.
+    """
+    with Image.open(source) as original:
+        width, height = oriented_size(original)
+        img = open_for_variants(original, PLACEHOLDER_SIZE)
+        return {'width': width, 'height': height, **placeholder_data(img)}
+
+
+def render_variants(source, config):
+    """
+    ساخت همه نسخه‌ها از یک فایل باز؛ خروجی: ({نام: (عرض، ارتفاع، {قالب: bytes})}، metadata)
+    """
+    with Image.open(source) as original:
+        width, height = oriented_size(original)
+        img = open_for_variants(original, config['sizes'][VARIANT_NAMES[0]])
+        rendered = {}
+        for name in VARIANT_NAMES:
+            size = config['sizes'][name]
+            if img.width > size[0] or img.height > size[1]:
+                img = img.copy()
+                img.thumbnail(size, Image.Resampling.LANCZOS)
+            rendered[name] = (
+                img.width, img.height,
+                {
+                    fmt: encode_within(img, fmt, options, config['budgets'].get(name), config['min_quality'])
+                    for fmt, options in config['formats'].items()
+                },
+            )
+        # img اینجا کوچک‌ترین نسخه (thumb) است
+        meta = {'width': width, 'height': height, **placeholder_data(img)}
+    return rendered, meta
+
+
+def source_size(source):
+    return len(source) if isinstance(source, bytes) else os.path.getsize(source)
+
+
+def render_file(source, config):
+    """
+    ورودی pool: مسیر فایل روی دیسک یا bytes (storage بدون path).
+    خروجی {'variants': ...، 'meta': ...} یا None برای فایل ناموجود یا خراب.
+    """
+    try:
+        byte_size = source_size(source)
+        rendered, meta = render_variants(io.BytesIO(source) if isinstance(source, bytes) else source, config)
+    except (FileNotFoundError, UnidentifiedImageError, OSError) as e:
+        print(f"خطا در ساخت نسخه‌های عکس: {e}")
+        return None
+    return {'variants': rendered, 'meta': {**meta, 'byte_size': byte_size}}
+
+
+def render_timed(source, config):
+    """render_file به همراه زمان CPU مصرف شده در همان پروسه (throttle دستور generate_image_derivatives)"""
+    started = time.process_time()
+    result = render_file(source, config)
+    return result, time.process_time() - started
+
+
+def render_source(product_image):
+    """مسیر فایل اصلی برای پروسه‌های pool؛ اگر storage مسیر محلی ندارد، محتوای فایل"""
+    field = product_image.image
+    try:
+        return field.storage.path(field.name)
+    except NotImplementedError:
+        with field.storage.open(field.name, 'rb') as source:
+            return source.read()
+
+
+def variant_name(product_image, name, fmt):
+    return f'{VARIANTS_DIR}/{product_image.pk}_{name}.{EXTENSIONS[fmt]}'
+
+
+def generate_derivatives(product_image):
+    """
+    ساخت و ذخیره نسخه‌های یک ProductImage در همین پروسه (دستورات مدیریتی و حالت بدون pool).
+    برای فایل ناموجود یا خراب {} برمی‌گرداند و صفحات placeholder نشان می‌دهند.
+    """
+    try:
+        source = render_source(product_image)
+    except OSError as e:
+        print(f"خطا در خواندن عکس {product_image.pk}: {e}")
+        mark_failed(product_image)
+        return {}
+    result = render_file(source, render_config())
+    if result is None:
+        mark_failed(product_image)
+        return {}
+    return store_variants(product_image, result)
+
+
+def mark_failed(product_image):
+    """پایان پردازش بدون نسخه: صفحات به فایل اصلی برمی‌گردند"""
+    if product_image.is_processing:
+        type(product_image).objects.filter(pk=product_image.pk).update(is_processing=False)
+        product_image.is_processing = False
+        from .cache_manager import CacheManager
+        CacheManager.invalidate_product_cache(product_image.product_id)
+
+
+def store_variants(product_image, result):
+    """ذخیره خروجی render_file در storage و ثبت نسخه‌ها و metadata روی مدل"""
+    storage = product_image.image.storage
+    variants = {}
+    for name, (width, height, encoded) in result['variants'].items():
+        entry = {'width': width, 'height': height}
+        for fmt, data in encoded.items():
+            path = variant_name(product_image, name, fmt)
+            if storage.exists(path):
+                storage.delete(path)
+            entry[format_key(fmt)] = storage.save(path, ContentFile(data))
+        variants[name] = entry
+
+    fields = {'variants': variants, 'is_processing': False, **result['meta']}
+    for field, value in fields.items():
+        setattr(product_image, field, value)
+    if not type(product_image).objects.filter(pk=product_image.pk).update(**fields):
+        # عکس در حین پردازش حذف شده است
+        delete_derivatives(product_image)
+        return {}
+    # update از signals عبور نمی‌کند؛ مدل کش شده صفحه محصول آدرس‌های جدید را لازم دارد
+    from .cache_manager import CacheManager
+    CacheManager.invalidate_product_cache(product_image.product_id)
+    return variants
+
+
+def variant_paths(variants):
+    """مسیر همه فایل‌های مشتق ثبت شده"""
+    return [
+        path for entry in (variants or {}).values()
+        for key, path in entry.items() if key not in ('width', 'height')
+    ]
+
+
+def delete_derivatives(product_image):
+    storage = product_image.image.storage
+    for path in variant_paths(product_image.variants):
+        try:
+            storage.delete(path)
+        except OSError as e:
+            print(f"خطا در حذف نسخه عکس {path}: {e}")
+
+
+def variant_url(variants, name, fmt='jpeg'):
+    """آدرس یک نسخه یا None اگر ساخته نشده"""
+    path = (variants or {}).get(name, {}).get(fmt)
+    if not path:
+        return None
+    return default_storage.url(path)
+
+
+def variant_srcset(variants, fmt='jpeg', names=('thumb', 'card')):
+    """مقدار srcset با عرض واقعی هر نسخه (کوچک به بزرگ)"""
+    parts = []
+    for name in names:
+        entry = (variants or {}).get(name)
+        if entry and entry.get(fmt):
+            parts.append(f"{variant_url(variants, name, fmt)} {entry['width']}w")
+    return ', '.join(parts)
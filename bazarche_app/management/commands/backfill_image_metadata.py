@@ -0,0 +1,69 @@
+import time
+
+from django.core.management.base import BaseCommand
+from PIL import UnidentifiedImageError
+from bazarche_app.cache_manager import CacheManager
+from bazarche_app.images import read_metadata, render_source, source_size
+from bazarche_app.models import ProductImage
+
+METADATA_FIELDS = ['width', 'height', 'byte_size', 'dominant_color', 'blurhash']
+
+
+class Command(BaseCommand):
+    help = 'محاسبه ابعاد، حجم، رنگ غالب و BlurHash عکس‌های موجود (دسته‌ای و قابل ادامه)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=200,
+            help='تعداد عکس‌های هر دسته (یک bulk_update برای هر دسته)',
+        )
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='محاسبه دوباره برای همه عکس‌ها (پیش‌فرض: فقط عکس‌های بدون ابعاد)',
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        batch_size = options['batch_size']
+        images = ProductImage.objects.order_by('pk')
+        if not options['all']:
+            images = images.filter(width__isnull=True)
+
+        last_pk = 0
+        done = failed = 0
+        while True:
+            batch = list(images.filter(pk__gt=last_pk).only('pk', 'image', 'product_id')[:batch_size])
+            if not batch:
+                break
+            last_pk = batch[-1].pk
+
+            updated = []
+            for product_image in batch:
+                try:
+                    source = render_source(product_image)
+                    meta = read_metadata(source)
+                except (FileNotFoundError, UnidentifiedImageError, OSError) as e:
+                    # عکس خراب یا ناموجود؛ در اجرای بعدی دوباره امتحان می‌شود
+                    self.stdout.write(self.style.WARNING(f'عکس {product_image.pk}: {e}'))
+                    failed += 1
+                    continue
+                meta['byte_size'] = source_size(source)
+                for field, value in meta.items():
+                    setattr(product_image, field, value)
+                updated.append(product_image)
+
+            ProductImage.objects.bulk_update(updated, METADATA_FIELDS)
+            done += len(updated)
+            self.stdout.write(f'{done} عکس (تا شناسه {last_pk})')
+
+        if done:
+            # bulk_update از signals عبور نمی‌کند
+            CacheManager.clear_product_details_cache()
+            CacheManager.clear_products_cache()
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'metadata {done} عکس در {elapsed:.1f} ثانیه ثبت شد؛ {failed} عکس قابل خواندن نبود.'
+        ))
@@ -1,6 +1,7 @@
 from django.core.management.base import BaseCommand
 from django.conf import settings
 from bazarche_app.models import ProductImage, UserProfile
+from bazarche_app.images import variant_paths
 import os
 import shutil
 
@@ -40,6 +41,8 @@ class Command(BaseCommand):
         for product_image in ProductImage.objects.all():
             if product_image.image:
                 db_images.add(product_image.image.name)
+            # نسخه‌های مشتق (product_images/variants) هم صاحب دارند
+            db_images.update(variant_paths(product_image.variants))
         
         self.stdout.write(f'تعداد عکس‌های موجود در دیتابیس: {len(db_images)}')
         
@@ -0,0 +1,180 @@
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from itertools import islice
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from bazarche_app.image_pool import MAX_TASKS_PER_CHILD, pool_size
+from bazarche_app.images import mark_failed, render_config, render_source, render_timed, source_size, store_variants
+from bazarche_app.models import ProductImage
+
+# اولویت پایین پروسه‌های پردازش نسبت به پروسه‌های وب
+WORKER_NICENESS = 10
+
+
+class Command(BaseCommand):
+    help = (
+        'ساخت نسخه‌های thumb/card/full (WebP و JPEG) برای عکس‌های محصولات؛ '
+        'موازی، با سقف مصرف CPU و قابل ادامه بعد از توقف'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='ساخت دوباره نسخه‌های همه عکس‌ها (پیش‌فرض: فقط عکس‌های بدون نسخه)',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=pool_size(),
+            help='تعداد پروسه‌های پردازش (0: در همین پروسه)',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=100,
+            help='تعداد عکس‌های هر دسته؛ checkpoint بعد از هر دسته ذخیره می‌شود',
+        )
+        parser.add_argument(
+            '--cpu-share',
+            type=float,
+            default=0.5,
+            help='سقف سهم از کل CPU سرور (0 تا 1)؛ بین دسته‌ها مکث می‌کند',
+        )
+        parser.add_argument(
+            '--checkpoint',
+            default=str(settings.BASE_DIR / 'image_derivatives.checkpoint.json'),
+            help='فایل ذخیره آخرین شناسه پردازش شده',
+        )
+        parser.add_argument(
+            '--restart',
+            action='store_true',
+            help='نادیده گرفتن checkpoint و شروع از ابتدا',
+        )
+
+    def handle(self, *args, **options):
+        if not 0 < options['cpu_share'] <= 1:
+            raise CommandError('--cpu-share باید بین 0 و 1 باشد.')
+        checkpoint = options['checkpoint']
+        state = self.load_checkpoint(checkpoint, options)
+        if state['last_pk']:
+            self.stdout.write(f'ادامه از شناسه {state["last_pk"]} (checkpoint: {checkpoint})')
+
+        images = ProductImage.objects.filter(pk__gt=state['last_pk']).order_by('pk')
+        if not options['all']:
+            images = images.filter(variants={})
+
+        config = render_config()
+        cpu_budget = options['cpu_share'] * (os.cpu_count() or 1)
+        pool = None
+        if options['workers'] > 0:
+            pool = ProcessPoolExecutor(
+                max_workers=options['workers'],
+                mp_context=multiprocessing.get_context('spawn'),
+                max_tasks_per_child=MAX_TASKS_PER_CHILD,
+                initializer=os.nice,
+                initargs=(WORKER_NICENESS,),
+            )
+
+        started = time.monotonic()
+        total_bytes = total_cpu = paused = 0
+        processed = 0
+        rows = images.iterator(chunk_size=options['chunk_size'])
+        try:
+            while chunk := list(islice(rows, options['chunk_size'])):
+                chunk_started = time.monotonic()
+                try:
+                    done, failed, source_bytes, cpu = self.process_chunk(chunk, pool, config)
+                except BrokenProcessPool as e:
+                    raise CommandError(
+                        f'پروسه پردازش از کار افتاد ({e})؛ اجرای دوباره از شناسه {state["last_pk"]} ادامه می‌دهد.'
+                    )
+                state['last_pk'] = chunk[-1].pk
+                state['done'] += done
+                state['failed'] += failed
+                self.save_checkpoint(checkpoint, state)
+
+                wall = max(time.monotonic() - chunk_started, 1e-3)
+                processed += len(chunk)
+                total_bytes += source_bytes
+                total_cpu += cpu
+                self.stdout.write(
+                    f'{state["done"] + state["failed"]} عکس (تا شناسه {state["last_pk"]}): '
+                    f'{len(chunk) / wall:.1f} عکس/ثانیه، {source_bytes / wall / 1024 ** 2:.1f} MB/s، '
+                    f'CPU {cpu / wall:.1f} هسته'
+                )
+                # مصرف CPU (با احتساب مکث) از cpu_share هسته‌های سرور بیشتر نشود
+                pause = cpu / cpu_budget - wall
+                if pause > 0:
+                    time.sleep(pause)
+                    paused += pause
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+
+        if os.path.exists(checkpoint):
+            os.remove(checkpoint)
+        elapsed = time.monotonic() - started
+        rate = processed / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'نسخه‌های {state["done"]} عکس ساخته شد؛ {state["failed"]} عکس قابل پردازش نبود. '
+            f'این اجرا: {processed} عکس در {elapsed:.1f} ثانیه ({rate:.1f} عکس/ثانیه، '
+            f'{total_bytes / 1024 ** 2:.1f} MB، {total_cpu:.1f} ثانیه CPU، {paused:.1f} ثانیه مکث)'
+        ))
+
+    def process_chunk(self, chunk, pool, config):
+        """ارسال یک دسته به pool و ذخیره نتایج در همین پروسه؛ خروجی: (موفق، ناموفق، حجم ورودی، ثانیه CPU)"""
+        done = failed = source_bytes = 0
+        cpu = 0.0
+        jobs = []
+        for product_image in chunk:
+            try:
+                source = render_source(product_image)
+                source_bytes += source_size(source)
+            except OSError as e:
+                self.stdout.write(self.style.WARNING(f'عکس {product_image.pk}: {e}'))
+                mark_failed(product_image)
+                failed += 1
+                continue
+            if pool is None:
+                jobs.append((product_image, render_timed(source, config)))
+            else:
+                jobs.append((product_image, pool.submit(render_timed, source, config)))
+
+        for product_image, job in jobs:
+            result, seconds = job if pool is None else job.result()
+            cpu += seconds
+            if result is not None and store_variants(product_image, result):
+                done += 1
+            else:
+                mark_failed(product_image)
+                failed += 1
+        return done, failed, source_bytes, cpu
+
+    def load_checkpoint(self, path, options):
+        fresh = {'last_pk': 0, 'all': options['all'], 'done': 0, 'failed': 0}
+        if options['restart'] or not os.path.exists(path):
+            return fresh
+        try:
+            with open(path) as f:
+                state = json.load(f)
+        except (OSError, ValueError) as e:
+            self.stdout.write(self.style.WARNING(f'checkpoint قابل خواندن نیست ({e})؛ شروع از ابتدا'))
+            return fresh
+        if state.get('all') != options['all']:
+            # checkpoint اجرای --all برای اجرای عادی معتبر نیست (و برعکس)
+            self.stdout.write(self.style.WARNING('checkpoint مربوط به اجرای دیگری است؛ شروع از ابتدا'))
+            return fresh
+        return {**fresh, **state}
+
+    def save_checkpoint(self, path, state):
+        # نوشتن در فایل موقت و جایگزینی: توقف وسط نوشتن checkpoint را خراب نمی‌کند
+        temp_path = f'{path}.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(state, f)
+        os.replace(temp_path, path)
@@ -0,0 +1,93 @@
+import re
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from bazarche_app.cache_manager import CacheManager
+from bazarche_app.models import Product, ProductComment, UserFeedback
+
+# موضوع نظرات قدیمی: «نظر محصول {id} - {نام محصول}»
+LEGACY_PREFIX = 'نظر محصول '
+LEGACY_SUBJECT = re.compile(r'^نظر محصول (\d+)(?!\d)')
+
+
+class Command(BaseCommand):
+    help = 'انتقال نظرات محصولات از UserFeedback به ProductComment (دسته‌ای و قابل ادامه)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='تعداد ردیف‌های هر دسته',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='فقط شمارش ردیف‌های قابل انتقال',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        dry_run = options['dry_run']
+        legacy = UserFeedback.objects.filter(subject__startswith=LEGACY_PREFIX).order_by('pk')
+
+        last_pk = 0
+        moved = skipped = 0
+        product_ids = set()
+        while True:
+            rows = list(
+                legacy.filter(pk__gt=last_pk)
+                .values('pk', 'user_id', 'email', 'subject', 'message', 'timestamp')[:batch_size]
+            )
+            if not rows:
+                break
+            last_pk = rows[-1]['pk']
+
+            parsed = []
+            for row in rows:
+                match = LEGACY_SUBJECT.match(row['subject'])
+                if match:
+                    parsed.append((int(match.group(1)), row))
+            existing = set(
+                Product.objects.filter(pk__in={product_id for product_id, _ in parsed}).values_list('pk', flat=True)
+            )
+            parsed = [(product_id, row) for product_id, row in parsed if product_id in existing]
+            skipped += len(rows) - len(parsed)
+
+            if not dry_run and parsed:
+                # ردیف‌های منتقل شده در همان تراکنش حذف می‌شوند؛ اجرای دوباره از ادامه کار شروع می‌کند
+                with transaction.atomic():
+                    ProductComment.objects.bulk_create([
+                        ProductComment(
+                            product_id=product_id, user_id=row['user_id'], email=row['email'],
+                            message=row['message'], created_at=row['timestamp'],
+                        )
+                        for product_id, row in parsed
+                    ])
+                    UserFeedback.objects.filter(pk__in=[row['pk'] for _, row in parsed]).delete()
+            moved += len(parsed)
+            product_ids.update(product_id for product_id, _ in parsed)
+            self.stdout.write(f'{moved} نظر (تا شناسه {last_pk})')
+
+        if dry_run:
+            self.stdout.write(self.style.WARNING(f'{moved} نظر قابل انتقال، {skipped} ردیف بدون محصول (تغییری داده نشد).'))
+            return
+
+        if product_ids:
+            # bulk_create از signals عبور نمی‌کند؛ شمارنده محصولات دوباره محاسبه می‌شود
+            counts = (
+                ProductComment.objects.filter(product=OuterRef('pk')).order_by()
+                .values('product').annotate(total=Count('pk')).values('total')
+            )
+            product_ids = sorted(product_ids)
+            for i in range(0, len(product_ids), batch_size):
+                Product.objects.filter(pk__in=product_ids[i:i + batch_size]).update(
+                    comment_count=Coalesce(Subquery(counts), Value(0))
+                )
+            CacheManager.clear_product_details_cache()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{moved} نظر برای {len(product_ids)} محصول منتقل شد؛ {skipped} ردیف بدون محصول باقی ماند.'
+        ))
@@ -0,0 +1,43 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from bazarche_app.similarity import process_queue
+
+
+class Command(BaseCommand):
+    help = (
+        'اعمال صف به‌روزرسانی محصولات مشابه (شناسه‌هایی که signals بعد از ذخیره/حذف محصول ثبت می‌کنند)؛ '
+        'corpus در حافظه همین پروسه می‌ماند، پس --loop فقط یک بار (و بعد از هر ساخت کامل) آن را می‌سازد'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='اجرای دائمی (پروسه worker)؛ بدون آن یک بار صف را خالی می‌کند',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=5,
+            help='فاصله بررسی صف در حالت --loop (ثانیه)',
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            # هر اجرای process_queue حداکثر QUEUE_BATCH ثبت را می‌خواند؛ تا خالی شدن صف
+            while True:
+                started = time.monotonic()
+                affected = process_queue()
+                if affected is None:
+                    # صف دست نخورده می‌ماند تا ساخت کامل
+                    self.stdout.write(self.style.WARNING('ساخت کامل هنوز انجام نشده؛ rebuild_similar_products را اجرا کنید.'))
+                if not affected:
+                    break
+                elapsed = time.monotonic() - started
+                self.stdout.write(f'همسایه‌های {len(affected)} محصول در {elapsed:.2f} ثانیه به‌روزرسانی شد.')
+            if not options['loop']:
+                return
+            close_old_connections()
+            time.sleep(options['interval'])
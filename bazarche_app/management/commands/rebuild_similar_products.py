@@ -0,0 +1,54 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from bazarche_app.cache_manager import CacheManager
+from bazarche_app.similarity import rebuild_all, update_products, BLOCK_SIZE
+
+
+class Command(BaseCommand):
+    help = 'ساخت جدول محصولات مشابه (TF-IDF روی نام، توضیحات و برچسب‌ها)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--processes',
+            type=int,
+            default=None,
+            help='تعداد پروسه‌های محاسبه (پیش‌فرض: تعداد هسته‌ها، 1: بدون پروسه جدا)',
+        )
+        parser.add_argument(
+            '--block-size',
+            type=int,
+            default=BLOCK_SIZE,
+            help='تعداد محصولات هر بلوک کاری',
+        )
+        parser.add_argument(
+            '--product',
+            type=int,
+            action='append',
+            dest='products',
+            help='فقط به‌روزرسانی افزایشی همین محصولات (قابل تکرار)',
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+
+        if options['products']:
+            affected = update_products(options['products'])
+            if affected is None:
+                self.stdout.write(self.style.WARNING('ساخت کامل هنوز انجام نشده؛ دستور را بدون --product اجرا کنید.'))
+                return
+            for product_id in affected:
+                CacheManager.invalidate_product_cache(product_id)
+            self.stdout.write(self.style.SUCCESS(f'همسایه‌های {len(affected)} محصول به‌روزرسانی شد.'))
+            return
+
+        def progress(done, total):
+            self.stdout.write(f'{done}/{total}')
+
+        try:
+            total = rebuild_all(processes=options['processes'], block_size=options['block_size'], progress=progress)
+        except RuntimeError as e:
+            raise CommandError(str(e))
+        CacheManager.clear_product_details_cache()
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(f'همسایه‌های {total} محصول در {elapsed:.1f} ثانیه ساخته شد.'))
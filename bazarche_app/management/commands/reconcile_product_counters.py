@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from bazarche_app.counters import reconcile_counts
+
+
+class Command(BaseCommand):
+    help = 'اصلاح شمارنده‌های محصولات تایید شده (شهر، دسته‌بندی، برچسب) از روی جدول محصولات'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='فقط نمایش انحراف‌ها بدون اصلاح',
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        drift = reconcile_counts(dry_run=dry_run)
+
+        for dimension, object_id, current, correct in drift:
+            self.stdout.write(f'{dimension}:{object_id} {current} -> {correct}')
+
+        if not drift:
+            self.stdout.write(self.style.SUCCESS('همه شمارنده‌ها درست هستند.'))
+        elif dry_run:
+            self.stdout.write(self.style.WARNING(f'{len(drift)} شمارنده انحراف دارد (اصلاح نشد).'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'{len(drift)} شمارنده اصلاح شد.'))
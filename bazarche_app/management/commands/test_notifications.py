@@ -1,6 +1,7 @@
 from django.core.management.base import BaseCommand
 from django.contrib.auth.models import User
-from bazarche_app.models import UserFeedback, Product
+from bazarche_app.models import Notification, Product
+from bazarche_app.notifications import notify
 
 class Command(BaseCommand):
     help = 'Test notification system'
@@ -15,22 +16,18 @@ class Command(BaseCommand):
         self.stdout.write(f"Approved products: {products.count()}")
         
         # Check notifications
-        notifications = UserFeedback.objects.filter(subject__startswith="NOTIFICATION_")
+        notifications = Notification.objects.all()
         self.stdout.write(f"Total notifications: {notifications.count()}")
         
         # Check unread notifications
-        unread_notifications = UserFeedback.objects.filter(
-            subject__startswith="NOTIFICATION_"
-        ).exclude(
-            subject__contains="_READ_"
-        )
+        unread_notifications = Notification.objects.filter(is_read=False)
         self.stdout.write(f"Unread notifications: {unread_notifications.count()}")
         
         # Show recent notifications
-        recent_notifications = notifications.order_by('-timestamp')[:5]
+        recent_notifications = notifications.select_related('user').order_by('-created_at')[:5]
         self.stdout.write("\nRecent notifications:")
         for notif in recent_notifications:
-            self.stdout.write(f"- {notif.user.username}: {notif.subject} - {notif.message[:50]}...")
+            self.stdout.write(f"- {notif.user.username}: {notif.kind} - {notif.message[:50]}...")
         
         # Test creating a notification
         if users.exists() and products.exists():
@@ -38,12 +35,7 @@ class Command(BaseCommand):
             product = products.first()
             
             # Create test notification
-            test_notification = UserFeedback.objects.create(
-                email=user.email or user.username,
-                subject="NOTIFICATION_TEST_123",
-                message=f"تست اعلان برای محصول {product.name_fa}",
-                user=user
-            )
+            test_notification = notify(user, 'system', f"تست اعلان برای محصول {product.name_fa}")
             
             self.stdout.write(f"\nCreated test notification: {test_notification.id}")
             self.stdout.write("Test completed successfully!")
@@ -0,0 +1,19 @@
+# Generated by Django 5.0.2 on 2026-10-18 14:17
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bazarche_app', '0019_adminalert'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_approved', True)), fields=['-is_featured', '-is_suggested', '-is_discounted', '-created_at', '-id'], name='product_feed_order_idx'),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.0.2 on 2026-10-18 14:19
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Case, When, Value
+
+
+def populate_listing_rank(apps, schema_editor):
+    Product = apps.get_model('bazarche_app', 'Product')
+    Product.objects.update(
+        listing_rank=(
+            Case(When(is_featured=True, then=Value(4)), default=Value(0))
+            + Case(When(is_suggested=True, then=Value(2)), default=Value(0))
+            + Case(When(is_discounted=True, then=Value(1)), default=Value(0))
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bazarche_app', '0020_product_feed_order_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='product',
+            name='product_feed_order_idx',
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='listing_rank',
+            field=models.PositiveSmallIntegerField(default=0, editable=False, verbose_name='رتبه نمایش'),
+        ),
+        migrations.RunPython(populate_listing_rank, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_approved', True)), fields=['-listing_rank', '-created_at', '-id'], name='product_rank_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_approved', True)), fields=['city', '-listing_rank', '-created_at', '-id'], name='product_city_rank_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_approved', True)), fields=['category', '-listing_rank', '-created_at', '-id'], name='product_category_rank_idx'),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.0.2 on 2026-10-18 14:21
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+SEARCH_VECTOR_SQL = """
+    UPDATE bazarche_app_product AS p SET search_vector =
+        setweight(to_tsvector('simple', coalesce(p.name_fa, '') || ' ' || coalesce(p.name_ps, '') || ' ' || coalesce(p.name_en, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(p.description_fa, '') || ' ' || coalesce(p.description_ps, '') || ' ' || coalesce(p.description_en, '')), 'B') ||
+        setweight(to_tsvector('simple', coalesce((
+            SELECT string_agg(coalesce(t.name_fa, '') || ' ' || coalesce(t.name_ps, '') || ' ' || coalesce(t.name_en, ''), ' ')
+            FROM bazarche_app_tag AS t
+            INNER JOIN bazarche_app_product_tags AS pt ON pt.tag_id = t.id
+            WHERE pt.product_id = p.id
+        ), '')), 'C')
+"""
+
+
+def create_search_index(apps, schema_editor):
+    # tsvector و GIN فقط در PostgreSQL؛ روی SQLite جستجو به icontains برمی‌گردد
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS product_search_vector_gin ON bazarche_app_product USING gin (search_vector)'
+    )
+    schema_editor.execute(SEARCH_VECTOR_SQL)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS product_search_vector_gin')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bazarche_app', '0021_product_listing_rank'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
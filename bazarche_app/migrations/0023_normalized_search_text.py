@@ -0,0 +1,86 @@
+# Generated by Django 5.0.2 on 2026-10-18 14:23
+
+from django.db import migrations, models
+
+from bazarche_app.text_normalization import normalize_join
+
+# (مدل، ستون مقصد، ستون‌های مبدا)
+NORMALIZED_COLUMNS = [
+    ('Product', 'normalized_name', ('name_fa', 'name_ps', 'name_en')),
+    ('Product', 'normalized_description', ('description_fa', 'description_ps', 'description_en')),
+    ('Tag', 'normalized_name', ('name_fa', 'name_ps', 'name_en')),
+    ('JobAd', 'normalized_text', ('title', 'description')),
+    ('Request', 'normalized_text', ('request_text', 'contact')),
+    ('UserFeedback', 'normalized_text', ('email', 'subject', 'message')),
+]
+
+SEARCH_VECTOR_SQL = """
+    UPDATE bazarche_app_product AS p SET search_vector =
+        setweight(to_tsvector('simple', p.normalized_name), 'A') ||
+        setweight(to_tsvector('simple', p.normalized_description), 'B') ||
+        setweight(to_tsvector('simple', coalesce((
+            SELECT string_agg(t.normalized_name, ' ')
+            FROM bazarche_app_tag AS t
+            INNER JOIN bazarche_app_product_tags AS pt ON pt.tag_id = t.id
+            WHERE pt.product_id = p.id
+        ), '')), 'C')
+"""
+
+
+def populate_normalized_columns(apps, schema_editor):
+    for model_name, target, sources in NORMALIZED_COLUMNS:
+        model = apps.get_model('bazarche_app', model_name)
+        batch = []
+        for obj in model.objects.only('pk', *sources).order_by('pk').iterator(chunk_size=1000):
+            setattr(obj, target, normalize_join(*(getattr(obj, field) for field in sources)))
+            batch.append(obj)
+            if len(batch) >= 1000:
+                model.objects.bulk_update(batch, [target])
+                batch = []
+        if batch:
+            model.objects.bulk_update(batch, [target])
+
+    # بردار جستجو از این به بعد روی متن یکسان‌سازی شده ساخته می‌شود
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(SEARCH_VECTOR_SQL)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bazarche_app', '0022_product_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='jobad',
+            name='normalized_text',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='normalized_description',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='normalized_name',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.AddField(
+            model_name='request',
+            name='normalized_text',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.AddField(
+            model_name='tag',
+            name='normalized_name',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.AddField(
+            model_name='userfeedback',
+            name='normalized_text',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.RunPython(populate_normalized_columns, migrations.RunPython.noop),
+    ]
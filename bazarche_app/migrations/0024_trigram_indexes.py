@@ -0,0 +1,36 @@
+# Generated by Django 5.0.2 on 2026-10-18 15:02
+
+from django.db import migrations
+
+
+def create_trigram_indexes(apps, schema_editor):
+    # pg_trgm فقط در PostgreSQL؛ روی SQLite جستجوی تقریبی غیرفعال است
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS product_normalized_name_trgm '
+        'ON bazarche_app_product USING gin (normalized_name gin_trgm_ops)'
+    )
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS tag_normalized_name_trgm '
+        'ON bazarche_app_tag USING gin (normalized_name gin_trgm_ops)'
+    )
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS product_normalized_name_trgm')
+    schema_editor.execute('DROP INDEX IF EXISTS tag_normalized_name_trgm')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bazarche_app', '0023_normalized_search_text'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
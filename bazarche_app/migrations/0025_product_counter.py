@@ -0,0 +1,42 @@
+# Generated by Django 5.0.2 on 2026-10-18 14:30
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def populate_counters(apps, schema_editor):
+    Product = apps.get_model('bazarche_app', 'Product')
+    ProductCounter = apps.get_model('bazarche_app', 'ProductCounter')
+    approved = Product.objects.filter(is_approved=True).order_by()
+    counters = []
+    for dimension, field in (('city', 'city_id'), ('category', 'category_id'), ('tag', 'tags')):
+        rows = approved.filter(**{f'{field}__isnull': False}).values_list(field).annotate(count=Count('pk'))
+        counters.extend(
+            ProductCounter(dimension=dimension, object_id=object_id, count=count) for object_id, count in rows
+        )
+    ProductCounter.objects.bulk_create(counters, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bazarche_app', '0024_trigram_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dimension', models.CharField(choices=[('city', 'شهر'), ('category', 'دسته\u200cبندی'), ('tag', 'برچسب')], max_length=10, verbose_name='نوع')),
+                ('object_id', models.PositiveIntegerField(verbose_name='شناسه')),
+                ('count', models.IntegerField(default=0, verbose_name='تعداد محصولات تایید شده')),
+            ],
+            options={
+                'verbose_name': 'شمارنده محصولات',
+                'verbose_name_plural': 'شمارنده\u200cهای محصولات',
+                'unique_together': {('dimension', 'object_id')},
+            },
+        ),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+    ]
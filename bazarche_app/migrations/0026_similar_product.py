@@ -0,0 +1,28 @@
+# Generated by Django 5.0.2 on 2026-10-18 14:35
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bazarche_app', '0025_product_counter'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SimilarProduct',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField()),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='similar_products', to='bazarche_app.product')),
+                ('similar', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='similar_to', to='bazarche_app.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['product', 'rank'], name='similar_product_rank_idx')],
+                'unique_together': {('product', 'similar')},
+            },
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.0.2 on 2026-10-18 14:38
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bazarche_app', '0026_similar_product'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='تعداد نظرات'),
+        ),
+        migrations.CreateModel(
+            name='ProductComment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('email', models.CharField(blank=True, max_length=254, verbose_name='ایمیل یا نام کاربری')),
+                ('message', models.TextField(verbose_name='نظر')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='تاریخ ایجاد')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='comments', to='bazarche_app.product', verbose_name='محصول')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL, verbose_name='کاربر')),
+            ],
+            options={
+                'verbose_name': 'نظر محصول',
+                'verbose_name_plural': 'نظرات محصولات',
+                'indexes': [models.Index(fields=['product', 'created_at'], name='product_comment_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,134 @@
+# Generated by Django 5.0.2 on 2026-10-18 14:39
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+def migrate_legacy_chats(apps, schema_editor):
+    """پیام‌های چت قدیمی (UserFeedback با موضوع CHAT_{product}_{sender}_{owner})"""
+    UserFeedback = apps.get_model('bazarche_app', 'UserFeedback')
+    Product = apps.get_model('bazarche_app', 'Product')
+    Conversation = apps.get_model('bazarche_app', 'Conversation')
+    Message = apps.get_model('bazarche_app', 'Message')
+
+    legacy = UserFeedback.objects.filter(subject__startswith='CHAT_').order_by('pk')
+    product_owners = dict(Product.objects.filter(user__isnull=False).values_list('pk', 'user_id'))
+
+    def parse(feedback):
+        """(محصول، فرستنده، فروشنده) یا None برای ردیف نامعتبر"""
+        try:
+            product_id, sender_id, _owner_id = (int(part) for part in feedback.subject.split('_')[1:4])
+        except ValueError:
+            return None
+        owner_id = product_owners.get(product_id)
+        if owner_id is None or feedback.user_id != sender_id:
+            return None
+        return product_id, sender_id, owner_id
+
+    # خریداران هر محصول؛ پاسخ فروشنده (CHAT_{product}_{owner}_{owner}) گیرنده نداشت و فقط
+    # وقتی محصول یک خریدار دارد گفتگوی آن مشخص است
+    product_buyers = {}
+    for feedback in legacy.only('subject', 'user_id').iterator(chunk_size=2000):
+        parsed = parse(feedback)
+        if parsed and parsed[1] != parsed[2]:
+            product_buyers.setdefault(parsed[0], set()).add(parsed[1])
+
+    conversations = {}
+    migrated = []
+    ambiguous = 0
+    for feedback in legacy.iterator(chunk_size=2000):
+        parsed = parse(feedback)
+        if parsed is None:
+            continue
+        product_id, sender_id, owner_id = parsed
+        if sender_id == owner_id:
+            buyers = product_buyers.get(product_id, ())
+            if len(buyers) != 1:
+                ambiguous += 1
+                continue
+            buyer_id = next(iter(buyers))
+        else:
+            buyer_id = sender_id
+        key = (product_id, buyer_id)
+        if key not in conversations:
+            conversations[key], _ = Conversation.objects.get_or_create(
+                product_id=product_id, buyer_id=buyer_id,
+                defaults={'seller_id': owner_id, 'created_at': feedback.timestamp},
+            )
+        conversation = conversations[key]
+        Message.objects.create(conversation=conversation, sender_id=sender_id, body=feedback.message, created_at=feedback.timestamp)
+        if feedback.timestamp > conversation.last_message_at:
+            conversation.last_message_at = feedback.timestamp
+        migrated.append(feedback.pk)
+
+    for conversation in conversations.values():
+        conversation.save(update_fields=['last_message_at'])
+    for i in range(0, len(migrated), 1000):
+        UserFeedback.objects.filter(pk__in=migrated[i:i + 1000]).delete()
+    if ambiguous:
+        # ردیف‌ها در UserFeedback می‌مانند (پنل ادمین) و حذف نمی‌شوند
+        print(
+            f'\n  {ambiguous} پاسخ فروشنده در چت‌های قدیمی به محصولی با چند خریدار بود و منتقل نشد؛ '
+            'در UserFeedback با موضوع CHAT_ باقی ماند.'
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bazarche_app', '0027_product_comment'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Conversation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='تاریخ ایجاد')),
+                ('last_message_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='آخرین پیام')),
+                ('buyer_unread', models.PositiveIntegerField(default=0, verbose_name='خوانده نشده خریدار')),
+                ('seller_unread', models.PositiveIntegerField(default=0, verbose_name='خوانده نشده فروشنده')),
+                ('buyer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='buyer_conversations', to=settings.AUTH_USER_MODEL, verbose_name='خریدار')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='conversations', to='bazarche_app.product', verbose_name='محصول')),
+                ('seller', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='seller_conversations', to=settings.AUTH_USER_MODEL, verbose_name='فروشنده')),
+            ],
+            options={
+                'verbose_name': 'گفتگو',
+                'verbose_name_plural': 'گفتگوها',
+            },
+        ),
+        migrations.CreateModel(
+            name='Message',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('body', models.TextField(verbose_name='پیام')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='تاریخ ارسال')),
+                ('conversation', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='messages', to='bazarche_app.conversation', verbose_name='گفتگو')),
+                ('sender', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='فرستنده')),
+            ],
+            options={
+                'verbose_name': 'پیام',
+                'verbose_name_plural': 'پیام\u200cها',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='conversation',
+            index=models.Index(fields=['buyer', '-last_message_at'], name='conversation_buyer_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='conversation',
+            index=models.Index(fields=['seller', '-last_message_at'], name='conversation_seller_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='conversation',
+            unique_together={('product', 'buyer')},
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['conversation', 'id'], name='chat_message_idx'),
+        ),
+        migrations.RunPython(migrate_legacy_chats, migrations.RunPython.noop),
+    ]
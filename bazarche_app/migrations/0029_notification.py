@@ -0,0 +1,64 @@
+# Generated by Django 5.0.2 on 2026-10-18 14:44
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+LEGACY_KINDS = (('COMMENT', 'comment'), ('CHAT', 'chat'), ('ADMIN', 'admin'))
+
+
+def migrate_legacy_notifications(apps, schema_editor):
+    """اعلان‌های قدیمی: UserFeedback با موضوع NOTIFICATION_{نوع}_... و پسوند _READ_ برای خوانده شده‌ها"""
+    UserFeedback = apps.get_model('bazarche_app', 'UserFeedback')
+    Notification = apps.get_model('bazarche_app', 'Notification')
+
+    legacy = UserFeedback.objects.filter(subject__startswith='NOTIFICATION_', user__isnull=False).order_by('pk')
+    last_pk = 0
+    while True:
+        batch = list(legacy.filter(pk__gt=last_pk)[:1000])
+        if not batch:
+            break
+        last_pk = batch[-1].pk
+        notifications = []
+        for feedback in batch:
+            parts = feedback.subject.split('_')
+            kind = next((kind for marker, kind in LEGACY_KINDS if parts[1:2] == [marker]), 'system')
+            link = ''
+            if kind in ('comment', 'chat') and len(parts) > 2 and parts[2].isdigit():
+                link = f'/app/products/{parts[2]}/' + ('#comments' if kind == 'comment' else '')
+            notifications.append(Notification(
+                user_id=feedback.user_id, kind=kind, message=feedback.message, link=link,
+                is_read='_READ_' in feedback.subject, created_at=feedback.timestamp,
+            ))
+        Notification.objects.bulk_create(notifications)
+        UserFeedback.objects.filter(pk__in=[feedback.pk for feedback in batch]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bazarche_app', '0028_chat'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Notification',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('comment', 'نظر'), ('chat', 'پیام'), ('admin', 'مدیریت'), ('system', 'سیستم')], default='system', max_length=10, verbose_name='نوع')),
+                ('message', models.TextField(verbose_name='پیام')),
+                ('link', models.CharField(blank=True, max_length=300, verbose_name='لینک')),
+                ('is_read', models.BooleanField(default=False, verbose_name='خوانده شده')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='تاریخ ایجاد')),
+                ('user', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='notifications', to=settings.AUTH_USER_MODEL, verbose_name='کاربر')),
+            ],
+            options={
+                'verbose_name': 'اعلان',
+                'verbose_name_plural': 'اعلان\u200cها',
+                'indexes': [models.Index(fields=['user', '-created_at'], name='notification_user_idx'), models.Index(condition=models.Q(('is_read', False)), fields=['user'], name='notification_unread_idx')],
+            },
+        ),
+        migrations.RunPython(migrate_legacy_notifications, migrations.RunPython.noop),
+    ]
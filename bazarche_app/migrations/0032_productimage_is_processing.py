@@ -0,0 +1,18 @@
+# Generated by Django 5.0.2 on 2026-10-18 14:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bazarche_app', '0031_productimage_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productimage',
+            name='is_processing',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.0.2 on 2026-10-18 20:10
+
+from django.db import migrations
+
+# جستجوهای پنل (jobs_list، requests_list، contact_messages) با normalized_text__contains
+# یعنی LIKE '%...%'؛ ایندکس trigram همین الگو را بدون پیمایش کامل جدول اجرا می‌کند
+TRIGRAM_INDEXES = [
+    ('jobad_normalized_text_trgm', 'bazarche_app_jobad'),
+    ('request_normalized_text_trgm', 'bazarche_app_request'),
+    ('userfeedback_normalized_text_trgm', 'bazarche_app_userfeedback'),
+]
+
+
+def create_trigram_indexes(apps, schema_editor):
+    # مثل migration 0024 فقط در PostgreSQL
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for name, table in TRIGRAM_INDEXES:
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {name} ON {table} USING gin (normalized_text gin_trgm_ops)'
+        )
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, _table in TRIGRAM_INDEXES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bazarche_app', '0033_productimage_metadata'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
@@ -1,10 +1,17 @@
+import json
+
 from django.db import models
+from django.db.models import Q, F, Case, When, Value, IntegerField, OuterRef, Subquery
+from django.db.models.functions import JSONObject
 from django.utils import timezone
 from django.contrib.auth.models import User
 from django.utils.translation import gettext_lazy as _
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.core.exceptions import ValidationError
 from django.contrib import admin
+from django.contrib.postgres.search import SearchVectorField
+from .text_normalization import normalize_join
+from .images import variant_url, variant_srcset
 
 class MainCategory(models.Model):
     name_fa = models.CharField(max_length=100, verbose_name=_('نام (فارسی)'))
@@ -78,10 +85,74 @@ class Tag(models.Model):
     name_fa = models.CharField(max_length=50)
     name_ps = models.CharField(max_length=50, blank=True, null=True)
     name_en = models.CharField(max_length=50, blank=True, null=True)
+    # نام یکسان‌سازی شده (هر سه زبان) برای جستجو
+    normalized_name = models.TextField(blank=True, default='', editable=False)
+
+    def save(self, *args, **kwargs):
+        self.normalized_name = normalize_join(self.name_fa, self.name_ps, self.name_en)
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return self.name_fa
 
+# وزن هر پرچم در رتبه نمایش: ویژه > پیشنهادی > تخفیف‌دار
+LISTING_RANK_WEIGHTS = (
+    ('is_featured', 4),
+    ('is_suggested', 2),
+    ('is_discounted', 1),
+)
+
+
+def listing_rank_expression(**overrides):
+    """
+    عبارت SQL رتبه نمایش؛ برای پرچم‌هایی که در overrides مقدار ثابت دارند
+    همان مقدار و برای بقیه مقدار ستون استفاده می‌شود.
+    """
+    expression = Value(0)
+    for field, weight in LISTING_RANK_WEIGHTS:
+        value = overrides.get(field, F(field))
+        if isinstance(value, bool):
+            term = Value(weight if value else 0)
+        else:
+            term = Case(When(**{field: True}, then=Value(weight)), default=Value(0))
+        expression = expression + term
+    return models.ExpressionWrapper(expression, output_field=IntegerField())
+
+
+def save_normalized_with(kwargs, sources, target='normalized_text'):
+    """save(update_fields=...) که یکی از ستون‌های مبدا را دارد، ستون یکسان‌سازی شده را هم ذخیره کند"""
+    update_fields = kwargs.get('update_fields')
+    if update_fields is not None and set(update_fields) & set(sources):
+        kwargs['update_fields'] = set(update_fields) | {target}
+
+
+class ProductQuerySet(models.QuerySet):
+    def update(self, **kwargs):
+        # به‌روزرسانی گروهی پرچم‌ها باید listing_rank را هم در همان UPDATE تنظیم کند
+        if any(field in kwargs for field, _weight in LISTING_RANK_WEIGHTS):
+            kwargs['listing_rank'] = listing_rank_expression(**kwargs)
+        return super().update(**kwargs)
+
+    def with_primary_image(self):
+        """
+        افزودن مسیر عکس اصلی (اولین عکس) به هر محصول در همان کوئری لیست،
+        به جای product.images.first برای هر کارت (N+1).
+        """
+        # یک subquery برای کل ردیف عکس اول (نه یک subquery برای هر ستون)؛ Product.load_primary_image آن را باز می‌کند
+        primary = ProductImage.objects.filter(product=OuterRef('pk')).order_by('pk').values(
+            row=JSONObject(
+                name='image', variants='variants', processing='is_processing',
+                # placeholder کارت (رنگ زمینه و BlurHash) بدون خواندن فایل
+                color='dominant_color', blurhash='blurhash',
+            )
+        )[:1]
+        return self.annotate(primary_image_row=Subquery(primary, output_field=models.JSONField()))
+
+    def for_cards(self):
+        """هرچه partials/product_card.html و فید JSON لازم دارند، با تعداد کوئری ثابت"""
+        return self.select_related('city').prefetch_related('tags').with_primary_image()
+
+
 class Product(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, verbose_name=_('کاربر'))
     name_fa = models.CharField(max_length=200, verbose_name=_('نام (فارسی)'))
@@ -124,6 +195,43 @@ class Product(models.Model):
         default='new', 
         verbose_name=_('وضعیت محصول')
     )
+    # رتبه نمایش در فیدها (ویژه=4 + پیشنهادی=2 + تخفیف‌دار=1)؛ در save محاسبه می‌شود
+    listing_rank = models.PositiveSmallIntegerField(default=0, editable=False, verbose_name=_('رتبه نمایش'))
+    # متن یکسان‌سازی شده نام‌ها و توضیحات (هر سه زبان) برای جستجو؛ در save پر می‌شود
+    normalized_name = models.TextField(blank=True, default='', editable=False)
+    normalized_description = models.TextField(blank=True, default='', editable=False)
+    # بردار جستجوی متن کامل (فقط PostgreSQL)؛ توسط search.refresh_search_vectors نگهداری می‌شود
+    # ایندکس GIN آن در migration 0022 و فقط روی PostgreSQL ساخته می‌شود
+    search_vector = SearchVectorField(null=True, editable=False)
+    # تعداد نظرات؛ توسط signals با UPDATE ... SET comment_count = comment_count ± 1 نگهداری می‌شود
+    comment_count = models.PositiveIntegerField(default=0, editable=False, verbose_name=_('تعداد نظرات'))
+
+    objects = ProductQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # ایندکس‌های هم‌ترتیب با فید (pagination.FEED_ORDERING) فقط روی محصولات تایید شده
+            models.Index(
+                fields=['-listing_rank', '-created_at', '-id'],
+                name='product_rank_created_idx',
+                condition=Q(is_approved=True),
+            ),
+            models.Index(
+                fields=['city', '-listing_rank', '-created_at', '-id'],
+                name='product_city_rank_idx',
+                condition=Q(is_approved=True),
+            ),
+            models.Index(
+                fields=['category', '-listing_rank', '-created_at', '-id'],
+                name='product_category_rank_idx',
+                condition=Q(is_approved=True),
+            ),
+        ]
+
+    @staticmethod
+    def compute_listing_rank(is_featured, is_suggested, is_discounted):
+        flags = {'is_featured': is_featured, 'is_suggested': is_suggested, 'is_discounted': is_discounted}
+        return sum(weight for field, weight in LISTING_RANK_WEIGHTS if flags[field])
 
     def clean(self):
         # اگر محصول تخفیف‌دار است ولی قیمت تخفیف وارد نشده
@@ -139,19 +247,246 @@ class Product(models.Model):
 
     def save(self, *args, **kwargs):
         self.full_clean()
+        self.listing_rank = self.compute_listing_rank(self.is_featured, self.is_suggested, self.is_discounted)
+        self.normalized_name = normalize_join(self.name_fa, self.name_ps, self.name_en)
+        self.normalized_description = normalize_join(self.description_fa, self.description_ps, self.description_en)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            update_fields = set(update_fields)
+            if any(field in update_fields for field, _weight in LISTING_RANK_WEIGHTS):
+                update_fields.add('listing_rank')
+            if update_fields & {'name_fa', 'name_ps', 'name_en'}:
+                update_fields.add('normalized_name')
+            if update_fields & {'description_fa', 'description_ps', 'description_en'}:
+                update_fields.add('normalized_description')
+            kwargs['update_fields'] = update_fields
+        elif not self._state.adding and not kwargs.get('force_insert'):
+            # comment_count فقط با UPDATE در signals تغییر می‌کند؛ save کامل (ادمین، ویرایش) مقدار کهنه را برنگرداند
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != 'comment_count'
+            ]
         super().save(*args, **kwargs)
 
     def __str__(self):
         return self.name_fa
 
+    @property
+    def primary_image_url(self):
+        """آدرس عکس اصلی؛ اگر کوئری با with_primary_image ساخته نشده باشد یک بار از دیتابیس خوانده می‌شود"""
+        self.load_primary_image()
+        if not self.primary_image_name:
+            return None
+        return ProductImage._meta.get_field('image').storage.url(self.primary_image_name)
+
+    def load_primary_image(self):
+        if hasattr(self, 'primary_image_name'):
+            return
+        if hasattr(self, 'primary_image_row'):
+            row = self.primary_image_row or {}
+            variants = row.get('variants')
+            if isinstance(variants, str):
+                # SQLite ستون JSON را به صورت متن در JSON_OBJECT می‌گذارد
+                variants = json.loads(variants)
+            self.primary_image_name = row.get('name')
+            self.primary_image_variants = variants
+            self.primary_image_processing = bool(row.get('processing'))
+            self.primary_image_color = row.get('color') or ''
+            self.primary_image_blurhash = row.get('blurhash') or ''
+        else:
+            first_image = self.images.order_by('pk').first()
+            self.primary_image_name = first_image.image.name if first_image else None
+            self.primary_image_variants = first_image.variants if first_image else None
+            self.primary_image_processing = first_image.is_processing if first_image else False
+            self.primary_image_color = first_image.dominant_color if first_image else ''
+            self.primary_image_blurhash = first_image.blurhash if first_image else ''
+
+    @property
+    def card_image_url(self):
+        """
+        نسخه JPEG کارت عکس اصلی (fallback قالب‌ها). در حین پردازش None و قالب placeholder
+        نشان می‌دهد؛ عکس‌های قدیمی بدون نسخه فایل اصلی.
+        """
+        self.load_primary_image()
+        if self.primary_image_processing:
+            return None
+        return variant_url(self.primary_image_variants, 'card') or self.primary_image_url
+
+    @property
+    def card_image_size(self):
+        """(عرض، ارتفاع) نسخه کارت برای width/height تگ img؛ None اگر ساخته نشده"""
+        self.load_primary_image()
+        card = (self.primary_image_variants or {}).get('card')
+        return (card['width'], card['height']) if card else None
+
+    @property
+    def card_image_placeholder(self):
+        """رنگ غالب و BlurHash عکس اصلی (رشته خالی برای عکس‌های بدون metadata)"""
+        self.load_primary_image()
+        return {'color': self.primary_image_color or '', 'blurhash': self.primary_image_blurhash or ''}
+
+    @property
+    def card_image_srcset(self):
+        self.load_primary_image()
+        return variant_srcset(self.primary_image_variants, 'jpeg')
+
+    @property
+    def card_image_webp_srcset(self):
+        self.load_primary_image()
+        return variant_srcset(self.primary_image_variants, 'webp')
+
 class ProductImage(models.Model):
     product = models.ForeignKey(Product, related_name='images', on_delete=models.CASCADE)
     image = models.ImageField(upload_to='product_images/')
     alt_text = models.CharField(max_length=255, blank=True, null=True)
+    # نسخه‌های مشتق (images.py): {نام: {'width', 'height', 'webp', 'jpeg'}}
+    variants = models.JSONField(default=dict, blank=True)
+    # آپلود شده و در صف image_pool؛ تا پایان پردازش placeholder نمایش داده می‌شود
+    is_processing = models.BooleanField(default=False)
+    # metadata فایل اصلی (بعد از چرخش EXIF)، یک بار در پردازش یا با backfill_image_metadata
+    width = models.PositiveIntegerField(null=True, blank=True)
+    height = models.PositiveIntegerField(null=True, blank=True)
+    byte_size = models.PositiveIntegerField(null=True, blank=True)
+    dominant_color = models.CharField(max_length=7, blank=True, default='')
+    blurhash = models.CharField(max_length=64, blank=True, default='')
+
+    def variant_url(self, name, fmt='jpeg'):
+        """آدرس یک نسخه؛ None در حین پردازش و فایل اصلی برای عکس‌های قدیمی بدون نسخه"""
+        if self.is_processing:
+            return None
+        return variant_url(self.variants, name, fmt) or (self.image.url if self.image else None)
 
     def __str__(self):
         return f"Image for {self.product.name_fa}"
 
+class ProductComment(models.Model):
+    product = models.ForeignKey(Product, related_name='comments', on_delete=models.CASCADE, verbose_name=_('محصول'))
+    user = models.ForeignKey(User, null=True, blank=True, on_delete=models.SET_NULL, verbose_name=_('کاربر'))
+    email = models.CharField(max_length=254, blank=True, verbose_name=_('ایمیل یا نام کاربری'))
+    message = models.TextField(verbose_name=_('نظر'))
+    created_at = models.DateTimeField(default=timezone.now, verbose_name=_('تاریخ ایجاد'))
+
+    class Meta:
+        verbose_name = _('نظر محصول')
+        verbose_name_plural = _('نظرات محصولات')
+        indexes = [
+            # نظرات اخیر یک محصول: product_id = ? ORDER BY created_at DESC
+            models.Index(fields=['product', 'created_at'], name='product_comment_idx'),
+        ]
+
+    def __str__(self):
+        return f"Comment from {self.email or 'Anonymous'} on {self.product_id}"
+
+class Conversation(models.Model):
+    """گفتگوی یک خریدار با فروشنده درباره یک محصول"""
+    product = models.ForeignKey(Product, related_name='conversations', on_delete=models.CASCADE, verbose_name=_('محصول'))
+    buyer = models.ForeignKey(User, related_name='buyer_conversations', on_delete=models.CASCADE, verbose_name=_('خریدار'))
+    seller = models.ForeignKey(User, related_name='seller_conversations', on_delete=models.CASCADE, verbose_name=_('فروشنده'))
+    created_at = models.DateTimeField(default=timezone.now, verbose_name=_('تاریخ ایجاد'))
+    last_message_at = models.DateTimeField(default=timezone.now, verbose_name=_('آخرین پیام'))
+    # تعداد پیام‌های خوانده نشده هر طرف؛ با F() در chat.py نگهداری می‌شود
+    buyer_unread = models.PositiveIntegerField(default=0, verbose_name=_('خوانده نشده خریدار'))
+    seller_unread = models.PositiveIntegerField(default=0, verbose_name=_('خوانده نشده فروشنده'))
+
+    class Meta:
+        verbose_name = _('گفتگو')
+        verbose_name_plural = _('گفتگوها')
+        unique_together = ['product', 'buyer']
+        indexes = [
+            models.Index(fields=['buyer', '-last_message_at'], name='conversation_buyer_idx'),
+            models.Index(fields=['seller', '-last_message_at'], name='conversation_seller_idx'),
+        ]
+
+    def __str__(self):
+        return f"Chat {self.buyer_id} -> {self.seller_id} on {self.product_id}"
+
+    def other_user(self, user):
+        return self.seller if user.id == self.buyer_id else self.buyer
+
+class Message(models.Model):
+    # ایندکس (conversation, id) پیشوند conversation را هم پوشش می‌دهد
+    conversation = models.ForeignKey(Conversation, related_name='messages', on_delete=models.CASCADE, db_index=False, verbose_name=_('گفتگو'))
+    sender = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name=_('فرستنده'))
+    body = models.TextField(verbose_name=_('پیام'))
+    created_at = models.DateTimeField(default=timezone.now, verbose_name=_('تاریخ ارسال'))
+
+    class Meta:
+        verbose_name = _('پیام')
+        verbose_name_plural = _('پیام‌ها')
+        indexes = [
+            # پیام‌های جدید یک گفتگو: conversation_id = ? AND id > ? ORDER BY id
+            models.Index(fields=['conversation', 'id'], name='chat_message_idx'),
+        ]
+
+    def __str__(self):
+        return f"Message {self.id} in {self.conversation_id}"
+
+class Notification(models.Model):
+    KIND_CHOICES = [
+        ('comment', 'نظر'),
+        ('chat', 'پیام'),
+        ('admin', 'مدیریت'),
+        ('system', 'سیستم'),
+    ]
+    # ایندکس‌های زیر با پیشوند user، ایندکس جداگانه کلید خارجی را لازم ندارند
+    user = models.ForeignKey(User, related_name='notifications', on_delete=models.CASCADE, db_index=False, verbose_name=_('کاربر'))
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES, default='system', verbose_name=_('نوع'))
+    message = models.TextField(verbose_name=_('پیام'))
+    link = models.CharField(max_length=300, blank=True, verbose_name=_('لینک'))
+    is_read = models.BooleanField(default=False, verbose_name=_('خوانده شده'))
+    created_at = models.DateTimeField(default=timezone.now, verbose_name=_('تاریخ ایجاد'))
+
+    class Meta:
+        verbose_name = _('اعلان')
+        verbose_name_plural = _('اعلان‌ها')
+        indexes = [
+            models.Index(fields=['user', '-created_at'], name='notification_user_idx'),
+            # فقط ردیف‌های خوانده نشده؛ شمارش و «همه خوانده شد» روی ایندکس کوچک
+            models.Index(fields=['user'], condition=Q(is_read=False), name='notification_unread_idx'),
+        ]
+
+    def __str__(self):
+        return f"Notification for {self.user_id}: {self.message[:30]}"
+
+class Broadcast(models.Model):
+    """اعلان همگانی؛ یک بار ذخیره می‌شود و وضعیت خوانده شدن هر کاربر در BroadcastRead است"""
+    message = models.TextField(verbose_name=_('پیام'))
+    created_by = models.ForeignKey(User, null=True, blank=True, on_delete=models.SET_NULL, verbose_name=_('ارسال کننده'))
+    created_at = models.DateTimeField(default=timezone.now, db_index=True, verbose_name=_('تاریخ ایجاد'))
+
+    class Meta:
+        verbose_name = _('اعلان همگانی')
+        verbose_name_plural = _('اعلان‌های همگانی')
+
+    def __str__(self):
+        return self.message[:50]
+
+class BroadcastRead(models.Model):
+    """ردیف فقط وقتی ساخته می‌شود که کاربر اعلان همگانی را بخواند"""
+    broadcast = models.ForeignKey(Broadcast, related_name='reads', on_delete=models.CASCADE)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, db_index=False)
+    read_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        # ایندکس یکتا با پیشوند user برای «خوانده نشده‌های این کاربر»
+        unique_together = ['user', 'broadcast']
+
+class SimilarProduct(models.Model):
+    """k نزدیک‌ترین همسایه هر محصول (شباهت کسینوسی TF-IDF)؛ توسط similarity.py ساخته می‌شود"""
+    product = models.ForeignKey(Product, related_name='similar_products', on_delete=models.CASCADE)
+    similar = models.ForeignKey(Product, related_name='similar_to', on_delete=models.CASCADE)
+    score = models.FloatField()
+    rank = models.PositiveSmallIntegerField()
+
+    class Meta:
+        unique_together = ['product', 'similar']
+        indexes = [
+            models.Index(fields=['product', 'rank'], name='similar_product_rank_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} -> {self.similar_id} ({self.score:.3f})"
+
 class VisitLog(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     date = models.DateField(default=timezone.now)
@@ -178,6 +513,13 @@ class UserFeedback(models.Model):
     email = models.EmailField(blank=True)
     subject = models.CharField(max_length=200)
     message = models.TextField()
+    # متن یکسان‌سازی شده برای جستجوی پیام‌ها در پنل مدیریت
+    normalized_text = models.TextField(blank=True, default='', editable=False)
+
+    def save(self, *args, **kwargs):
+        self.normalized_text = normalize_join(self.email, self.subject, self.message)
+        save_normalized_with(kwargs, ('email', 'subject', 'message'))
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"Feedback from {self.email or 'Anonymous'} at {self.timestamp} - {self.subject}"
@@ -285,12 +627,18 @@ class JobAd(models.Model):
     city = models.ForeignKey('City', on_delete=models.SET_NULL, null=True, blank=True, verbose_name=_('شهر'))
     created_at = models.DateTimeField(auto_now_add=True, verbose_name=_('تاریخ ثبت'))
     owner_profile_id = models.CharField(max_length=10, verbose_name=_('شناسه کاربر'), null=True, blank=True, db_index=True)
+    normalized_text = models.TextField(blank=True, default='', editable=False)
 
     class Meta:
         verbose_name = _('آگهی شغلی')
         verbose_name_plural = _('آگهی‌های شغلی')
         ordering = ['-created_at']
 
+    def save(self, *args, **kwargs):
+        self.normalized_text = normalize_join(self.title, self.description)
+        save_normalized_with(kwargs, ('title', 'description'))
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return self.title
 
@@ -301,12 +649,18 @@ class Request(models.Model):
     contact = models.CharField(max_length=100, verbose_name=_('شماره تماس'))
     created_at = models.DateTimeField(auto_now_add=True, verbose_name=_('تاریخ ثبت'))
     is_active = models.BooleanField(default=True, verbose_name=_('فعال'))
+    normalized_text = models.TextField(blank=True, default='', editable=False)
 
     class Meta:
         verbose_name = _('درخواست')
         verbose_name_plural = _('درخواستی‌ها')
         ordering = ['-created_at']
 
+    def save(self, *args, **kwargs):
+        self.normalized_text = normalize_join(self.request_text, self.contact)
+        save_normalized_with(kwargs, ('request_text', 'contact'))
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return f"درخواست از {self.contact} - {self.created_at.strftime('%Y/%m/%d')}"
 
@@ -333,3 +687,27 @@ class AdminAlert(models.Model):
 
     def __str__(self):
         return f"Alert: {self.user.username} - {self.count_last_hour}/1h, {self.count_last_day}/24h"
+
+
+class ProductCounter(models.Model):
+    """
+    تعداد محصولات تایید شده به ازای هر شهر، دسته‌بندی و برچسب (جدول غیرنرمال).
+    توسط signals به‌روز می‌ماند (counters.py)؛ دستور reconcile_product_counters انحراف را اصلاح می‌کند.
+    """
+    DIMENSION_CHOICES = [
+        ('city', _('شهر')),
+        ('category', _('دسته‌بندی')),
+        ('tag', _('برچسب')),
+    ]
+
+    dimension = models.CharField(max_length=10, choices=DIMENSION_CHOICES, verbose_name=_('نوع'))
+    object_id = models.PositiveIntegerField(verbose_name=_('شناسه'))
+    count = models.IntegerField(default=0, verbose_name=_('تعداد محصولات تایید شده'))
+
+    class Meta:
+        verbose_name = _('شمارنده محصولات')
+        verbose_name_plural = _('شمارنده‌های محصولات')
+        unique_together = ['dimension', 'object_id']
+
+    def __str__(self):
+        return f"{self.dimension}:{self.object_id} = {self.count}"
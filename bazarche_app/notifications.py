@@ -0,0 +1,145 @@
+"""
+اعلان‌های کاربران
+
+اعلان‌های شخصی در جدول Notification با پرچم is_read هستند (ایندکس جزئی روی ردیف‌های خوانده نشده).
+اعلان‌های همگانی (Broadcast) فقط یک بار ذخیره می‌شوند و هر کاربری که بعد از عضویت آن‌ها را
+ببیند فقط هنگام خواندن یک ردیف BroadcastRead می‌گیرد؛ ارسال همگانی یک INSERT است، نه یکی به ازای هر کاربر.
+
+تعداد خوانده نشده هر کاربر (شخصی + همگانی) در کش نگه داشته می‌شود و بعد از commit هر تغییر
+با INCR/DECR به‌روز می‌شود، پس endpoint شمارش (navbar) در حالت عادی هیچ کوئری SQL ندارد.
+نسخه اعلان‌های همگانی بخشی از کلید است: هر ارسال همگانی کلید همه کاربران را عوض می‌کند و
+هر کاربر در درخواست بعدی یک بار از دیتابیس می‌شمارد.
+
+تعداد جدید بعد از هر تغییر از طریق push.py به اتصال‌های SSE کاربر فرستاده می‌شود.
+"""
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.urls import reverse
+
+from .cache_manager import CacheManager
+from .models import Notification, Broadcast, BroadcastRead
+from .push import publish, user_channel, BROADCAST_CHANNEL
+
+UNREAD_KEY = 'notifications:unread:{}:v{}'
+# انقضا برای اصلاح خودکار انحراف احتمالی شمارنده
+UNREAD_TIMEOUT = 60 * 60 * 24
+
+
+def unread_key(user_id):
+    return UNREAD_KEY.format(user_id, CacheManager.namespace_version('broadcast'))
+
+
+def visible_broadcasts(user):
+    """اعلان‌های همگانی ارسال شده بعد از عضویت کاربر"""
+    return Broadcast.objects.filter(created_at__gte=user.date_joined)
+
+
+def unread_broadcasts(user):
+    return visible_broadcasts(user).exclude(reads__user=user)
+
+
+def unread_count(user):
+    key = unread_key(user.id)
+    count = cache.get(key)
+    if count is None:
+        count = Notification.objects.filter(user=user, is_read=False).count() + unread_broadcasts(user).count()
+        # add: اگر در همین فاصله incr انجام شده باشد، مقدار آن حفظ می‌شود
+        cache.add(key, count, UNREAD_TIMEOUT)
+    return count
+
+
+def adjust_unread(user_id, delta):
+    """تغییر شمارنده کش شده؛ اگر کلید نیست، خواندن بعدی از دیتابیس می‌شمارد"""
+    key = unread_key(user_id)
+    try:
+        count = cache.incr(key, delta)
+    except ValueError:
+        return
+    if count < 0:
+        cache.delete(key)
+
+
+def publish_unread_count(user):
+    publish(user_channel(user.id), 'notifications', {'count': unread_count(user)})
+
+
+def unread_changed(user, delta):
+    """بعد از commit: شمارنده و اتصال‌های SSE کاربر"""
+    def apply():
+        adjust_unread(user.id, delta)
+        publish_unread_count(user)
+    transaction.on_commit(apply)
+
+
+def notify(user, kind, message, link=''):
+    notification = Notification.objects.create(user=user, kind=kind, message=message, link=link)
+    unread_changed(user, 1)
+    return notification
+
+
+def broadcast(message, sender=None):
+    """اعلان برای همه کاربران: یک ردیف، بدون توجه به تعداد کاربران"""
+    item = Broadcast.objects.create(message=message, created_by=sender)
+
+    def apply():
+        CacheManager.bump_namespace('broadcast')
+        # اتصال‌های SSE تعداد جدید را از endpoint شمارش می‌گیرند
+        publish(BROADCAST_CHANNEL, 'broadcast', {'id': item.id})
+    transaction.on_commit(apply)
+    return item
+
+
+def read_notification(user, notification_id):
+    """خروجی: True اگر اعلان خوانده نشده‌ای علامت خورد"""
+    updated = Notification.objects.filter(pk=notification_id, user=user, is_read=False).update(is_read=True)
+    if updated:
+        unread_changed(user, -updated)
+    return bool(updated)
+
+
+def read_broadcast(user, broadcast_id):
+    """خروجی: True اگر اعلان همگانی خوانده نشده‌ای علامت خورد"""
+    if not visible_broadcasts(user).filter(pk=broadcast_id).exists():
+        return False
+    _read, created = BroadcastRead.objects.get_or_create(user=user, broadcast_id=broadcast_id)
+    if created:
+        unread_changed(user, -1)
+    return created
+
+
+def read_all_notifications(user):
+    """یک UPDATE روی ایندکس جزئی و یک bulk_create برای همگانی‌ها؛ خروجی: تعداد علامت خورده‌ها"""
+    updated = Notification.objects.filter(user=user, is_read=False).update(is_read=True)
+    broadcast_ids = list(unread_broadcasts(user).values_list('pk', flat=True))
+    BroadcastRead.objects.bulk_create(
+        [BroadcastRead(user=user, broadcast_id=broadcast_id) for broadcast_id in broadcast_ids],
+        ignore_conflicts=True,
+    )
+    updated += len(broadcast_ids)
+    if updated:
+        unread_changed(user, -updated)
+    return updated
+
+
+def user_feed(user, limit=None):
+    """اعلان‌های شخصی و همگانی کاربر، جدیدترین اول (با read_url برای هر کدام)"""
+    personal = user.notifications.order_by('-created_at')
+    broadcasts = visible_broadcasts(user).annotate(
+        is_read=Exists(BroadcastRead.objects.filter(broadcast=OuterRef('pk'), user=user))
+    ).order_by('-created_at')
+    if limit:
+        personal = personal[:limit]
+        broadcasts = broadcasts[:limit]
+
+    items = []
+    for notification in personal:
+        notification.read_url = reverse('app:mark_notification_read', args=[notification.id])
+        items.append(notification)
+    for item in broadcasts:
+        item.kind = 'admin'
+        item.link = ''
+        item.read_url = reverse('app:mark_broadcast_read', args=[item.id])
+        items.append(item)
+    items.sort(key=lambda item: item.created_at, reverse=True)
+    return items[:limit] if limit else items
@@ -0,0 +1,69 @@
+import base64
+import json
+from datetime import datetime
+
+from django.db import connection
+from django.db.models import BooleanField
+from django.db.models.expressions import RawSQL
+
+# ترتیب فید محصولات: ویژه -> پیشنهادی -> تخفیف‌دار -> جدیدترین (Product.listing_rank)
+# id در انتها برای یکتا بودن ترتیب (و درنتیجه کرسر) اضافه شده است
+FEED_ORDERING = ('-listing_rank', '-created_at', '-id')
+FEED_CURSOR_FIELDS = ('listing_rank', 'created_at', 'id')
+
+
+def encode_feed_cursor(product):
+    """ساخت توکن مبهم از مقادیر ترتیب آخرین محصول صفحه"""
+    values = [
+        product.listing_rank,
+        product.created_at.isoformat(),
+        product.id,
+    ]
+    raw = json.dumps(values, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_feed_cursor(token):
+    """بازگرداندن مقادیر ترتیب از توکن؛ در صورت نامعتبر بودن ValueError"""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        listing_rank, created_at, last_id = values
+        if not all(isinstance(value, int) and not isinstance(value, bool) for value in (listing_rank, last_id)):
+            raise ValueError('invalid rank or id')
+        return (listing_rank, datetime.fromisoformat(created_at), last_id)
+    except (TypeError, ValueError, json.JSONDecodeError, base64.binascii.Error) as exc:
+        raise ValueError('Invalid feed cursor') from exc
+
+
+def seek_filter(model, fields, values):
+    """
+    شرط seek برای ترتیب نزولی روی چند ستون به شکل مقایسه سطری: (a, b, c) < (x, y, z).
+    PostgreSQL این شرط را شروع بازه روی ایندکس ترکیبی هم‌ترتیب می‌کند و صفحات عمیق هزینه صفحه اول
+    را دارند؛ شکل باز شده a < x OR (a = x AND b < y) OR ... فقط فیلتر است و ایندکس را از ابتدا
+    پیمایش می‌کند. Django 5.0 مقایسه سطری ندارد، پس RawSQL (SQLite هم از 3.15 پشتیبانی می‌کند).
+    """
+    quote = connection.ops.quote_name
+    table = quote(model._meta.db_table)
+    model_fields = [model._meta.get_field(field) for field in fields]
+    columns = ', '.join(f'{table}.{quote(field.column)}' for field in model_fields)
+    placeholders = ', '.join(['%s'] * len(values))
+    # RawSQL مقادیر را آماده نمی‌کند (مثلا datetime با منطقه زمانی در SQLite)
+    params = tuple(field.get_db_prep_value(value, connection) for field, value in zip(model_fields, values))
+    return RawSQL(f'({columns}) < ({placeholders})', params, output_field=BooleanField())
+
+
+def feed_page_after(queryset, cursor, page_size):
+    """
+    برگرداندن یک صفحه از فید بعد از کرسر داده شده (یا از ابتدا اگر کرسر None باشد).
+    خروجی: (لیست محصولات، کرسر صفحه بعد یا None)
+    """
+    queryset = queryset.order_by(*FEED_ORDERING)
+    if cursor is not None:
+        queryset = queryset.filter(seek_filter(queryset.model, FEED_CURSOR_FIELDS, cursor))
+    # یک رکورد اضافه برای تشخیص وجود صفحه بعد، بدون COUNT(*)
+    rows = list(queryset[:page_size + 1])
+    has_next = len(rows) > page_size
+    rows = rows[:page_size]
+    next_cursor = encode_feed_cursor(rows[-1]) if has_next and rows else None
+    return rows, next_cursor
@@ -0,0 +1,156 @@
+"""
+مدل کش شده صفحه جزئیات محصول
+
+همه داده‌های صفحه (فیلدهای محصول، آدرس همه تصاویر، دسته‌بندی، شهر، برچسب‌ها، فروشنده و
+خلاصه نظرات) یک بار از دیتابیس ساخته و به شکل dict ساده در کش نگه داشته می‌شوند. signals با
+CacheManager.invalidate_product_cache آن را باطل می‌کنند.
+
+از محصولات دیگر (محصولات فروشنده و محصولات مشابه جدول SimilarProduct، similarity.py) فقط
+شناسه‌ها کش می‌شوند و page_cards کارت‌ها را در هر درخواست با یک کوئری می‌سازد؛ ویرایش، رد یا
+حذف آن محصولات (که صفحه این محصول را باطل نمی‌کند) کارت کهنه یا لینک مرده نمی‌گذارد. اگر محصول
+هنوز همسایه‌ای ندارد، محصولات مرتبط به صورت تصادفی از مخزن شناسه‌های همان دسته‌بندی (در کش)
+انتخاب می‌شوند؛ به جای order_by('?') که همه محصولات دسته را مرتب می‌کند.
+"""
+import random
+
+from django.core.cache import cache
+
+from .models import Product
+from .pagination import FEED_ORDERING
+
+RECENT_COMMENTS = 10
+RELATED_PRODUCTS = 4
+# مخزن محصولات مرتبط: حداکثر این تعداد از بالاترین رتبه‌های دسته (ایندکس product_category_rank_idx)
+RELATED_POOL_SIZE = 200
+RELATED_POOL_TIMEOUT = 60 * 30
+
+
+def product_card(product):
+    """داده‌های لازم برای کارت محصول در صفحه جزئیات"""
+    return {
+        'id': product.id,
+        'name_fa': product.name_fa,
+        'description_fa': product.description_fa,
+        'price': product.price,
+        'discount_price': product.discount_price,
+        'primary_image_url': product.primary_image_url,
+        'card_image_url': product.card_image_url,
+        'card_image_srcset': product.card_image_srcset,
+        'card_image_webp_srcset': product.card_image_webp_srcset,
+    }
+
+
+def build_product_page(product_id):
+    """ساخت مدل صفحه از دیتابیس؛ برای محصول ناموجود یا تایید نشده None"""
+    product = (
+        Product.objects.select_related('category', 'city', 'user')
+        .prefetch_related('tags', 'images')
+        .filter(pk=product_id, is_approved=True)
+        .first()
+    )
+    if product is None:
+        return None
+
+    product_images = [image for image in sorted(product.images.all(), key=lambda image: image.pk) if image.image]
+    image_urls = [image.image.url for image in product_images]
+    # گالری: نسخه full برای تصویر اصلی و thumb برای ردیف کوچک (None تا پایان پردازش)، با ابعاد و placeholder
+    images = [
+        {
+            'full': image.variant_url('full'),
+            'thumb': image.variant_url('thumb'),
+            'width': image.variants.get('full', {}).get('width'),
+            'height': image.variants.get('full', {}).get('height'),
+            'color': image.dominant_color,
+            'blurhash': image.blurhash,
+        }
+        for image in product_images
+    ]
+
+    # ایندکس product_comment_idx
+    recent_comments = [
+        {'email': comment.email, 'message': comment.message, 'created_at': comment.created_at}
+        for comment in product.comments.order_by('-created_at')[:RECENT_COMMENTS]
+    ]
+
+    # فقط شناسه‌ها؛ کارت‌ها در page_cards
+    seller_product_ids = []
+    if product.seller_contact:
+        seller_product_ids = list(
+            Product.objects.filter(seller_contact=product.seller_contact, is_approved=True)
+            .exclude(pk=product.id).order_by('-created_at').values_list('pk', flat=True)[:RELATED_PRODUCTS]
+        )
+
+    similar_product_ids = list(
+        Product.objects.filter(similar_to__product_id=product.id, is_approved=True)
+        .order_by('similar_to__rank').values_list('pk', flat=True)[:RELATED_PRODUCTS]
+    )
+
+    return {
+        'id': product.id,
+        'name_fa': product.name_fa,
+        'name_ps': product.name_ps,
+        'name_en': product.name_en,
+        'description_fa': product.description_fa,
+        'price': product.price,
+        'discount_price': product.discount_price,
+        'is_featured': product.is_featured,
+        'is_discounted': product.is_discounted,
+        'is_suggested': product.is_suggested,
+        'condition': product.condition,
+        'seller_contact': product.seller_contact,
+        'created_at': product.created_at,
+        'images': images,
+        'image_urls': image_urls,
+        'primary_image_url': image_urls[0] if image_urls else None,
+        'category': {'id': product.category.id, 'name_fa': product.category.name_fa} if product.category else None,
+        'city': {'id': product.city.id, 'name': product.city.name} if product.city else None,
+        'tags': [{'id': tag.id, 'name_fa': tag.name_fa} for tag in product.tags.all()],
+        'seller': {'id': product.user.id, 'username': product.user.username} if product.user else None,
+        'comment_count': product.comment_count,
+        'recent_comments': recent_comments,
+        'seller_product_ids': seller_product_ids,
+        'similar_product_ids': similar_product_ids,
+    }
+
+
+def related_pool_key(category_id):
+    return f'related_pool:{category_id}'
+
+
+def category_pool(category_id):
+    """شناسه محصولات تایید شده یک دسته‌بندی (کش شده)"""
+    key = related_pool_key(category_id)
+    pool = cache.get(key)
+    if pool is None:
+        pool = list(
+            Product.objects.filter(category_id=category_id, is_approved=True)
+            .order_by(*FEED_ORDERING).values_list('pk', flat=True)[:RELATED_POOL_SIZE]
+        )
+        cache.set(key, pool, RELATED_POOL_TIMEOUT)
+    return pool
+
+
+def invalidate_category_pools(*category_ids):
+    cache.delete_many([related_pool_key(category_id) for category_id in category_ids if category_id])
+
+
+def sample_related_ids(product_id, category_id, count=RELATED_PRODUCTS):
+    """شناسه چند محصول تصادفی از همان دسته‌بندی (بدون کوئری وقتی مخزن در کش است)"""
+    if not category_id:
+        return []
+    pool = [pk for pk in category_pool(category_id) if pk != product_id]
+    return random.sample(pool, min(count, len(pool)))
+
+
+def page_cards(product_page):
+    """(کارت‌های محصولات مرتبط، کارت‌های محصولات فروشنده) برای مدل کش شده صفحه؛ حداکثر یک کوئری"""
+    related_ids = product_page['similar_product_ids'] or sample_related_ids(
+        product_page['id'], product_page['category'] and product_page['category']['id']
+    )
+    seller_ids = product_page['seller_product_ids']
+    if not related_ids and not seller_ids:
+        return [], []
+    # شناسه‌های کهنه (محصول رد یا حذف شده) اینجا حذف می‌شوند
+    products = Product.objects.filter(pk__in={*related_ids, *seller_ids}, is_approved=True).with_primary_image()
+    cards = {product.pk: product_card(product) for product in products}
+    return [cards[pk] for pk in related_ids if pk in cards], [cards[pk] for pk in seller_ids if pk in cards]
@@ -0,0 +1,141 @@
+"""
+کانال push برای Server-Sent Events (پیام‌های چت و تعداد اعلان‌ها)
+
+هر اتصال SSE (views.event_stream، فقط زیر ASGI) در این پروسه روی کانال کاربر (user:{id})
+مشترک می‌شود و یک صف asyncio می‌گیرد. publish از کد همزمان (views/signals) صدا زده می‌شود.
+
+- بدون PUSH_REDIS_URL: پیام مستقیم به مشترکین همین پروسه می‌رسد (فقط وقتی web و events یک پروسه ASGI هستند).
+- با PUSH_REDIS_URL: پیام در یک کانال Redis منتشر می‌شود و listener هر پروسه آن را به
+  مشترکین محلی خود می‌رساند. در Procfile لازم است: publish در پروسه‌های web (WSGI) اجرا
+  می‌شود و اتصال‌ها در پروسه events هستند.
+
+پیام‌ها تضمینی نیستند (صف پر یا قطع Redis)؛ کلاینت‌ها با last_message_id و polling جبران می‌کنند.
+"""
+import asyncio
+import json
+import logging
+import threading
+from contextlib import asynccontextmanager
+
+from django.conf import settings
+
+REDIS_CHANNEL = 'bazarche:push'
+# کانال مشترک همه کاربران (اعلان‌های همگانی)
+BROADCAST_CHANNEL = 'broadcast'
+QUEUE_SIZE = 100
+RECONNECT_DELAY = 5
+
+logger = logging.getLogger(__name__)
+
+# کانال -> مجموعه (event loop، صف) مشترکین این پروسه
+_subscribers = {}
+_lock = threading.Lock()
+_redis_client = None
+_listener_task = None
+
+
+def user_channel(user_id):
+    return f'user:{user_id}'
+
+
+def redis_url():
+    return getattr(settings, 'PUSH_REDIS_URL', None)
+
+
+def check_config():
+    """هشدار شروع پروسه events: بدون Redis پیام‌های workerهای web به این پروسه نمی‌رسند"""
+    if not redis_url():
+        logger.warning('PUSH_REDIS_URL تنظیم نشده؛ رویدادهای منتشر شده در پروسه‌های web به اتصال‌های SSE این پروسه نمی‌رسند')
+
+
+def publish(channel, event, data):
+    """ارسال یک رویداد به همه اتصال‌های یک کانال (در همه پروسه‌ها اگر Redis تنظیم شده باشد)"""
+    message = json.dumps({'channel': channel, 'event': event, 'data': data}, default=str)
+    url = redis_url()
+    if url:
+        global _redis_client
+        try:
+            import redis
+            if _redis_client is None:
+                _redis_client = redis.Redis.from_url(url)
+            _redis_client.publish(REDIS_CHANNEL, message)
+            return
+        except Exception as e:
+            # بدون Redis حداقل مشترکین همین پروسه پیام را می‌گیرند
+            logger.warning('خطا در انتشار رویداد push: %s', e)
+    deliver(message)
+
+
+def deliver(message):
+    """رساندن پیام خام (JSON) به مشترکین محلی؛ از هر thread قابل صدا زدن است"""
+    payload = json.loads(message)
+    with _lock:
+        targets = list(_subscribers.get(payload['channel'], ()))
+    for loop, queue in targets:
+        try:
+            loop.call_soon_threadsafe(_enqueue, queue, payload)
+        except RuntimeError:
+            # event loop اتصال بسته شده است
+            pass
+
+
+def _enqueue(queue, payload):
+    try:
+        queue.put_nowait(payload)
+    except asyncio.QueueFull:
+        # کلاینت کند؛ پیام از دست رفته با polling جبران می‌شود
+        pass
+
+
+@asynccontextmanager
+async def subscribe(*channels):
+    """صف رویدادهای کانال‌های داده شده تا پایان بلوک async with"""
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+    entry = (loop, queue)
+    _ensure_listener(loop)
+    with _lock:
+        for channel in channels:
+            _subscribers.setdefault(channel, set()).add(entry)
+    try:
+        yield queue
+    finally:
+        with _lock:
+            for channel in channels:
+                subscribers = _subscribers.get(channel)
+                if subscribers is not None:
+                    subscribers.discard(entry)
+                    if not subscribers:
+                        del _subscribers[channel]
+
+
+def _ensure_listener(loop):
+    """یک listener Redis برای هر پروسه (روی event loop سرور ASGI)"""
+    global _listener_task
+    url = redis_url()
+    if not url or (_listener_task is not None and not _listener_task.done()):
+        return
+    _listener_task = loop.create_task(_listen(url))
+
+
+async def _listen(url):
+    from redis import asyncio as aioredis
+
+    while True:
+        try:
+            client = aioredis.from_url(url)
+            async with client.pubsub() as pubsub:
+                await pubsub.subscribe(REDIS_CHANNEL)
+                async for message in pubsub.listen():
+                    if message['type'] == 'message':
+                        deliver(message['data'])
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning('خطا در listener کانال push: %s؛ اتصال دوباره بعد از %d ثانیه', e, RECONNECT_DELAY)
+            await asyncio.sleep(RECONNECT_DELAY)
+
+
+def format_event(payload):
+    """قالب متنی یک رویداد SSE"""
+    return f"event: {payload['event']}\ndata: {json.dumps(payload['data'], default=str)}\n\n"
@@ -0,0 +1,106 @@
+"""
+نسخه کش شده داده‌های مرجع (دسته‌بندی‌ها، شهرها، برچسب‌ها و تبلیغات فعال)
+
+این داده‌ها در هر رندر (context processors، نوار ناوبری، فیلترها) لازم‌اند ولی به ندرت تغییر می‌کنند.
+هر پروسه یک نسخه محلی با عمر LOCAL_TTL نگه می‌دارد. ذخیره هر کدام از این مدل‌ها (signals)
+شماره نسخه مشترک در Redis را بالا می‌برد و همه پروسه‌ها در درخواست بعدی نسخه جدید را می‌گیرند.
+پروسه‌ای که اول نسخه جدید را می‌سازد آن را در کش مشترک هم می‌گذارد تا بقیه به دیتابیس نروند.
+
+تعداد محصولات شهرها (شمارنده‌ها) و بازه زمانی تبلیغات حداکثر به اندازه LOCAL_TTL عقب هستند.
+"""
+import time
+
+from django.core.cache import cache
+from django.utils import timezone
+
+from .counters import with_product_count
+from .models import MainCategory, Category, City, Tag, Advertisement
+
+VERSION_KEY = 'reference_data:version'
+SNAPSHOT_KEY = 'reference_data:snapshot:{}'
+LOCAL_TTL = 60 * 5
+
+# دسته‌بندی‌های نمایش داده شده در ناوبری
+NAV_CATEGORY_NAMES = [
+    'وسایل نقلیه',
+    'لوازم دیجیتال',
+    'لوازم خانگی',
+    'وسایل شخصی',
+    'سرگرمی و فراغت',
+    'تجهیزات و صنعتی',
+    'خدمات',
+    'املاک',
+    'اجتماعی',
+    #'استخدام و کاریابی',  # حذف شد
+    'کتاب و مجله',
+]
+
+# Fallback icon fixes for known categories (display-level; does not write DB)
+FALLBACK_ICON_BY_NAME = {
+    'وسایل نقلیه': 'bi-car-front',
+}
+
+_local_snapshot = (None, 0.0, None)  # (version, built_at, data)
+
+
+def build_snapshot():
+    """خواندن همه داده‌های مرجع از دیتابیس"""
+    nav_categories = list(Category.objects.filter(name_fa__in=NAV_CATEGORY_NAMES).order_by('order', 'name_fa'))
+    for cat in nav_categories:
+        if (not getattr(cat, 'icon', None)) or getattr(cat, 'icon', '').strip() in {'', 'bi-tag', 'bi-car'}:
+            if cat.name_fa in FALLBACK_ICON_BY_NAME:
+                setattr(cat, 'icon', FALLBACK_ICON_BY_NAME[cat.name_fa])
+
+    return {
+        'main_categories': list(MainCategory.objects.all().order_by('order', 'name_fa')),
+        'nav_categories': nav_categories,
+        # دسته‌بندی‌های سطح اول (صفحه اصلی)
+        'root_categories': list(Category.objects.filter(parent__isnull=True).order_by('order', 'name_fa')),
+        'cities': list(with_product_count(City.objects.order_by('order', 'name'), 'city')),
+        'tags': list(Tag.objects.all().order_by('name_fa')),
+        # تبلیغاتی که هنوز تمام نشده‌اند؛ بازه شروع/پایان هنگام خواندن بررسی می‌شود
+        'advertisements': list(Advertisement.objects.filter(is_active=True, end_date__gte=timezone.now())),
+    }
+
+
+def get_snapshot():
+    """داده‌های مرجع از حافظه پروسه، کش مشترک یا (در صورت نیاز) دیتابیس"""
+    global _local_snapshot
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, 1, None)
+        version = cache.get(VERSION_KEY, 1)
+
+    local_version, built_at, data = _local_snapshot
+    if data is not None and local_version == version and time.monotonic() - built_at < LOCAL_TTL:
+        return data
+
+    data = cache.get(SNAPSHOT_KEY.format(version))
+    if data is None:
+        data = build_snapshot()
+        cache.set(SNAPSHOT_KEY.format(version), data, LOCAL_TTL)
+    _local_snapshot = (version, time.monotonic(), data)
+    return data
+
+
+def invalidate_snapshot():
+    """باطل کردن نسخه همه پروسه‌ها (بعد از ذخیره/حذف داده مرجع)"""
+    cache.add(VERSION_KEY, 1, None)
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        # کلید بین add و incr حذف شد؛ get_snapshot نسخه جدید می‌سازد
+        pass
+
+
+def active_advertisements(location, ordering=('display_order', '-created_at')):
+    """تبلیغات فعال یک موقعیت در همین لحظه، با ترتیب داده شده"""
+    now = timezone.now()
+    ads = [
+        ad for ad in get_snapshot()['advertisements']
+        if ad.location == location and ad.start_date <= now <= ad.end_date
+    ]
+    # مرتب‌سازی پایدار از آخرین کلید به اولین
+    for field in reversed(ordering):
+        ads.sort(key=lambda ad: getattr(ad, field.lstrip('-')), reverse=field.startswith('-'))
+    return ads
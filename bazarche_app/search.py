@@ -0,0 +1,136 @@
+"""
+جستجوی متن کامل محصولات
+
+روی PostgreSQL از ستون search_vector (tsvector وزن‌دار روی نام، توضیحات و برچسب‌ها
+در هر سه زبان) و ایندکس GIN آن استفاده می‌شود. روی دیتابیس‌های دیگر (مثلا SQLite در
+محیط توسعه) به جستجوی contains روی ستون‌های یکسان‌سازی شده برمی‌گردیم.
+هم بردار و هم متن جستجو از text_normalization.normalize_text عبور می‌کنند.
+
+اگر جستجوی اصلی نتیجه کمی داشته باشد، fuzzy_search_products با شباهت سه‌حرفی
+(pg_trgm) غلط‌های تایپی را هم پیدا می‌کند.
+"""
+import re
+from contextlib import contextmanager
+
+from django.contrib.postgres.lookups import TrigramWordSimilar
+from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramWordSimilarity
+from django.db import connection, transaction
+from django.db.models import F, Q, Value, FloatField
+
+from .models import Product
+from .text_normalization import normalize_text
+
+# پیکربندی 'simple' چون PostgreSQL برای دری/پشتو stemmer ندارد
+SEARCH_CONFIG = 'simple'
+
+# وزن‌ها: نام (A) > توضیحات (B) > برچسب‌ها (C)، همه از ستون‌های یکسان‌سازی شده
+SEARCH_VECTOR_SQL = """
+    UPDATE bazarche_app_product AS p SET search_vector =
+        setweight(to_tsvector('simple', p.normalized_name), 'A') ||
+        setweight(to_tsvector('simple', p.normalized_description), 'B') ||
+        setweight(to_tsvector('simple', coalesce((
+            SELECT string_agg(t.normalized_name, ' ')
+            FROM bazarche_app_tag AS t
+            INNER JOIN bazarche_app_product_tags AS pt ON pt.tag_id = t.id
+            WHERE pt.product_id = p.id
+        ), '')), 'C')
+"""
+
+# کمتر از این تعداد نتیجه، views.search به جستجوی تقریبی می‌رود
+FUZZY_MIN_RESULTS = 5
+# آستانه شباهت کلمه‌ای pg_trgm (پیش‌فرض خود PostgreSQL برابر 0.6 است)
+FUZZY_SIMILARITY_THRESHOLD = 0.4
+
+# کاراکترهایی که در نحو tsquery معنی خاص دارند
+_TSQUERY_SPECIAL = re.compile(r"[&|!():*<>'\\]")
+
+
+def full_text_enabled():
+    return connection.vendor == 'postgresql'
+
+
+def refresh_search_vectors(product_ids=None):
+    """به‌روزرسانی search_vector محصولات داده شده (یا همه محصولات)"""
+    if not full_text_enabled():
+        return
+    with connection.cursor() as cursor:
+        if product_ids is None:
+            cursor.execute(SEARCH_VECTOR_SQL)
+        else:
+            product_ids = list(product_ids)
+            if product_ids:
+                cursor.execute(SEARCH_VECTOR_SQL + ' WHERE p.id = ANY(%s)', [product_ids])
+
+
+def build_prefix_query(query):
+    """تبدیل متن کاربر به tsquery با تطبیق پیشوندی هر کلمه: 'a:* & b:*'"""
+    terms = [_TSQUERY_SPECIAL.sub(' ', term).strip() for term in query.split()]
+    terms = [term for term in terms if term]
+    if not terms:
+        return None
+    return ' & '.join(f"'{term}':*" for term in terms)
+
+
+def search_products(queryset, query):
+    """
+    نقطه ورود مشترک جستجو برای home، search، product_list و load_more_products.
+    خروجی queryset فیلتر شده با annotation عددی search_rank است (بیشتر = مرتبط‌تر).
+    """
+    query = normalize_text(query)
+    if not query:
+        return queryset.annotate(search_rank=Value(0.0, output_field=FloatField()))
+
+    if full_text_enabled():
+        tsquery_text = build_prefix_query(query)
+        if tsquery_text is None:
+            return queryset.none()
+        search_query = SearchQuery(tsquery_text, config=SEARCH_CONFIG, search_type='raw')
+        return queryset.filter(search_vector=search_query).annotate(
+            search_rank=SearchRank(F('search_vector'), search_query)
+        )
+
+    # برچسب‌ها با زیرکوئری بررسی می‌شوند تا به DISTINCT روی join نیاز نباشد
+    tagged_ids = Product.objects.filter(tags__normalized_name__contains=query).values('pk')
+    return queryset.filter(
+        Q(normalized_name__contains=query) |
+        Q(normalized_description__contains=query) |
+        Q(pk__in=tagged_ids)
+    ).annotate(search_rank=Value(0.0, output_field=FloatField()))
+
+
+@contextmanager
+def fuzzy_search_session():
+    """
+    آستانه عملگر %> تنظیم نشست است، نه پارامتر کوئری. اینجا با set_config(..., true) فقط برای
+    تراکنش جاری تنظیم می‌شود تا به کوئری‌های بعدی همان اتصال (CONN_MAX_AGE، pgbouncer) نشت نکند.
+    کوئری‌های fuzzy_search_products باید داخل همین بلوک اجرا (evaluate) شوند.
+    """
+    with transaction.atomic():
+        if full_text_enabled():
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT set_config('pg_trgm.word_similarity_threshold', %s, true)",
+                    [str(FUZZY_SIMILARITY_THRESHOLD)],
+                )
+        yield
+
+
+def fuzzy_search_products(queryset, query):
+    """
+    جستجوی تقریبی (مقاوم به غلط تایپی) روی نام یکسان‌سازی شده محصول و برچسب‌هایش.
+    از عملگر %> استفاده می‌شود که با ایندکس‌های GIN gin_trgm_ops اجرا می‌شود (نه اسکن کامل جدول)؛
+    search_rank برابر شباهت کلمه‌ای متن جستجو با نام محصول است.
+    داخل fuzzy_search_session اجرا شود؛ بیرون از آن آستانه پیش‌فرض (0.6) اعمال می‌شود.
+    روی دیتابیس‌های غیر PostgreSQL نتیجه‌ای برنمی‌گرداند.
+    """
+    query = normalize_text(query)
+    if not query or not full_text_enabled():
+        return queryset.none()
+
+    tagged_ids = Product.objects.filter(
+        TrigramWordSimilar(F('tags__normalized_name'), Value(query))
+    ).values('pk')
+    return queryset.filter(
+        Q(TrigramWordSimilar(F('normalized_name'), Value(query))) |
+        Q(pk__in=tagged_ids)
+    ).annotate(search_rank=TrigramWordSimilarity(Value(query), 'normalized_name'))
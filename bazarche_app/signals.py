@@ -1,11 +1,20 @@
-from django.db.models.signals import pre_delete, post_save
+from django.db.models.signals import pre_save, pre_delete, post_save, post_delete, m2m_changed
 from django.dispatch import receiver
 from django.conf import settings
 import os
-from .models import Product, ProductImage, UserProfile, AdminAlert
+from django.db import transaction
+from .models import Product, ProductImage, UserProfile, AdminAlert, Tag, Category, City, ProductCounter, MainCategory, Advertisement, SimilarProduct, ProductComment
+from .counters import adjust_counts, apply_state_change, product_state
+from .reference_data import invalidate_snapshot
+from .cache_manager import CacheManager
+from .product_page import invalidate_category_pools
+from .search import refresh_search_vectors, full_text_enabled
+from .suggest import record_change
+from .similarity import queue_update as queue_similarity_update
+from .images import delete_derivatives
 from django.utils import timezone
 from datetime import timedelta
-from django.db.models import Count
+from django.db.models import Count, F
 
 @receiver(pre_delete, sender=Product)
 def delete_product_files(sender, instance, **kwargs):
@@ -18,6 +27,7 @@ def delete_product_files(sender, instance, **kwargs):
                 if os.path.exists(file_path):
                     os.remove(file_path)
                     print(f"عکس محصول حذف شد: {file_path}")
+            delete_derivatives(product_image)
     except Exception as e:
         print(f"خطا در حذف عکس‌های محصول: {e}")
 
@@ -30,6 +40,7 @@ def delete_product_image_file(sender, instance, **kwargs):
             if os.path.exists(file_path):
                 os.remove(file_path)
                 print(f"فایل عکس حذف شد: {file_path}")
+        delete_derivatives(instance)
     except Exception as e:
         print(f"خطا در حذف فایل عکس: {e}")
 
@@ -68,4 +79,246 @@ def delete_profile_avatar(sender, instance, **kwargs):
                 os.remove(file_path)
                 print(f"عکس پروفایل حذف شد: {file_path}")
     except Exception as e:
-        print(f"خطا در حذف عکس پروفایل: {e}") 
\ No newline at end of file
+        print(f"خطا در حذف عکس پروفایل: {e}") 
+
+@receiver(post_save, sender=Product)
+def update_product_search_vector(sender, instance, **kwargs):
+    """به‌روزرسانی بردار جستجوی محصول بعد از ذخیره"""
+    refresh_search_vectors([instance.pk])
+
+
+@receiver(m2m_changed, sender=Product.tags.through)
+def update_search_vector_on_tags_change(sender, instance, action, reverse, pk_set, **kwargs):
+    """برچسب‌ها بخشی از بردار جستجو هستند"""
+    if not full_text_enabled():
+        return
+    if reverse and action == 'pre_clear':
+        # سمت برچسب: بعد از clear دیگر نمی‌دانیم کدام محصولات متصل بودند
+        instance._cleared_product_ids = list(instance.product_set.values_list('pk', flat=True))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        refresh_search_vectors([instance.pk])
+    elif action == 'post_clear':
+        refresh_search_vectors(getattr(instance, '_cleared_product_ids', []))
+    else:
+        refresh_search_vectors(pk_set or [])
+
+
+@receiver(post_save, sender=Tag)
+def update_search_vector_on_tag_rename(sender, instance, created, **kwargs):
+    if created:
+        return
+    refresh_search_vectors(instance.product_set.values_list('pk', flat=True))
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def update_suggest_index(sender, instance, **kwargs):
+    """به‌روزرسانی افزایشی ایندکس پیشنهاد جستجو"""
+    record_change(sender._meta.model_name, instance.pk)
+
+
+COUNTER_FIELDS = {'is_approved', 'city', 'city_id', 'category', 'category_id'}
+
+
+@receiver(pre_save, sender=Product)
+def remember_product_counter_state(sender, instance, raw=False, update_fields=None, **kwargs):
+    """وضعیت قبلی محصول برای به‌روزرسانی شمارنده‌ها در post_save"""
+    if raw or instance.pk is None:
+        instance._counter_state = None
+        return
+    if update_fields is not None and not COUNTER_FIELDS.intersection(update_fields):
+        # تایید، شهر و دسته‌بندی تغییر نمی‌کنند
+        instance._counter_state = product_state(instance)
+        return
+    instance._counter_state = (
+        Product.objects.filter(pk=instance.pk).values_list('is_approved', 'city_id', 'category_id').first()
+    )
+
+
+@receiver(post_save, sender=Product)
+def update_product_counters(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    old_state = instance.__dict__.pop('_counter_state', None)
+    new_state = product_state(instance)
+    if old_state == new_state:
+        return
+    was_approved = bool(old_state and old_state[0])
+    tag_ids = instance.tags.values_list('pk', flat=True) if was_approved != new_state[0] and not created else ()
+    apply_state_change(old_state, new_state, tag_ids)
+
+
+@receiver(pre_delete, sender=Product)
+def remember_deleted_product_tags(sender, instance, **kwargs):
+    # ردیف‌های برچسب قبل از post_delete بدون m2m_changed حذف می‌شوند
+    instance._counter_tag_ids = list(instance.tags.values_list('pk', flat=True)) if instance.is_approved else []
+
+
+@receiver(post_delete, sender=Product)
+def update_counters_on_product_delete(sender, instance, **kwargs):
+    apply_state_change(product_state(instance), None, instance.__dict__.pop('_counter_tag_ids', ()))
+
+
+@receiver(m2m_changed, sender=Product.tags.through)
+def update_tag_counters(sender, instance, action, reverse, pk_set, **kwargs):
+    """تعداد محصولات تایید شده هر برچسب"""
+    if action in ('pre_remove', 'pre_clear'):
+        # فقط پیوندهایی که واقعا وجود دارند کم می‌شوند
+        if reverse:
+            linked = instance.product_set.filter(is_approved=True)
+            if action == 'pre_remove':
+                linked = linked.filter(pk__in=pk_set)
+            instance._tag_counter_deltas = {instance.pk: -linked.count()}
+        elif instance.is_approved:
+            linked = instance.tags.all()
+            if action == 'pre_remove':
+                linked = linked.filter(pk__in=pk_set)
+            instance._tag_counter_deltas = {tag_id: -1 for tag_id in linked.values_list('pk', flat=True)}
+        else:
+            instance._tag_counter_deltas = {}
+    elif action in ('post_remove', 'post_clear'):
+        adjust_counts('tag', instance.__dict__.pop('_tag_counter_deltas', {}))
+    elif action == 'post_add' and pk_set:
+        # در post_add فقط پیوندهای جدید در pk_set هستند
+        if reverse:
+            adjust_counts('tag', {instance.pk: Product.objects.filter(pk__in=pk_set, is_approved=True).count()})
+        elif instance.is_approved:
+            adjust_counts('tag', {tag_id: 1 for tag_id in pk_set})
+
+
+@receiver(post_delete, sender=City)
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=Tag)
+def delete_product_counter(sender, instance, **kwargs):
+    ProductCounter.objects.filter(dimension=sender._meta.model_name, object_id=instance.pk).delete()
+
+
+@receiver(post_save, sender=MainCategory)
+@receiver(post_delete, sender=MainCategory)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=City)
+@receiver(post_delete, sender=City)
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(post_save, sender=Advertisement)
+@receiver(post_delete, sender=Advertisement)
+def invalidate_reference_data(sender, **kwargs):
+    """نسخه کش شده داده‌های مرجع در همه پروسه‌ها باطل می‌شود"""
+    invalidate_snapshot()
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_category_cache(sender, **kwargs):
+    CacheManager.clear_categories_cache()
+
+
+@receiver(post_save, sender=City)
+@receiver(post_delete, sender=City)
+def invalidate_city_cache(sender, **kwargs):
+    CacheManager.clear_cities_cache()
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_product_page(sender, instance, **kwargs):
+    """باطل کردن مدل کش شده صفحه جزئیات محصول و مخزن محصولات مرتبط دسته‌بندی آن"""
+    CacheManager.invalidate_product_cache(instance.pk)
+    # مخزن دسته‌بندی قبلی (در صورت جابجایی) با انقضا یا فیلتر هنگام نمونه‌گیری اصلاح می‌شود
+    invalidate_category_pools(instance.category_id)
+
+
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+def invalidate_product_page_on_image_change(sender, instance, **kwargs):
+    CacheManager.invalidate_product_cache(instance.product_id)
+
+
+@receiver(m2m_changed, sender=Product.tags.through)
+def invalidate_product_page_on_tags_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        CacheManager.invalidate_product_cache(instance.pk)
+    else:
+        # برچسب به چند محصول اضافه/حذف شده
+        CacheManager.clear_product_details_cache()
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=City)
+@receiver(post_delete, sender=City)
+def invalidate_product_pages(sender, **kwargs):
+    """نام برچسب، دسته‌بندی یا شهر در صفحه محصولات زیادی نمایش داده می‌شود"""
+    CacheManager.clear_product_details_cache()
+
+
+# فیلدهایی که در بردار شباهت محصول هستند
+SIMILARITY_FIELDS = {'is_approved', 'normalized_name', 'normalized_description'}
+
+
+def schedule_similarity_update(product_ids, referrer_ids=()):
+    """
+    ثبت محصولات در صف محصولات مشابه بعد از commit تراکنش؛ محاسبه در process_similarity_queue
+    (پروسه جدا) انجام می‌شود، نه در درخواست
+    """
+    product_ids = list(product_ids)
+    referrer_ids = list(referrer_ids)
+    transaction.on_commit(lambda: queue_similarity_update(product_ids, referrer_ids))
+
+
+@receiver(post_save, sender=Product)
+def update_similar_products_on_save(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw or (update_fields is not None and not SIMILARITY_FIELDS.intersection(update_fields)):
+        return
+    schedule_similarity_update([instance.pk])
+
+
+@receiver(pre_delete, sender=Product)
+def remember_similar_referrers(sender, instance, **kwargs):
+    # ردیف‌هایی که به این محصول اشاره می‌کنند با حذف آن cascade می‌شوند
+    instance._similar_referrer_ids = list(
+        SimilarProduct.objects.filter(similar_id=instance.pk).values_list('product_id', flat=True)
+    )
+
+
+@receiver(post_delete, sender=Product)
+def update_similar_products_on_delete(sender, instance, **kwargs):
+    schedule_similarity_update([instance.pk], instance.__dict__.pop('_similar_referrer_ids', ()))
+
+
+@receiver(m2m_changed, sender=Product.tags.through)
+def update_similar_products_on_tags_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        schedule_similarity_update([instance.pk])
+    elif pk_set:
+        # clear از سمت برچسب (حذف برچسب) تا ساخت کامل بعدی صبر می‌کند
+        schedule_similarity_update(pk_set)
+
+
+@receiver(post_save, sender=ProductComment)
+def increment_comment_count(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        Product.objects.filter(pk=instance.product_id).update(comment_count=F('comment_count') + 1)
+    CacheManager.invalidate_product_cache(instance.product_id)
+
+
+@receiver(post_delete, sender=ProductComment)
+def decrement_comment_count(sender, instance, **kwargs):
+    Product.objects.filter(pk=instance.product_id, comment_count__gt=0).update(comment_count=F('comment_count') - 1)
+    CacheManager.invalidate_product_cache(instance.product_id)
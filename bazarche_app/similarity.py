@@ -0,0 +1,323 @@
+"""
+موتور «محصولات مشابه»: k نزدیک‌ترین همسایه هر محصول با شباهت کسینوسی TF-IDF
+
+هر محصول تایید شده یک بردار تُنُک (dict توکن -> وزن) از نام، توضیحات و برچسب‌های
+یکسان‌سازی شده دارد. امتیاز همسایه‌ها با یک ایندکس معکوس (توکن -> محصولات) جمع زده می‌شود،
+پس هر محصول فقط با محصولاتی که توکن مشترک دارند مقایسه می‌شود. نتیجه در جدول
+SimilarProduct ذخیره و در صفحه جزئیات با یک کوئری ایندکس‌دار خوانده می‌شود.
+
+- ساخت کامل: دستور rebuild_similar_products؛ بلوک‌های محصولات بین پروسه‌ها تقسیم می‌شوند.
+- به‌روزرسانی افزایشی: ذخیره/حذف محصول (signals) فقط شناسه‌ها را با queue_update در صف کش
+  ثبت می‌کند. دستور process_similarity_queue (پروسه جدا) با قفل process_queue را اجرا می‌کند:
+  همان محصولات و محصولاتی که همسایه آن‌ها بوده‌اند یا هستند دوباره محاسبه می‌شوند. چون فقط
+  دارنده قفل SimilarProduct را می‌نویسد، دو ذخیره همزمان تغییرات همدیگر را از بین نمی‌برند.
+- corpus (بردارها و ایندکس معکوس همه محصولات) فقط در حافظه همان پروسه است و در کش نوشته نمی‌شود:
+  worker آن را یک بار از دیتابیس می‌سازد و بعد از هر ساخت کامل (CORPUS_VERSION_KEY) دوباره.
+  IDF تا بارگذاری بعدی ثابت می‌ماند.
+"""
+import heapq
+import logging
+import math
+import re
+import time
+import uuid
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from multiprocessing import Pool
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+
+from .models import Product, SimilarProduct
+
+TOP_K = 8
+MIN_SCORE = 0.05
+# توکن‌هایی که در بیش از این نسبت محصولات هستند (مثل «فروش») نادیده گرفته می‌شوند
+MAX_DF_RATIO = 0.5
+MIN_MAX_DF = 50
+# وزن بخش‌های متن در بردار
+NAME_WEIGHT = 2
+TAG_WEIGHT = 2
+DESCRIPTION_WEIGHT = 1
+BLOCK_SIZE = 500
+# زمان آخرین ساخت کامل؛ corpus پروسه‌های دیگر با تغییر آن دوباره ساخته می‌شود
+CORPUS_VERSION_KEY = 'similarity:corpus:version'
+# صف شناسه‌های تغییر کرده: شماره ترتیبی + یک کلید برای هر ثبت (مثل suggest.record_change)
+QUEUE_SEQ_KEY = 'similarity:queue:seq'
+QUEUE_ITEM_KEY = 'similarity:queue:{}'
+QUEUE_DONE_KEY = 'similarity:queue:done'
+QUEUE_TIMEOUT = 60 * 60 * 24
+# حداکثر ثبت‌هایی که در یک اجرای process_queue خوانده می‌شوند
+QUEUE_BATCH = 1000
+# قفل نوشتن corpus و SimilarProduct (ساخت کامل هم آن را می‌گیرد)
+LOCK_KEY = 'similarity:lock'
+LOCK_TIMEOUT = 60 * 60
+
+logger = logging.getLogger(__name__)
+
+_TOKEN = re.compile(r'\w{2,}')
+
+# ایندکس در پروسه‌های کارگر ساخت کامل
+_worker_corpus = None
+# corpus به‌روزرسانی افزایشی در همین پروسه و نسخه ساخت کاملی که بر اساس آن ساخته شده
+_corpus = None
+_corpus_version = None
+
+
+def product_documents(product_ids=None):
+    """{product_id: Counter توکن‌ها} برای محصولات تایید شده"""
+    products = Product.objects.filter(is_approved=True)
+    if product_ids is not None:
+        products = products.filter(pk__in=product_ids)
+    documents = {}
+    for pk, name, description in products.values_list('pk', 'normalized_name', 'normalized_description').iterator(chunk_size=2000):
+        tokens = Counter()
+        for token in _TOKEN.findall(name):
+            tokens[token] += NAME_WEIGHT
+        for token in _TOKEN.findall(description):
+            tokens[token] += DESCRIPTION_WEIGHT
+        documents[pk] = tokens
+    tag_rows = Product.tags.through.objects.filter(product_id__in=documents).values_list('product_id', 'tag__normalized_name')
+    for product_id, tag_name in tag_rows.iterator(chunk_size=2000):
+        for token in _TOKEN.findall(tag_name or ''):
+            documents[product_id][token] += TAG_WEIGHT
+    return documents
+
+
+def vectorize(tokens, idf, default_idf):
+    """وزن TF زیرخطی × IDF، با طول واحد"""
+    vector = {
+        token: (1 + math.log(count)) * idf.get(token, default_idf)
+        for token, count in tokens.items()
+        if idf.get(token, default_idf) > 0
+    }
+    norm = math.sqrt(sum(weight * weight for weight in vector.values()))
+    if not norm:
+        return {}
+    return {token: weight / norm for token, weight in vector.items()}
+
+
+def build_corpus(documents):
+    """IDF، بردارها و ایندکس معکوس کل محصولات"""
+    n_docs = len(documents)
+    df = Counter()
+    for tokens in documents.values():
+        df.update(tokens.keys())
+    max_df = max(MIN_MAX_DF, int(MAX_DF_RATIO * n_docs))
+    # IDF هموار؛ توکن‌های خیلی رایج وزن صفر می‌گیرند و در ایندکس نمی‌آیند
+    idf = {
+        token: (math.log((1 + n_docs) / (1 + count)) + 1 if count <= max_df else 0.0)
+        for token, count in df.items()
+    }
+    corpus = {
+        'idf': idf,
+        'default_idf': math.log(1 + n_docs) + 1,
+        'vectors': {},
+        'postings': defaultdict(dict),
+    }
+    for product_id, tokens in documents.items():
+        set_vector(corpus, product_id, tokens)
+    return corpus
+
+
+def set_vector(corpus, product_id, tokens):
+    """جایگزینی بردار یک محصول در بردارها و ایندکس معکوس (tokens=None: حذف)"""
+    for token in corpus['vectors'].pop(product_id, {}):
+        corpus['postings'][token].pop(product_id, None)
+    if not tokens:
+        return
+    vector = vectorize(tokens, corpus['idf'], corpus['default_idf'])
+    corpus['vectors'][product_id] = vector
+    for token, weight in vector.items():
+        corpus['postings'][token][product_id] = weight
+
+
+def nearest_neighbours(corpus, product_id, k=TOP_K):
+    """[(similar_id, score), ...] مرتب از شبیه‌ترین"""
+    scores = defaultdict(float)
+    postings = corpus['postings']
+    for token, weight in corpus['vectors'].get(product_id, {}).items():
+        for other_id, other_weight in postings.get(token, {}).items():
+            scores[other_id] += weight * other_weight
+    scores.pop(product_id, None)
+    return [
+        (other_id, score)
+        for other_id, score in heapq.nlargest(k, scores.items(), key=lambda item: (item[1], -item[0]))
+        if score >= MIN_SCORE
+    ]
+
+
+def _init_worker(corpus):
+    global _worker_corpus
+    _worker_corpus = corpus
+
+
+def _neighbours_for_block(product_ids):
+    return [(product_id, nearest_neighbours(_worker_corpus, product_id)) for product_id in product_ids]
+
+
+def save_neighbours(results):
+    """جایگزینی ردیف‌های SimilarProduct محصولات داده شده"""
+    results = list(results)
+    rows = [
+        SimilarProduct(product_id=product_id, similar_id=similar_id, score=score, rank=rank)
+        for product_id, neighbours in results
+        for rank, (similar_id, score) in enumerate(neighbours)
+    ]
+    with transaction.atomic():
+        SimilarProduct.objects.filter(product_id__in=[product_id for product_id, _ in results]).delete()
+        SimilarProduct.objects.bulk_create(rows, batch_size=1000)
+
+
+@contextmanager
+def corpus_lock():
+    """قفل بین پروسه‌ها با cache.add (SET NX)؛ مقدار: آیا قفل گرفته شد"""
+    token = uuid.uuid4().hex
+    acquired = cache.add(LOCK_KEY, token, LOCK_TIMEOUT)
+    try:
+        yield acquired
+    finally:
+        if acquired and cache.get(LOCK_KEY) == token:
+            cache.delete(LOCK_KEY)
+
+
+def rebuild_all(processes=None, block_size=BLOCK_SIZE, progress=None):
+    """ساخت کامل جدول همسایه‌ها؛ خروجی: تعداد محصولات"""
+    with corpus_lock() as acquired:
+        if not acquired:
+            raise RuntimeError('ساخت یا به‌روزرسانی دیگری در حال اجراست.')
+        # ثبت‌های صف تا اینجا در همین ساخت کامل دیده می‌شوند
+        queued = cache.get(QUEUE_SEQ_KEY) or 0
+        corpus = build_corpus(product_documents())
+        product_ids = sorted(corpus['vectors'])
+        blocks = [product_ids[i:i + block_size] for i in range(0, len(product_ids), block_size)]
+
+        results = []
+
+        def collect(block_results):
+            for block in block_results:
+                results.extend(block)
+                if progress:
+                    progress(len(results), len(product_ids))
+
+        if processes == 1 or len(blocks) <= 1:
+            _init_worker(corpus)
+            collect(map(_neighbours_for_block, blocks))
+        else:
+            with Pool(processes, initializer=_init_worker, initargs=(corpus,)) as pool:
+                collect(pool.imap(_neighbours_for_block, blocks))
+
+        with transaction.atomic():
+            # همسایه‌های محصولات حذف شده یا رد شده هم پاک می‌شوند
+            SimilarProduct.objects.all().delete()
+            save_neighbours(results)
+        version = time.time_ns()
+        cache.set(CORPUS_VERSION_KEY, version, None)
+        cache.set(QUEUE_DONE_KEY, queued, None)
+        set_corpus(corpus, version)
+    return len(product_ids)
+
+
+def set_corpus(corpus, version):
+    global _corpus, _corpus_version
+    _corpus, _corpus_version = corpus, version
+
+
+def get_corpus():
+    """corpus حافظه این پروسه؛ بعد از ساخت کامل در پروسه دیگر دوباره از دیتابیس ساخته می‌شود (None: ساخت کامل انجام نشده)"""
+    version = cache.get(CORPUS_VERSION_KEY)
+    # کلید نسخه پاک شده (eviction): corpus فعلی معتبر می‌ماند
+    if _corpus is not None and version in (None, _corpus_version):
+        return _corpus
+    if version is None and not SimilarProduct.objects.exists():
+        return None
+    set_corpus(build_corpus(product_documents()), version)
+    return _corpus
+
+
+def queue_update(product_ids, referrer_ids=()):
+    """
+    ثبت محصولات ایجاد/ویرایش/حذف شده برای process_queue؛ تنها کار مسیر درخواست (یک INCR و یک SET).
+    referrer_ids: محصولاتی که باید حتما دوباره محاسبه شوند (مثلا همسایه‌های یک محصول حذف شده)
+    """
+    cache.add(QUEUE_SEQ_KEY, 0, None)
+    try:
+        seq = cache.incr(QUEUE_SEQ_KEY)
+    except ValueError:
+        # کلید بین add و incr حذف شده؛ تا ساخت کامل بعدی منتظر می‌ماند
+        return
+    cache.set(QUEUE_ITEM_KEY.format(seq), (list(product_ids), list(referrer_ids)), QUEUE_TIMEOUT)
+
+
+def process_queue():
+    """
+    اعمال ثبت‌های صف با قفل. خروجی: شناسه محصولاتی که لیست همسایه‌هایشان دوباره محاسبه شد
+    (مجموعه خالی اگر صف خالی است یا پروسه دیگری قفل را دارد، None اگر ساخت کامل انجام نشده؛
+    در این حالت صف دست نمی‌خورد و ساخت کامل بعدی همه ثبت‌ها را پوشش می‌دهد)
+    """
+    with corpus_lock() as acquired:
+        if not acquired:
+            return set()
+        corpus = get_corpus()
+        if corpus is None:
+            logger.warning('ساخت کامل محصولات مشابه انجام نشده؛ صف تا اجرای rebuild_similar_products می‌ماند')
+            return None
+        queued = cache.get(QUEUE_SEQ_KEY) or 0
+        done = cache.get(QUEUE_DONE_KEY) or 0
+        if done > queued:
+            # کش پاک شده و شمارنده از صفر شروع شده
+            done = 0
+        last = min(queued, done + QUEUE_BATCH)
+        if last == done:
+            return set()
+        keys = [QUEUE_ITEM_KEY.format(seq) for seq in range(done + 1, last + 1)]
+        items = cache.get_many(keys)
+        if len(items) < len(keys):
+            logger.warning('%d ثبت صف محصولات مشابه منقضی شده؛ تا ساخت کامل بعدی قدیمی می‌مانند', len(keys) - len(items))
+
+        product_ids, referrer_ids = set(), set()
+        for ids, referrers in items.values():
+            product_ids.update(ids)
+            referrer_ids.update(referrers)
+        affected = apply_updates(corpus, product_ids, referrer_ids) if product_ids else set()
+        cache.set(QUEUE_DONE_KEY, last, None)
+        cache.delete_many(keys)
+
+    if affected:
+        # محصولات مشابه بخشی از مدل کش شده صفحه هستند
+        from .cache_manager import CacheManager
+        cache.delete_many([CacheManager.get_product_detail_cache_key(product_id) for product_id in affected])
+    return affected
+
+
+def update_products(product_ids, referrer_ids=()):
+    """ثبت و اعمال فوری (دستور rebuild_similar_products --product)؛ خروجی مثل process_queue"""
+    queue_update(product_ids, referrer_ids)
+    return process_queue()
+
+
+def apply_updates(corpus, product_ids, referrer_ids=()):
+    """
+    به‌روزرسانی افزایشی corpus (در حافظه) و SimilarProduct؛ فقط با corpus_lock (process_queue) صدا زده شود.
+    خروجی: شناسه محصولاتی که لیست همسایه‌هایشان دوباره محاسبه شد
+    """
+    product_ids = set(product_ids)
+    documents = product_documents(product_ids)
+    for product_id in product_ids:
+        set_vector(corpus, product_id, documents.get(product_id))
+
+    # محصولاتی که قبلا این محصول را همسایه داشته‌اند یا حالا داشتن آن برایشان محتمل است
+    affected = set(product_ids) | set(referrer_ids)
+    affected.update(
+        SimilarProduct.objects.filter(Q(similar_id__in=product_ids) | Q(product_id__in=product_ids))
+        .values_list('product_id', flat=True)
+    )
+    for product_id in product_ids:
+        affected.update(similar_id for similar_id, _ in nearest_neighbours(corpus, product_id, k=TOP_K * 4))
+
+    # محصول حذف شده ردیفی ندارد که ذخیره شود
+    existing = set(Product.objects.filter(pk__in=affected).values_list('pk', flat=True))
+    results = [(product_id, nearest_neighbours(corpus, product_id)) for product_id in affected & existing]
+    save_neighbours(results)
+    return affected
@@ -0,0 +1,102 @@
+// BlurHash placeholder for product images (encoded server-side in bazarche_app/blurhash.py).
+// Every element with data-blurhash gets a blurred 32x32 background until its <img> loads on top of it.
+(function () {
+    const CHARACTERS = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz#$%*+,-.:;=?@[]^_{|}~';
+    const SIZE = 32;
+
+    function decode83(str) {
+        let value = 0;
+        for (const c of str) {
+            value = value * 83 + CHARACTERS.indexOf(c);
+        }
+        return value;
+    }
+
+    function sRGBToLinear(value) {
+        const v = value / 255;
+        return v <= 0.04045 ? v / 12.92 : Math.pow((v + 0.055) / 1.055, 2.4);
+    }
+
+    function linearToSRGB(value) {
+        const v = Math.max(0, Math.min(1, value));
+        return v <= 0.0031308 ? Math.round(v * 12.92 * 255) : Math.round((1.055 * Math.pow(v, 1 / 2.4) - 0.055) * 255);
+    }
+
+    function signPow(value, exp) {
+        return Math.sign(value) * Math.pow(Math.abs(value), exp);
+    }
+
+    function decode(hash, width, height) {
+        const sizeFlag = decode83(hash[0]);
+        const numY = Math.floor(sizeFlag / 9) + 1;
+        const numX = (sizeFlag % 9) + 1;
+        if (hash.length !== 4 + 2 * numX * numY) return null;
+
+        const maximum = (decode83(hash[1]) + 1) / 166;
+        const colors = [];
+        for (let i = 0; i < numX * numY; i++) {
+            if (i === 0) {
+                const value = decode83(hash.substring(2, 6));
+                colors.push([sRGBToLinear(value >> 16), sRGBToLinear((value >> 8) & 255), sRGBToLinear(value & 255)]);
+            } else {
+                const value = decode83(hash.substring(4 + i * 2, 6 + i * 2));
+                colors.push([
+                    signPow((Math.floor(value / 361) - 9) / 9, 2) * maximum,
+                    signPow((Math.floor(value / 19) % 19 - 9) / 9, 2) * maximum,
+                    signPow((value % 19 - 9) / 9, 2) * maximum,
+                ]);
+            }
+        }
+
+        const pixels = new Uint8ClampedArray(width * height * 4);
+        for (let y = 0; y < height; y++) {
+            for (let x = 0; x < width; x++) {
+                let r = 0, g = 0, b = 0;
+                for (let j = 0; j < numY; j++) {
+                    for (let i = 0; i < numX; i++) {
+                        const basis = Math.cos(Math.PI * x * i / width) * Math.cos(Math.PI * y * j / height);
+                        const color = colors[i + j * numX];
+                        r += color[0] * basis;
+                        g += color[1] * basis;
+                        b += color[2] * basis;
+                    }
+                }
+                const offset = 4 * (x + y * width);
+                pixels[offset] = linearToSRGB(r);
+                pixels[offset + 1] = linearToSRGB(g);
+                pixels[offset + 2] = linearToSRGB(b);
+                pixels[offset + 3] = 255;
+            }
+        }
+        return pixels;
+    }
+
+    function toDataURL(hash) {
+        const pixels = decode(hash, SIZE, SIZE);
+        if (!pixels) return null;
+        const canvas = document.createElement('canvas');
+        canvas.width = SIZE;
+        canvas.height = SIZE;
+        const context = canvas.getContext('2d');
+        context.putImageData(new ImageData(pixels, SIZE, SIZE), 0, 0);
+        return canvas.toDataURL();
+    }
+
+    function apply(root) {
+        (root || document).querySelectorAll('[data-blurhash]:not([data-blurhash-painted])').forEach(function (element) {
+            element.setAttribute('data-blurhash-painted', '');
+            try {
+                const url = toDataURL(element.dataset.blurhash);
+                if (url) {
+                    element.style.backgroundImage = 'url(' + url + ')';
+                    element.style.backgroundSize = 'cover';
+                }
+            } catch (e) {
+                // invalid hash: the dominant background color stays
+            }
+        });
+    }
+
+    window.bazarcheBlurhash = { decode: decode, apply: apply };
+    document.addEventListener('DOMContentLoaded', function () { apply(document); });
+})();
@@ -0,0 +1,239 @@
+"""
+پیشنهاد هنگام تایپ (autocomplete) برای جعبه جستجو
+
+برای هر زبان یک آرایه مرتب از کلیدهای یکسان‌سازی شده (نام کامل و هر کلمه آن) در حافظه
+هر پروسه نگه داشته می‌شود و جستجوی پیشوندی با bisect انجام می‌شود، بدون کوئری دیتابیس.
+
+تغییرات محصول/برچسب/دسته‌بندی (از signals) با یک شماره نسخه مشترک در کش ثبت می‌شوند؛
+هر پروسه در درخواست بعدی فقط همان ردیف‌های تغییر کرده را دوباره می‌خواند.
+
+ساخت کامل ایندکس (خواندن همه محصولات، برچسب‌ها و دسته‌بندی‌ها) هیچ‌وقت در درخواست انجام
+نمی‌شود: warm_up هنگام راه‌اندازی (wsgi/asgi) و schedule_build در یک thread پس‌زمینه آن را
+می‌سازند و تا پایان کار ایندکس قبلی (یا برای پروسه تازه، نتیجه خالی) برگردانده می‌شود.
+بازسازی دوره‌ای، سابقه تغییرات منقضی شده و پاک شدن کش هم فقط همین بازسازی پس‌زمینه را
+شروع می‌کنند. SUGGEST_BACKGROUND_BUILD=False ساخت را همزمان می‌کند (تست‌ها).
+"""
+import heapq
+import logging
+import threading
+import time
+from bisect import bisect_left, insort
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+
+from .models import Product, Tag, Category
+from .text_normalization import normalize_text
+
+logger = logging.getLogger(__name__)
+
+SUGGEST_LANGUAGES = ('fa', 'ps', 'en')
+VERSION_KEY = 'suggest:version'
+CHANGE_KEY = 'suggest:change:{}'
+# سابقه تغییرات در کش؛ پروسه‌ای که بیشتر از این عقب باشد کامل بازسازی می‌کند
+CHANGE_TIMEOUT = 60 * 60
+MAX_INCREMENTAL_CHANGES = 500
+# بازسازی کامل دوره‌ای (در پس‌زمینه) برای تغییراتی که از signals عبور نمی‌کنند (مثل queryset.update)
+REBUILD_INTERVAL = 60 * 15
+# حداکثر کلیدهایی که برای یک پیشوند بررسی می‌شوند (پیشوندهای یک حرفی)
+MAX_SCAN = 2000
+
+# ترتیب نوع‌ها در نتایج: دسته‌بندی -> برچسب -> محصول
+KIND_ORDER = {'category': 0, 'tag': 1, 'product': 2}
+MODELS = {'category': Category, 'tag': Tag, 'product': Product}
+
+
+def _display_name(obj, lang):
+    return getattr(obj, f'name_{lang}', None) or obj.name_fa or ''
+
+
+def _item_keys(text):
+    """کلیدهای یک نام: نام کامل و بقیه نام از ابتدای هر کلمه"""
+    words = normalize_text(text).split()
+    return {' '.join(words[i:]) for i in range(len(words))}
+
+
+def _live_queryset(kind):
+    if kind == 'product':
+        return Product.objects.filter(is_approved=True).only('pk', 'name_fa', 'name_ps', 'name_en', 'listing_rank')
+    return MODELS[kind].objects.only('pk', 'name_fa', 'name_ps', 'name_en')
+
+
+class SuggestIndex:
+    """آرایه مرتب (key, kind, pk) برای یک زبان به همراه متن نمایشی هر مورد"""
+
+    def __init__(self, lang):
+        self.lang = lang
+        self.keys = []
+        self.items = {}
+        self.version = 0
+        self.built_at = 0.0
+
+    def build(self, version):
+        keys = []
+        items = {}
+        for kind in MODELS:
+            for obj in _live_queryset(kind).iterator(chunk_size=2000):
+                text = _display_name(obj, self.lang)
+                item_keys = _item_keys(text)
+                if not item_keys:
+                    continue
+                items[(kind, obj.pk)] = (text, getattr(obj, 'listing_rank', 0), item_keys, normalize_text(text))
+                keys.extend((key, kind, obj.pk) for key in item_keys)
+        keys.sort()
+        self.keys, self.items = keys, items
+        self.version = version
+        self.built_at = time.monotonic()
+
+    def _remove(self, kind, pk):
+        item = self.items.pop((kind, pk), None)
+        if item is None:
+            return
+        for key in item[2]:
+            position = bisect_left(self.keys, (key, kind, pk))
+            if position < len(self.keys) and self.keys[position] == (key, kind, pk):
+                del self.keys[position]
+
+    def apply_changes(self, changes, version):
+        """به‌روزرسانی افزایشی برای (kind, pk) های تغییر کرده"""
+        by_kind = {}
+        for kind, pk in changes:
+            by_kind.setdefault(kind, set()).add(pk)
+        for kind, pks in by_kind.items():
+            fresh = {obj.pk: obj for obj in _live_queryset(kind).filter(pk__in=pks)}
+            for pk in pks:
+                self._remove(kind, pk)
+                obj = fresh.get(pk)
+                if obj is None:
+                    # حذف شده یا دیگر تایید شده نیست
+                    continue
+                text = _display_name(obj, self.lang)
+                item_keys = _item_keys(text)
+                if not item_keys:
+                    continue
+                self.items[(kind, pk)] = (text, getattr(obj, 'listing_rank', 0), item_keys, normalize_text(text))
+                for key in item_keys:
+                    insort(self.keys, (key, kind, pk))
+        self.version = version
+
+    def lookup(self, prefix, limit):
+        prefix = normalize_text(prefix)
+        if not prefix:
+            return []
+        best = {}
+        position = bisect_left(self.keys, (prefix,))
+        for key, kind, pk in self.keys[position:position + MAX_SCAN]:
+            if not key.startswith(prefix):
+                break
+            item = self.items.get((kind, pk))
+            if item is None:
+                # همزمان توسط apply_changes حذف شده
+                continue
+            text, weight, _, full_key = item
+            # تطبیق از ابتدای نام بر تطبیق از وسط نام مقدم است
+            score = (KIND_ORDER[kind], key != full_key, -weight, len(text))
+            if (kind, pk) not in best or score < best[(kind, pk)][0]:
+                best[(kind, pk)] = (score, kind, pk, text)
+        return [
+            {'type': kind, 'id': pk, 'text': text}
+            for _, kind, pk, text in heapq.nsmallest(limit, best.values())
+        ]
+
+
+_indexes = {}
+# زبان‌هایی که ساخت کامل آن‌ها در جریان است
+_building = set()
+_lock = threading.Lock()
+
+
+def record_change(kind, pk):
+    """ثبت تغییر یک مورد برای به‌روزرسانی افزایشی ایندکس همه پروسه‌ها"""
+    cache.add(VERSION_KEY, 0, None)
+    try:
+        version = cache.incr(VERSION_KEY)
+    except ValueError:
+        # کلید بین add و incr حذف شده؛ پروسه‌ها در درخواست بعد بازسازی می‌کنند
+        return
+    cache.set(CHANGE_KEY.format(version), (kind, pk), CHANGE_TIMEOUT)
+
+
+def background_build_enabled():
+    return getattr(settings, 'SUGGEST_BACKGROUND_BUILD', True)
+
+
+def _build(lang, version):
+    try:
+        index = SuggestIndex(lang)
+        index.build(version)
+        with _lock:
+            _indexes[lang] = index
+    except Exception:
+        logger.exception('ساخت ایندکس پیشنهاد %s ناموفق بود', lang)
+    finally:
+        with _lock:
+            _building.discard(lang)
+
+
+def _build_in_thread(lang, version):
+    try:
+        _build(lang, version)
+    finally:
+        # اتصال‌های دیتابیس همین thread
+        connections.close_all()
+
+
+def schedule_build(lang):
+    """ساخت کامل ایندکس یک زبان، در thread پس‌زمینه؛ اگر در جریان است کاری نمی‌کند"""
+    # نسخه قبل از خواندن ردیف‌ها؛ تغییرات حین ساخت بعدا به صورت افزایشی دوباره اعمال می‌شوند
+    version = cache.get(VERSION_KEY) or 0
+    with _lock:
+        if lang in _building:
+            return
+        _building.add(lang)
+    if not background_build_enabled():
+        _build(lang, version)
+        return
+    threading.Thread(
+        target=_build_in_thread, args=(lang, version), name=f'suggest-build-{lang}', daemon=True
+    ).start()
+
+
+def warm_up():
+    """ساخت ایندکس همه زبان‌ها هنگام راه‌اندازی پروسه وب"""
+    for lang in SUGGEST_LANGUAGES:
+        schedule_build(lang)
+
+
+def get_index(lang):
+    """
+    ایندکس زبان داده شده با تغییرات افزایشی اعمال شده، یا None اگر هنوز ساخته نشده است.
+    در درخواست فقط تغییرات record_change خوانده می‌شوند (یک کوئری برای هر نوع).
+    """
+    if lang not in SUGGEST_LANGUAGES:
+        lang = 'fa'
+    version = cache.get(VERSION_KEY) or 0
+    index = _indexes.get(lang)
+    if index is None:
+        schedule_build(lang)
+        # در حالت همزمان همین حالا ساخته شده است
+        return _indexes.get(lang)
+
+    rebuild = time.monotonic() - index.built_at >= REBUILD_INTERVAL or index.version > version
+    if index.version < version:
+        with _lock:
+            missing = range(index.version + 1, version + 1)
+            changes = cache.get_many([CHANGE_KEY.format(v) for v in missing]) if 0 < len(missing) <= MAX_INCREMENTAL_CHANGES else {}
+            if missing and len(changes) == len(missing):
+                index.apply_changes(changes.values(), version)
+            elif missing:
+                # سابقه ناقص: تا پایان بازسازی همین ایندکس کمی قدیمی برگردانده می‌شود
+                rebuild = True
+    if rebuild:
+        schedule_build(lang)
+    return index
+
+
+def get_suggestions(prefix, lang, limit=8):
+    index = get_index(lang)
+    return index.lookup(prefix, limit) if index is not None else []
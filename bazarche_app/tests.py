@@ -1,7 +1,39 @@
-from django.test import TestCase, Client
+import asyncio
+import importlib
+import threading
+import json
+import os
+import shutil
+import tempfile
+from contextlib import redirect_stdout
+from io import BytesIO, StringIO
+from PIL import Image
+from django.core.files.uploadedfile import SimpleUploadedFile
+from unittest import skipUnless
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, Client, override_settings
 from django.urls import reverse
-from .models import Product, Category, Tag
+from django.apps import apps as django_apps
+from .models import Product, ProductImage, ProductComment, Conversation, Notification, Broadcast, BroadcastRead, Category, Tag, City, UserFeedback, JobAd
+from .cache_manager import CacheManager
+from .counters import get_counts, reconcile_counts
+from .facets import facet_rows, count_facets
+from .reference_data import get_snapshot
+from .pagination import FEED_ORDERING
+from .search import search_products, FUZZY_SIMILARITY_THRESHOLD
+from .similarity import rebuild_all, process_queue, set_corpus, QUEUE_DONE_KEY
+from . import suggest
+from .push import publish, user_channel, check_config
+from .notifications import notify, broadcast, unread_count
+from .images import generate_derivatives
+from . import image_pool
+from .image_pool import schedule_derivatives
+from django.conf import settings
+from .text_normalization import normalize_text
 from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.utils import timezone
 
 class ProductModelTest(TestCase):
     def setUp(self):
@@ -85,3 +117,826 @@ class AdminAccessTest(TestCase):
     def test_manage_categories_access(self):
         response = self.client.get(reverse('manage_categories'))
         self.assertEqual(response.status_code, 200)
+
+class LoadMoreProductsCursorTest(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.category = Category.objects.create(name_fa='دسته تست')
+        self.city = City.objects.create(name='کابل')
+        for i in range(45):
+            Product.objects.create(
+                name_fa=f'محصول {i}',
+                category=self.category,
+                city=self.city,
+                price_range='0-1000',
+                is_featured=(i % 7 == 0),
+                is_discounted=(i % 5 == 0),
+                discount_price=10 if i % 5 == 0 else None,
+                price=100,
+                is_approved=True
+            )
+
+    def test_cursor_walks_whole_feed_without_duplicates(self):
+        url = reverse('app:load_more_products')
+        seen = []
+        response = self.client.get(url).json()
+        seen += [p['id'] for p in response['products']]
+        while response['has_next']:
+            response = self.client.get(url, {'cursor': response['next_cursor']}).json()
+            seen += [p['id'] for p in response['products']]
+        expected = list(Product.objects.filter(is_approved=True).order_by(*FEED_ORDERING).values_list('id', flat=True))
+        self.assertEqual(seen, expected)
+        self.assertNotIn('total_products', response)
+
+    def test_cursor_with_equal_timestamps(self):
+        # مقایسه سطری روی created_at برابر باید به id برسد (و datetime درست به دیتابیس داده شود)
+        Product.objects.update(created_at=timezone.now())
+        url = reverse('app:load_more_products')
+        response = self.client.get(url).json()
+        seen = [p['id'] for p in response['products']]
+        while response['has_next']:
+            response = self.client.get(url, {'cursor': response['next_cursor']}).json()
+            seen += [p['id'] for p in response['products']]
+        expected = list(Product.objects.filter(is_approved=True).order_by(*FEED_ORDERING).values_list('id', flat=True))
+        self.assertEqual(seen, expected)
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse('app:load_more_products'), {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_total_only_on_request(self):
+        response = self.client.get(reverse('app:load_more_products'), {'include_total': '1'}).json()
+        self.assertEqual(response['total_products'], 45)
+
+class PriorityOrderingTest(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.category = Category.objects.create(name_fa='دسته تست')
+        self.city = City.objects.create(name='کابل')
+        flags = [(True, True, False), (False, False, True), (True, False, False), (False, True, True), (False, False, False)]
+        for i, (featured, suggested, discounted) in enumerate(flags * 5):
+            Product.objects.create(
+                name_fa=f'محصول {i}',
+                category=self.category,
+                city=self.city,
+                price_range='0-1000',
+                price=100,
+                discount_price=10 if discounted else None,
+                is_featured=featured,
+                is_suggested=suggested,
+                is_discounted=discounted,
+                is_approved=True
+            )
+
+    def test_category_detail_buckets_and_counts(self):
+        response = self.client.get(reverse('app:category_detail', args=[self.category.id]))
+        self.assertEqual(response.context['total_products'], 25)
+        self.assertEqual(response.context['featured_count'], 10)
+        self.assertEqual(response.context['suggested_count'], 5)
+        self.assertEqual(response.context['discounted_count'], 5)
+        page = list(response.context['products'])
+        self.assertEqual(len(page), 20)
+        keys = [(not p.is_featured, not p.is_suggested, not p.is_discounted, -p.created_at.timestamp(), -p.id) for p in page]
+        self.assertEqual(keys, sorted(keys))
+
+    def test_listing_rank_follows_flags(self):
+        product = Product.objects.filter(is_featured=False, is_suggested=False, is_discounted=False).first()
+        self.assertEqual(product.listing_rank, 0)
+        product.is_suggested = True
+        product.save(update_fields=['is_suggested'])
+        product.refresh_from_db()
+        self.assertEqual(product.listing_rank, 2)
+        Product.objects.filter(pk=product.pk).update(is_featured=True)
+        product.refresh_from_db()
+        self.assertEqual(product.listing_rank, 6)
+
+class ProductCardQueryCountTest(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.category = Category.objects.create(name_fa='دسته تست')
+        self.city = City.objects.create(name='کابل')
+        tag = Tag.objects.create(name_fa='برچسب')
+        for i in range(25):
+            product = Product.objects.create(
+                name_fa=f'محصول {i}',
+                category=self.category,
+                city=self.city,
+                price_range='0-1000',
+                is_approved=True
+            )
+            product.tags.add(tag)
+            ProductImage.objects.create(product=product, image=f'product_images/p{i}.jpg')
+
+    def test_json_feed_is_a_single_query(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('app:load_more_products'))
+        products = response.json()['products']
+        self.assertEqual(len(products), 20)
+        self.assertTrue(all(p['image'].endswith('.jpg') for p in products))
+
+    def test_category_page_query_count_does_not_depend_on_cards(self):
+        # اولین درخواست داده‌های مرجع (ناوبری) را کش می‌کند
+        self.client.get(reverse('app:category_detail', args=[self.category.id]))
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse('app:category_detail', args=[self.category.id]))
+        self.assertEqual(len(response.context['products']), 20)
+
+    def test_home_reads_categories_and_cities_from_snapshot(self):
+        self.client.get(reverse('app:home'))
+        # فقط COUNT، صفحه محصولات و برچسب‌های آن‌ها؛ نه دسته‌بندی یا شهر
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('app:home'), {'city_id': str(self.city.id)})
+        self.assertEqual(response.context['selected_city'].id, self.city.id)
+        self.assertEqual([c.id for c in response.context['main_categories']], [self.category.id])
+
+class TextNormalizationTest(TestCase):
+    def test_normalize_text(self):
+        self.assertEqual(normalize_text('كتاب‌هاي  عربيِ ۱۲٣ Phone'), 'کتاب های عربی 123 phone')
+        self.assertEqual(normalize_text(None), '')
+
+    def test_search_matches_arabic_letters_and_digits(self):
+        city = City.objects.create(name='کابل')
+        category = Category.objects.create(name_fa='دسته')
+        Product.objects.create(
+            name_fa='گوشی سامسونگ ۱۲', category=category, city=city,
+            price_range='0-1000', is_approved=True
+        )
+        results = search_products(Product.objects.filter(is_approved=True), 'گوشي سامسونگ ١٢')
+        self.assertEqual(results.count(), 1)
+
+    def test_partial_save_keeps_normalized_text_in_sync(self):
+        job = JobAd.objects.create(title='راننده', description='تمام وقت', contact='0700')
+        job.title = 'راننده تاكسي'
+        job.save(update_fields=['title'])
+        self.assertEqual(JobAd.objects.get().normalized_text, 'راننده تاکسی تمام وقت')
+
+@skipUnless(connection.vendor == 'postgresql', 'pg_trgm فقط در PostgreSQL')
+class FuzzySearchTest(TransactionTestCase):
+    def test_typo_falls_back_to_fuzzy_search_without_leaking_threshold(self):
+        Product.objects.create(
+            name_fa='گوشی سامسونگ گلکسی', category=Category.objects.create(name_fa='موبایل'),
+            city=City.objects.create(name='کابل'), price_range='0-1000', is_approved=True
+        )
+        response = self.client.get(reverse('app:search'), {'q': 'سامسونگگ'})
+        self.assertTrue(response.context['fuzzy_results'])
+        self.assertEqual([p.name_fa for p in response.context['products']], ['گوشی سامسونگ گلکسی'])
+        # set_config محلی با پایان تراکنش برگشته است
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT current_setting('pg_trgm.word_similarity_threshold', true)")
+            self.assertNotEqual(cursor.fetchone()[0], str(FUZZY_SIMILARITY_THRESHOLD))
+
+@override_settings(SUGGEST_BACKGROUND_BUILD=False)
+class SearchSuggestionsTest(TestCase):
+    def setUp(self):
+        suggest._indexes.clear()
+        self.client = Client()
+        self.category = Category.objects.create(name_fa='موبایل و تبلت')
+        self.city = City.objects.create(name='کابل')
+        Product.objects.create(
+            name_fa='گوشی سامسونگ گلکسی', category=self.category, city=self.city,
+            price_range='0-1000', is_approved=True
+        )
+
+    def suggest(self, q):
+        response = self.client.get(reverse('app:search_suggestions'), {'q': q})
+        return [(item['type'], item['text']) for item in response.json()['suggestions']]
+
+    def test_prefix_matches_any_word_and_tracks_changes(self):
+        self.assertEqual(self.suggest('سامسون'), [('product', 'گوشی سامسونگ گلکسی')])
+        self.assertEqual(self.suggest('موبايل'), [('category', 'موبایل و تبلت')])
+
+        # تغییرات بدون بازسازی کامل در ایندکس اعمال می‌شوند
+        Product.objects.create(
+            name_fa='سامسونگ A52', category=self.category, city=self.city,
+            price_range='0-1000', is_approved=True
+        )
+        Product.objects.filter(name_fa='گوشی سامسونگ گلکسی').get().delete()
+        with self.assertNumQueries(1):
+            self.assertEqual(self.suggest('سامسون'), [('product', 'سامسونگ A52')])
+
+
+class SuggestBackgroundBuildTest(TransactionTestCase):
+    def test_cold_index_is_built_outside_the_request(self):
+        suggest._indexes.clear()
+        Product.objects.create(
+            name_fa='گوشی سامسونگ', category=Category.objects.create(name_fa='موبایل'),
+            city=City.objects.create(name='کابل'), price_range='0-1000', is_approved=True
+        )
+        # پروسه تازه: درخواست بدون کوئری جواب خالی می‌دهد و ساخت در پس‌زمینه شروع می‌شود
+        with self.assertNumQueries(0):
+            self.assertEqual(suggest.get_suggestions('سامسون', 'fa'), [])
+        for thread in threading.enumerate():
+            if thread.name == 'suggest-build-fa':
+                thread.join(timeout=10)
+        self.assertEqual([item['text'] for item in suggest.get_suggestions('سامسون', 'fa')], ['گوشی سامسونگ'])
+
+class FacetCountsTest(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name_fa='دسته')
+        other_category = Category.objects.create(name_fa='دسته دوم')
+        kabul = City.objects.create(name='کابل')
+        herat = City.objects.create(name='هرات')
+        for city, cat, price, condition in [
+            (kabul, category, 500, 'new'),
+            (kabul, category, 2000, 'used'),
+            (kabul, other_category, 2000, 'new'),
+            (herat, category, 200000, 'new'),
+        ]:
+            Product.objects.create(
+                name_fa='محصول', category=cat, city=city, price=price,
+                condition=condition, price_range='0-1000', is_approved=True
+            )
+        self.kabul, self.herat, self.category = kabul, herat, category
+
+    def test_counts_exclude_own_dimension_filter(self):
+        base = search_products(Product.objects.filter(is_approved=True), 'محصول')
+        with self.assertNumQueries(1):
+            rows = facet_rows(base, 'facets:test')
+        with self.assertNumQueries(0):
+            self.assertEqual(facet_rows(base, 'facets:test'), rows)
+
+        facets = count_facets(rows, {'city': str(self.kabul.id), 'category': None, 'price': None, 'condition': None})
+        self.assertEqual(facets['total'], 3)
+        self.assertEqual(facets['city'], {self.kabul.id: 3, self.herat.id: 1})
+        self.assertEqual(facets['price'], {'0-1000': 1, '1000-5000': 2})
+
+        facets = count_facets(rows, {'city': self.kabul.id, 'price': '1000-5000'})
+        self.assertEqual(facets['total'], 2)
+        self.assertEqual(facets['city'], {self.kabul.id: 2})
+        self.assertEqual(facets['price'], {'0-1000': 1, '1000-5000': 2})
+        self.assertEqual(facets['condition'], {'new': 1, 'used': 1})
+        self.assertEqual(facets['category'][self.category.id], 1)
+
+    def test_category_page_filters_with_facet_counts(self):
+        url = reverse('app:category_detail', args=[self.category.id])
+        response = self.client.get(url, {'city_id': str(self.kabul.id)})
+        self.assertEqual(response.context['total_products'], 2)
+        counts = {city.id: city.product_count for city in response.context['cities']}
+        self.assertEqual((counts[self.kabul.id], counts[self.herat.id]), (2, 1))
+        self.assertEqual(
+            [(key, count) for key, _label, count in response.context['condition_counts']],
+            [('new', 1), ('used', 1)],
+        )
+        self.assertContains(response, 'name="price_range"')
+
+class ProductCounterTest(TestCase):
+    def test_counters_stay_exact(self):
+        kabul = City.objects.create(name='کابل')
+        herat = City.objects.create(name='هرات')
+        category = Category.objects.create(name_fa='دسته')
+        tag, other_tag = Tag.objects.create(name_fa='الف'), Tag.objects.create(name_fa='ب')
+        product = Product.objects.create(
+            name_fa='محصول', category=category, city=kabul, price_range='0-1000', is_approved=True
+        )
+        draft = Product.objects.create(
+            name_fa='پیش‌نویس', category=category, city=kabul, price_range='0-1000'
+        )
+
+        steps = [
+            lambda: product.tags.add(tag, other_tag),
+            lambda: draft.tags.add(tag),
+            lambda: product.tags.remove(other_tag, tag),
+            lambda: tag.product_set.add(product, draft),
+            lambda: setattr(product, 'city', herat) or product.save(),
+            lambda: setattr(draft, 'is_approved', True) or draft.save(update_fields=['is_approved']),
+            lambda: tag.product_set.clear(),
+            lambda: product.tags.set([other_tag]),
+            lambda: setattr(product, 'is_approved', False) or product.save(),
+            lambda: draft.delete(),
+            lambda: other_tag.delete(),
+        ]
+        for step in steps:
+            step()
+            self.assertEqual(reconcile_counts(dry_run=True), [])
+
+        self.assertEqual(get_counts('city'), {kabul.id: 0, herat.id: 0})
+
+    def test_reconcile_repairs_drift(self):
+        city = City.objects.create(name='کابل')
+        category = Category.objects.create(name_fa='دسته')
+        Product.objects.create(name_fa='محصول', category=category, city=city, price_range='0-1000', is_approved=True)
+        # queryset.update از signals عبور نمی‌کند
+        Product.objects.update(is_approved=False)
+        self.assertEqual(len(reconcile_counts(dry_run=True)), 2)
+        reconcile_counts()
+        self.assertEqual(reconcile_counts(dry_run=True), [])
+        self.assertEqual(get_counts('city'), {city.id: 0})
+
+class ReferenceDataSnapshotTest(TestCase):
+    def test_snapshot_is_reused_until_reference_data_changes(self):
+        get_snapshot()
+        with self.assertNumQueries(0):
+            get_snapshot()
+        city = City.objects.create(name='مزار شریف')
+        self.assertIn(city.id, [c.id for c in get_snapshot()['cities']])
+        city.delete()
+        self.assertNotIn(city.id, [c.id for c in get_snapshot()['cities']])
+
+class CacheNamespaceTest(TestCase):
+    def test_invalidation_switches_key_generation(self):
+        CacheManager.cache_product_count(10)
+        list_key = CacheManager.get_products_cache_key(category_id=1, page=2)
+        self.assertEqual(CacheManager.get_cached_product_count(), 10)
+
+        CacheManager.clear_products_cache()
+        self.assertIsNone(CacheManager.get_cached_product_count())
+        self.assertNotEqual(CacheManager.get_products_cache_key(category_id=1, page=2), list_key)
+
+        list_key = CacheManager.get_products_cache_key(category_id=1, page=2)
+        Category.objects.create(name_fa='دسته جدید')
+        self.assertNotEqual(CacheManager.get_products_cache_key(category_id=1, page=2), list_key)
+
+    def test_reseeded_version_is_newer_after_many_bumps(self):
+        for _ in range(1000):
+            last = CacheManager.bump_namespace('products')
+        # کلید نسخه از کش بیرون رانده شده
+        cache.delete('ns:products')
+        self.assertGreater(CacheManager.namespace_version('products'), last)
+
+class ProductDetailCacheTest(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.seller = User.objects.create_user(username='seller', password='pass12345')
+        self.category = Category.objects.create(name_fa='دسته')
+        self.city = City.objects.create(name='کابل')
+        self.tag = Tag.objects.create(name_fa='برچسب')
+        self.product = Product.objects.create(
+            user=self.seller, name_fa='محصول اصلی', category=self.category, city=self.city,
+            price_range='0-1000', seller_contact='0700', is_approved=True
+        )
+        self.product.tags.add(self.tag)
+        ProductImage.objects.create(product=self.product, image='product_images/main.jpg')
+        Product.objects.create(
+            name_fa='محصول مرتبط', category=self.category, city=self.city,
+            price_range='0-1000', is_approved=True
+        )
+
+    def test_cache_hit_renders_without_queries_and_signals_invalidate(self):
+        url = reverse('app:product_detail', args=[self.product.id])
+        self.client.get(url)
+        # فقط کوئری کارت‌های محصولات مرتبط و فروشنده (نمونه تصادفی از مخزن کش شده دسته‌بندی)
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        page = response.context['product']
+        self.assertEqual(len(page['image_urls']), 1)
+        self.assertTrue(page['primary_image_url'].endswith('product_images/main.jpg'))
+        self.assertEqual(page['seller']['username'], 'seller')
+        self.assertEqual([tag['name_fa'] for tag in page['tags']], ['برچسب'])
+        self.assertEqual([p['name_fa'] for p in response.context['related_products']], ['محصول مرتبط'])
+
+        self.product.tags.clear()
+        ProductImage.objects.create(product=self.product, image='product_images/second.jpg')
+        response = self.client.get(url)
+        self.assertEqual(response.context['product']['tags'], [])
+        self.assertEqual(len(response.context['product']['image_urls']), 2)
+
+        Product.objects.filter(pk=self.product.pk).get().delete()
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_seller_cards_follow_changes_to_other_products(self):
+        sibling = Product.objects.create(
+            name_fa='محصول دیگر فروشنده', price_range='0-1000', seller_contact='0700', is_approved=True
+        )
+        url = reverse('app:product_detail', args=[self.product.id])
+        self.assertEqual([p['name_fa'] for p in self.client.get(url).context['seller_products']], ['محصول دیگر فروشنده'])
+        # ذخیره محصول دیگر صفحه این محصول را باطل نمی‌کند؛ کارت‌ها از شناسه‌ها تازه ساخته می‌شوند
+        sibling.name_fa = 'نام جدید'
+        sibling.save()
+        self.assertEqual([p['name_fa'] for p in self.client.get(url).context['seller_products']], ['نام جدید'])
+        sibling.delete()
+        self.assertEqual(self.client.get(url).context['seller_products'], [])
+
+
+class SimilarProductsTest(TestCase):
+    def setUp(self):
+        self.addCleanup(cache.clear)
+        # corpus حافظه پروسه از تست قبلی نماند
+        self.addCleanup(set_corpus, None, None)
+        self.category = Category.objects.create(name_fa='موبایل')
+
+    def create(self, name, description=''):
+        return Product.objects.create(
+            name_fa=name, description_fa=description, category=self.category,
+            price_range='0-1000', is_approved=True
+        )
+
+    def similar_names(self, product):
+        return list(product.similar_products.order_by('rank').values_list('similar__name_fa', flat=True))
+
+    def test_rebuild_and_incremental_update(self):
+        galaxy = self.create('گوشی سامسونگ گلکسی', 'نو و آکبند')
+        self.create('گوشی سامسونگ نوت')
+        self.create('گوشی شیائومی')
+        self.create('یخچال ال جی', 'نو و آکبند')
+
+        self.assertEqual(rebuild_all(processes=1), 4)
+        self.assertEqual(self.similar_names(galaxy)[:2], ['گوشی سامسونگ نوت', 'گوشی شیائومی'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            newer = self.create('گوشی سامسونگ گلکسی اس')
+        # ذخیره فقط شناسه را در صف ثبت می‌کند؛ corpus را worker به‌روز می‌کند
+        self.assertNotIn('گوشی سامسونگ گلکسی اس', self.similar_names(galaxy))
+        call_command('process_similarity_queue', stdout=StringIO())
+        self.assertEqual(self.similar_names(galaxy)[0], 'گوشی سامسونگ گلکسی اس')
+        self.assertEqual(self.similar_names(newer)[0], 'گوشی سامسونگ گلکسی')
+
+        response = self.client.get(reverse('app:product_detail', args=[galaxy.id]))
+        self.assertEqual(response.context['related_products'][0]['name_fa'], 'گوشی سامسونگ گلکسی اس')
+
+    def test_queued_saves_are_applied_together(self):
+        galaxy = self.create('گوشی سامسونگ گلکسی')
+        fridge = self.create('یخچال ال جی')
+        rebuild_all(processes=1)
+        # دو ذخیره جدا (مثلا دو درخواست همزمان) قبل از اجرای worker
+        with self.captureOnCommitCallbacks(execute=True):
+            note = self.create('گوشی سامسونگ نوت')
+        with self.captureOnCommitCallbacks(execute=True):
+            double_door = self.create('یخچال ال جی دو درب')
+        self.assertEqual(process_queue(), {galaxy.id, fridge.id, note.id, double_door.id})
+        self.assertEqual(self.similar_names(galaxy), ['گوشی سامسونگ نوت'])
+        self.assertEqual(self.similar_names(double_door), ['یخچال ال جی'])
+        self.assertEqual(process_queue(), set())
+
+    def test_fresh_worker_loads_corpus_from_database(self):
+        galaxy = self.create('گوشی سامسونگ گلکسی')
+        self.create('یخچال ال جی')
+        rebuild_all(processes=1)
+        # پروسه worker تازه: corpus در کش نیست و از دیتابیس ساخته می‌شود
+        set_corpus(None, None)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create('گوشی سامسونگ نوت')
+        self.assertIn(galaxy.id, process_queue())
+        self.assertEqual(self.similar_names(galaxy), ['گوشی سامسونگ نوت'])
+
+    def test_queue_is_kept_until_first_rebuild(self):
+        galaxy = self.create('گوشی سامسونگ گلکسی')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create('گوشی سامسونگ نوت')
+        with self.assertLogs('bazarche_app.similarity', 'WARNING'):
+            self.assertIsNone(process_queue())
+        self.assertIsNone(cache.get(QUEUE_DONE_KEY))
+        rebuild_all(processes=1)
+        self.assertEqual(self.similar_names(galaxy), ['گوشی سامسونگ نوت'])
+
+
+class ProductCommentTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='buyer', password='pass12345')
+        self.product = Product.objects.create(name_fa='محصول', price_range='0-1000', is_approved=True)
+
+    def test_add_comment_updates_count_and_page(self):
+        url = reverse('app:product_detail', args=[self.product.id])
+        self.client.get(url)
+        self.client.force_login(self.user)
+        self.client.post(reverse('app:add_product_comment', args=[self.product.id]), {'comment_text': 'نظر آزمایشی درباره محصول'})
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.comment_count, 1)
+        response = self.client.get(url)
+        self.assertEqual(response.context['comment_count'], 1)
+        self.assertEqual(response.context['comments'][0]['message'], 'نظر آزمایشی درباره محصول')
+
+        ProductComment.objects.get().delete()
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.comment_count, 0)
+
+    def test_full_save_keeps_concurrent_comment_count(self):
+        stale = Product.objects.get(pk=self.product.pk)
+        ProductComment.objects.create(product=self.product, user=self.user, message='نظر')
+        stale.name_fa = 'محصول ویرایش شده'
+        stale.save()
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.name_fa, 'محصول ویرایش شده')
+        self.assertEqual(self.product.comment_count, 1)
+
+    def test_backfill_moves_legacy_feedback(self):
+        for i in range(3):
+            UserFeedback.objects.create(subject=f'نظر محصول {self.product.id} - محصول', message=f'نظر {i}', email='a@b.c')
+        UserFeedback.objects.create(subject='نظر محصول 999999 - حذف شده', message='بدون محصول')
+        UserFeedback.objects.create(subject='تماس', message='پیام تماس')
+
+        call_command('migrate_product_comments', batch_size=2, stdout=StringIO())
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.comment_count, 3)
+        self.assertEqual(ProductComment.objects.filter(product=self.product).count(), 3)
+        self.assertEqual(UserFeedback.objects.count(), 2)
+
+        # اجرای دوباره چیزی را تکرار نمی‌کند
+        call_command('migrate_product_comments', stdout=StringIO())
+        self.assertEqual(ProductComment.objects.count(), 3)
+
+
+class ChatTest(TestCase):
+    def setUp(self):
+        self.seller = User.objects.create_user(username='seller', password='pass12345')
+        self.buyer = User.objects.create_user(username='buyer', password='pass12345')
+        self.product = Product.objects.create(user=self.seller, name_fa='محصول', price_range='0-1000', is_approved=True)
+        self.send_url = reverse('app:send_chat_message', args=[self.product.id])
+        self.poll_url = reverse('app:get_chat_messages', args=[self.product.id])
+
+    def test_legacy_seller_replies_follow_the_only_buyer(self):
+        migration = importlib.import_module('bazarche_app.migrations.0028_chat')
+        other_buyer = User.objects.create_user(username='buyer2', password='pass12345')
+        crowded = Product.objects.create(user=self.seller, name_fa='محصول دوم', price_range='0-1000', is_approved=True)
+
+        def legacy(product, sender, message):
+            UserFeedback.objects.create(subject=f'CHAT_{product.id}_{sender.id}_{self.seller.id}', message=message, user=sender)
+
+        legacy(self.product, self.buyer, 'سلام')
+        legacy(self.product, self.seller, 'بفرمایید')
+        legacy(crowded, self.buyer, 'قیمت؟')
+        legacy(crowded, other_buyer, 'موجود است؟')
+        legacy(crowded, self.seller, 'بله')
+        out = StringIO()
+        with redirect_stdout(out):
+            migration.migrate_legacy_chats(django_apps, None)
+
+        conversation = Conversation.objects.get(product=self.product)
+        self.assertEqual(list(conversation.messages.order_by('id').values_list('sender_id', 'body')), [
+            (self.buyer.id, 'سلام'), (self.seller.id, 'بفرمایید'),
+        ])
+        self.assertEqual(Conversation.objects.filter(product=crowded).count(), 2)
+        # پاسخ محصولی با دو خریدار گزارش می‌شود و در UserFeedback می‌ماند
+        self.assertEqual(list(UserFeedback.objects.values_list('message', flat=True)), ['بله'])
+        self.assertIn('1 پاسخ فروشنده', out.getvalue())
+
+    def test_conversation_messages_and_unread_state(self):
+        self.client.force_login(self.buyer)
+        self.assertEqual(self.client.get(self.poll_url).json()['messages'], [])
+        first = self.client.post(self.send_url, {'message': 'سلام'}).json()
+        conversation = Conversation.objects.get()
+        self.assertEqual(first['conversation_id'], conversation.id)
+        self.assertEqual((conversation.buyer_id, conversation.seller_id, conversation.seller_unread), (self.buyer.id, self.seller.id, 1))
+
+        self.client.force_login(self.seller)
+        reply = self.client.post(self.send_url, {'message': 'بفرمایید', 'conversation': conversation.id}).json()
+        self.assertTrue(reply['success'])
+        messages = self.client.get(self.poll_url, {'last_message_id': 0, 'conversation': conversation.id}).json()['messages']
+        self.assertEqual([(m['message'], m['is_own']) for m in messages], [('سلام', False), ('بفرمایید', True)])
+        conversation.refresh_from_db()
+        self.assertEqual((conversation.seller_unread, conversation.buyer_unread), (0, 1))
+
+        self.client.force_login(self.buyer)
+        messages = self.client.get(self.poll_url, {'last_message_id': first['message_id'], 'conversation': conversation.id}).json()['messages']
+        self.assertEqual([m['sender'] for m in messages], ['seller'])
+
+        # کاربر سوم به گفتگو دسترسی ندارد
+        other = User.objects.create_user(username='other', password='pass12345')
+        self.client.force_login(other)
+        self.assertEqual(self.client.get(self.poll_url, {'conversation': conversation.id}).json()['messages'], [])
+        self.assertFalse(self.client.post(self.send_url, {'message': 'x', 'conversation': conversation.id}).json()['success'])
+
+
+@override_settings(PUSH_REDIS_URL=None)
+class PushEventsTest(TestCase):
+    def test_stream_is_disabled_without_asgi(self):
+        user = User.objects.create_user(username='u', password='pass12345')
+        self.client.force_login(user)
+        self.assertEqual(self.client.get(reverse('app:event_stream')).status_code, 204)
+
+    def test_pages_open_event_source_only_with_events_url(self):
+        self.client.force_login(User.objects.create_user(username='u', password='pass12345'))
+        with override_settings(PUSH_EVENTS_URL=None):
+            self.assertNotContains(self.client.get(reverse('app:home')), 'new EventSource(')
+        events_url = 'https://events.example.com/app/api/events/'
+        with override_settings(PUSH_EVENTS_URL=events_url):
+            self.assertContains(self.client.get(reverse('app:home')), f"new EventSource('{events_url}'")
+
+    def test_events_process_warns_without_redis(self):
+        with override_settings(PUSH_REDIS_URL=None), self.assertLogs('bazarche_app.push', 'WARNING'):
+            check_config()
+
+    async def test_stream_delivers_user_events(self):
+        user = await User.objects.acreate(username='listener')
+        await self.async_client.aforce_login(user)
+        response = await self.async_client.get(reverse('app:event_stream'))
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = response.streaming_content
+        self.assertEqual(await anext(stream), b'retry: 5000\n\n')
+
+        publish(user_channel(user.id + 1), 'chat', {'id': 1})
+        publish(user_channel(user.id), 'notifications', {'count': 3})
+        chunk = await asyncio.wait_for(anext(stream), 1)
+        self.assertEqual(chunk, b'event: notifications\ndata: {"count": 3}\n\n')
+        await stream.aclose()
+
+
+@override_settings(PUSH_REDIS_URL=None)
+class NotificationTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='reader', password='pass12345')
+        self.client.force_login(self.user)
+
+    def test_unread_counter_follows_writes_without_sql(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            first = notify(self.user, 'admin', 'اول')
+        self.assertEqual(unread_count(self.user), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            notify(self.user, 'admin', 'دوم')
+            notify(self.user, 'comment', 'سوم', link='/app/products/1/#comments')
+        with self.assertNumQueries(0):
+            self.assertEqual(unread_count(self.user), 3)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('app:mark_notification_read', args=[first.id]))
+            self.client.post(reverse('app:mark_notification_read', args=[first.id]))
+        self.assertEqual(self.client.get(reverse('app:get_unread_notifications_count')).json()['count'], 2)
+        recent = self.client.get(reverse('app:get_recent_notifications')).json()['notifications']
+        self.assertEqual(recent[0]['link'], '/app/products/1/#comments')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.post(reverse('app:mark_all_notifications_read')).json()['count'], 2)
+        self.assertEqual(unread_count(self.user), 0)
+        self.assertFalse(Notification.objects.filter(is_read=False).exists())
+
+    def test_broadcast_is_stored_once_and_read_lazily(self):
+        other = User.objects.create_user(username='other', password='pass12345')
+        self.assertEqual(unread_count(self.user), 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            item = broadcast('اطلاعیه', sender=other)
+        self.assertEqual(Broadcast.objects.count(), 1)
+        self.assertFalse(BroadcastRead.objects.exists())
+        self.assertEqual(unread_count(self.user), 1)
+        self.assertEqual(unread_count(other), 1)
+
+        recent = self.client.get(reverse('app:get_recent_notifications')).json()['notifications']
+        self.assertEqual(recent[0]['read_url'], reverse('app:mark_broadcast_read', args=[item.id]))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(recent[0]['read_url'])
+            self.client.post(recent[0]['read_url'])
+        self.assertEqual(unread_count(self.user), 0)
+        self.assertEqual(BroadcastRead.objects.count(), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            notify(other, 'admin', 'شخصی')
+            self.assertEqual(self.client.post(reverse('app:mark_all_notifications_read')).json()['count'], 0)
+        self.client.force_login(other)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.post(reverse('app:mark_all_notifications_read')).json()['count'], 2)
+        self.assertEqual(unread_count(other), 0)
+
+    def test_admin_broadcast_skips_user_count_and_later_accounts(self):
+        admin = User.objects.create_superuser(username='admin', password='pass12345')
+        self.client.force_login(admin)
+        # کاربر جلسه و INSERT اعلان همگانی؛ بدون COUNT روی کاربران
+        with self.captureOnCommitCallbacks(execute=True), self.assertNumQueries(2):
+            self.client.post(reverse('app:send_notification_to_all_users'), {'title': 'عنوان', 'message': 'متن'})
+        self.assertEqual(Broadcast.objects.count(), 1)
+        self.assertEqual(unread_count(self.user), 1)
+        # حساب‌هایی که بعد از ارسال ساخته شده‌اند آن را خوانده نشده نمی‌بینند
+        newcomer = User.objects.create_user(username='newcomer', password='pass12345')
+        self.assertEqual(unread_count(newcomer), 0)
+        self.client.force_login(newcomer)
+        self.assertEqual(self.client.get(reverse('app:get_recent_notifications')).json()['notifications'], [])
+
+
+class ImageDerivativesTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+        self.product = Product.objects.create(name_fa='عکس‌دار', price_range='0-1000', is_approved=True)
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def upload(self, size=(1600, 1200), mode='RGB', fmt='JPEG', name='photo.jpg', **save_options):
+        output = BytesIO()
+        Image.new(mode, size, 'red').save(output, format=fmt, **save_options)
+        return SimpleUploadedFile(name, output.getvalue())
+
+    def test_variants_are_recorded_and_used_by_feed(self):
+        product_image = ProductImage.objects.create(product=self.product, image=self.upload())
+        variants = generate_derivatives(product_image)
+        self.assertEqual((variants['full']['width'], variants['full']['height']), (800, 600))
+        self.assertEqual(variants['card']['width'], 600)
+        self.assertEqual(variants['thumb']['width'], 300)
+        storage = product_image.image.storage
+        with storage.open(variants['card']['webp']) as f:
+            self.assertEqual(Image.open(f).format, 'WEBP')
+        self.assertEqual(ProductImage.objects.get().variants, variants)
+
+        data = self.client.get(reverse('app:load_more_products')).json()['products'][0]
+        self.assertTrue(data['image'].endswith('_card.jpg'))
+        self.assertIn('_thumb.webp 300w', data['image_webp_srcset'])
+        page = self.client.get(reverse('app:product_detail', args=[self.product.id])).context['product']
+        self.assertTrue(page['images'][0]['thumb'].endswith('_thumb.jpg'))
+
+        product_image.delete()
+        self.assertFalse(storage.exists(variants['card']['jpeg']))
+
+    def test_backfill_command_skips_processed_and_broken_images(self):
+        ProductImage.objects.create(product=self.product, image=self.upload(size=(200, 100), mode='RGBA', fmt='PNG', name='small.png'))
+        ProductImage.objects.create(product=self.product, image=SimpleUploadedFile('broken.jpg', b'not an image'))
+        out = StringIO()
+        call_command('generate_image_derivatives', stdout=out)
+        small = ProductImage.objects.exclude(variants={}).get()
+        # تصویر کوچک‌تر از همه اندازه‌ها بزرگ نمی‌شود
+        self.assertEqual(small.variants['thumb']['width'], 200)
+        self.assertEqual(ProductImage.objects.filter(variants={}).count(), 1)
+
+    def test_scheduled_processing_shows_placeholder_until_done(self):
+        product_image = ProductImage.objects.create(product=self.product, image=self.upload(), is_processing=True)
+        inline = {**settings.IMAGE_PROCESSING, 'PROCESSING_THREADS': 0}
+        with override_settings(IMAGE_PROCESSING=inline):
+            with self.captureOnCommitCallbacks() as callbacks:
+                schedule_derivatives([product_image.id])
+            # تا commit (و پایان پردازش) فید آدرسی برای عکس ندارد و قالب placeholder نشان می‌دهد
+            self.assertIsNone(self.client.get(reverse('app:load_more_products')).json()['products'][0]['image'])
+            for callback in callbacks:
+                callback()
+        data = self.client.get(reverse('app:load_more_products')).json()['products'][0]
+        self.assertTrue(data['image'].endswith('_card.jpg'))
+
+    def test_exif_orientation_metadata_and_byte_budget(self):
+        exif = Image.Exif()
+        exif[0x0112] = 6  # چرخش 90 درجه
+        exif[0x010F] = 'PhoneMaker'
+        gradient, noise = Image.linear_gradient('L').resize((1600, 1200)), Image.effect_noise((1600, 1200), 20)
+        photo = BytesIO()
+        Image.merge('RGB', (gradient, noise, Image.blend(gradient, noise, 0.5))).save(photo, format='JPEG', exif=exif)
+        product_image = ProductImage.objects.create(product=self.product, image=SimpleUploadedFile('turned.jpg', photo.getvalue()))
+        # بدون سقف: حدود 52 KB (JPEG) و 78 KB (WebP)
+        budget = 45 * 1024
+        config = {**settings.IMAGE_PROCESSING, 'BYTE_BUDGETS': {'full': budget}}
+        with override_settings(IMAGE_PROCESSING=config):
+            variants = generate_derivatives(product_image)
+
+        self.assertEqual((variants['full']['width'], variants['full']['height']), (600, 800))
+        storage = product_image.image.storage
+        for fmt in ('jpeg', 'webp'):
+            self.assertLessEqual(storage.size(variants['full'][fmt]), budget)
+            with storage.open(variants['full'][fmt]) as f:
+                img = Image.open(f)
+                self.assertEqual(dict(img.getexif()), {})
+                self.assertNotIn('icc_profile', img.info)
+
+    def test_placeholder_metadata_is_stored_and_backfilled(self):
+        product_image = ProductImage.objects.create(product=self.product, image=self.upload())
+        generate_derivatives(product_image)
+        product_image.refresh_from_db()
+        self.assertEqual((product_image.width, product_image.height), (1600, 1200))
+        self.assertEqual(product_image.byte_size, product_image.image.size)
+        self.assertEqual(product_image.dominant_color, '#fe0000')
+        self.assertEqual(len(product_image.blurhash), 28)
+
+        data = self.client.get(reverse('app:load_more_products')).json()['products'][0]
+        self.assertEqual((data['image_width'], data['image_height']), (600, 450))
+        self.assertEqual(data['image_color'], product_image.dominant_color)
+        self.assertEqual(data['image_blurhash'], product_image.blurhash)
+
+        ProductImage.objects.update(width=None, height=None, byte_size=None, dominant_color='', blurhash='')
+        call_command('backfill_image_metadata', batch_size=1, stdout=StringIO())
+        backfilled = ProductImage.objects.get()
+        self.assertEqual((backfilled.width, backfilled.height), (1600, 1200))
+        self.assertEqual(backfilled.byte_size, product_image.byte_size)
+        self.assertEqual(backfilled.dominant_color, product_image.dominant_color)
+
+    def test_derivative_backfill_resumes_from_checkpoint(self):
+        first, *_ = [ProductImage.objects.create(product=self.product, image=self.upload(size=(400, 300))) for _ in range(3)]
+        checkpoint = os.path.join(self.media_root, 'checkpoint.json')
+        # اجرای قبلی بعد از اولین دسته متوقف شده است
+        with open(checkpoint, 'w') as f:
+            json.dump({'last_pk': first.pk, 'all': False, 'done': 1, 'failed': 0}, f)
+        out = StringIO()
+        call_command('generate_image_derivatives', workers=0, chunk_size=1, cpu_share=1, checkpoint=checkpoint, stdout=out)
+        self.assertEqual(ProductImage.objects.get(pk=first.pk).variants, {})
+        self.assertEqual(ProductImage.objects.exclude(variants={}).count(), 2)
+        self.assertFalse(os.path.exists(checkpoint))
+        self.assertIn('نسخه‌های 3 عکس ساخته شد', out.getvalue())
+
+
+class ImagePoolTest(TransactionTestCase):
+    """مسیر واقعی pool: پروسه spawn، add_done_callback و thread ذخیره (اتصال دیتابیس جدا)"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        pooled = {**settings.IMAGE_PROCESSING, 'PROCESSING_THREADS': 1}
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root, IMAGE_PROCESSING=pooled)
+        self.settings_override.enable()
+        self.addCleanup(image_pool.reset_pool)
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def test_spawned_pool_stores_variants(self):
+        product = Product.objects.create(name_fa='عکس‌دار', price_range='0-1000', is_approved=True)
+        output = BytesIO()
+        Image.new('RGB', (1200, 900), 'blue').save(output, format='JPEG')
+        product_image = ProductImage.objects.create(
+            product=product, image=SimpleUploadedFile('pooled.jpg', output.getvalue()), is_processing=True,
+        )
+        # بیرون از تراکنش on_commit فورا اجرا می‌شود
+        schedule_derivatives([product_image.id])
+        pool, writer = image_pool.get_pool()
+        # shutdown pool بعد از اجرای callbackها برمی‌گردد؛ shutdown writer بعد از ذخیره
+        pool.shutdown()
+        writer.shutdown()
+
+        product_image.refresh_from_db()
+        self.assertFalse(product_image.is_processing)
+        self.assertEqual((product_image.variants['full']['width'], product_image.variants['full']['height']), (800, 600))
+        self.assertTrue(product_image.image.storage.exists(product_image.variants['card']['webp']))
@@ -0,0 +1,51 @@
+"""
+یکسان‌سازی متن دری/پشتو برای ذخیره و جستجو
+
+کاربران «ي/ك» عربی یا «ی/ک» فارسی، نیم‌فاصله یا فاصله، ارقام فارسی/عربی یا لاتین
+و اعراب را ناهمگون تایپ می‌کنند. همین تابع هم هنگام ذخیره (ستون‌های normalized_*)
+و هم هنگام جستجو روی متن کاربر اعمال می‌شود تا هر دو طرف مقایسه یک شکل داشته باشند.
+"""
+import re
+
+_CHAR_MAP = {
+    # حروف عربی -> فارسی
+    'ي': 'ی',
+    'ى': 'ی',
+    'ك': 'ک',
+    'ۀ': 'ه',
+    'ة': 'ه',
+    'أ': 'ا',
+    'إ': 'ا',
+    'ٱ': 'ا',
+    'آ': 'ا',
+    'ؤ': 'و',
+    # گاف پشتو که اغلب به جای گاف فارسی تایپ می‌شود
+    'ګ': 'گ',
+    # نیم‌فاصله و کاراکترهای کنترلی جهت‌دهی -> فاصله
+    '\u200c': ' ',
+    '\u200f': ' ',
+    '\u200e': ' ',
+}
+# ارقام فارسی و عربی -> لاتین
+_CHAR_MAP.update({chr(0x06F0 + i): str(i) for i in range(10)})
+_CHAR_MAP.update({chr(0x0660 + i): str(i) for i in range(10)})
+
+# اعراب، تطویل (ـ) و اتصال‌دهنده‌های بی‌عرض حذف می‌شوند
+_REMOVED_CHARS = [chr(c) for c in range(0x064B, 0x0660)] + ['\u0670', '\u0640', '\u200d', '\ufeff']
+_CHAR_MAP.update({ch: None for ch in _REMOVED_CHARS})
+
+_TRANSLATION = str.maketrans(_CHAR_MAP)
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_text(text):
+    """یکسان‌سازی یک متن؛ برای None رشته خالی برمی‌گرداند"""
+    if not text:
+        return ''
+    text = str(text).translate(_TRANSLATION).casefold()
+    return _WHITESPACE.sub(' ', text).strip()
+
+
+def normalize_join(*parts):
+    """یکسان‌سازی و چسباندن چند فیلد (مثلا نام در سه زبان) در یک ستون"""
+    return ' '.join(filter(None, (normalize_text(part) for part in parts)))
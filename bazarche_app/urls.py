@@ -12,6 +12,7 @@ urlpatterns = [
     path('category/<int:category_id>/', views.category_detail, name='category_detail'),
     path('tag/<int:tag_id>/', views.tag_detail, name='tag_detail'),
     path('search/', views.search, name='search'),
+    path('api/suggest/', views.search_suggestions, name='search_suggestions'),
     path('about/', views.about, name='about'),
     path('contact/', views.contact, name='contact'),
     path('terms/', views.terms, name='terms'),
@@ -68,10 +69,14 @@ urlpatterns = [
     path('api/notifications/count/', views.get_unread_notifications_count, name='get_unread_notifications_count'),
     path('api/notifications/recent/', views.get_recent_notifications, name='get_recent_notifications'),
     path('api/notifications/<int:notification_id>/read/', views.mark_notification_read, name='mark_notification_read'),
+    path('api/notifications/broadcast/<int:broadcast_id>/read/', views.mark_broadcast_read, name='mark_broadcast_read'),
+    path('api/notifications/mark-all-read/', views.mark_all_notifications_read, name='mark_all_notifications_read'),
     
     # Chat URLs
     path('api/send-chat-message/<int:product_id>/', views.send_chat_message, name='send_chat_message'),
     path('api/get-chat-messages/<int:product_id>/', views.get_chat_messages, name='get_chat_messages'),
+    # رویدادهای push (SSE) چت و اعلان‌ها؛ endpoint های polling بالا برای حالت بدون SSE باقی می‌مانند
+    path('api/events/', views.event_stream, name='event_stream'),
     
     # Admin Notification URLs
     path('admin/send-notification-all/', views.send_notification_to_all_users, name='send_notification_to_all_users'),
@@ -1,3 +1,4 @@
+import asyncio
 from django.shortcuts import render, redirect, get_object_or_404
 from django.core.paginator import Paginator
 from django.utils import translation
@@ -8,26 +9,38 @@ from django.db.models import Count
 from django.views.decorators.csrf import csrf_protect
 from django.contrib.auth.decorators import login_required
 from django.views.decorators.cache import cache_page
+from django.utils.cache import patch_vary_headers
 from django.conf import settings
 from django.contrib import messages
-from django.http import HttpResponseRedirect, HttpResponse
+from django.http import HttpResponseRedirect, HttpResponse, Http404, StreamingHttpResponse
+from django.core.handlers.asgi import ASGIRequest
 from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import user_passes_test
 from django.db.models import Sum, Count
 from django.contrib.auth.models import User
-from .models import Product, ProductImage, Category, Tag, VisitLog, UserFeedback, MainCategory, City, AbuseReport, Advertisement, JobAd, Request
+from .models import Product, ProductImage, ProductComment, Category, Tag, VisitLog, UserFeedback, MainCategory, City, AbuseReport, JobAd, Request, Broadcast
 from .forms import ProductForm, UserFeedbackForm, UserRegistrationForm, UserProfileEditForm, UserProfileForm, JobAdForm, RequestForm, ProductCommentForm
 from django.utils import timezone
 from django.template.loader import render_to_string
 from django.urls import reverse
 from django.contrib.auth.forms import PasswordChangeForm
 from django.contrib.auth import update_session_auth_hash
-from django.core.files.base import ContentFile
-from PIL import Image, ImageOps
-import io
-import os
+import copy
 from django import forms
 from .cache_manager import CacheManager
+from .reference_data import get_snapshot, active_advertisements
+from .facets import facet_signature, facet_rows, count_facets, PRICE_RANGE_FILTERS
+from .product_page import page_cards
+from .notifications import (
+    unread_count, notify, broadcast, read_notification, read_broadcast, read_all_notifications, user_feed,
+)
+from .push import subscribe, user_channel, format_event, BROADCAST_CHANNEL
+from .chat import find_conversation, get_or_start_conversation, post_message, recent_messages, messages_after, mark_read, serialize_message
+from .pagination import FEED_ORDERING, encode_feed_cursor, decode_feed_cursor, feed_page_after
+from .image_pool import schedule_derivatives
+from .search import search_products, fuzzy_search_products, fuzzy_search_session, full_text_enabled, FUZZY_MIN_RESULTS
+from .suggest import get_suggestions
+from .text_normalization import normalize_text
 from datetime import timedelta
 
 def get_language_suffix():
@@ -79,19 +92,14 @@ def feedback(request):
 
 def get_cities_context(request):
     """Get cities for context"""
-    cities = City.objects.annotate(
-        product_count=Count('product', filter=Q(product__is_approved=True))
-    ).order_by('order', 'name')
+    # از نسخه کش شده داده‌های مرجع (تعداد محصولات از جدول شمارنده‌ها)
+    cities = get_snapshot()['cities']
     
     # Get selected city name if any
     selected_city = None
     city_id = request.GET.get('city_id')
     if city_id:
-        try:
-            city = City.objects.get(id=city_id)
-            selected_city = city.name
-        except (City.DoesNotExist, ValueError):
-            pass
+        selected_city = next((city.name for city in cities if str(city.id) == city_id), None)
     
     return {
         'cities': cities,
@@ -101,30 +109,7 @@ def get_cities_context(request):
 
 def get_categories_context():
     """Get categories for context"""
-    categories_list = [
-        'وسایل نقلیه',
-        'لوازم دیجیتال',
-        'لوازم خانگی',
-        'وسایل شخصی',
-        'سرگرمی و فراغت',
-        'تجهیزات و صنعتی',
-        'خدمات',
-        'املاک',
-        'اجتماعی',
-        #'استخدام و کاریابی',  # حذف شد
-        'کتاب و مجله',
-    ]
-    main_categories = list(Category.objects.filter(name_fa__in=categories_list).order_by('order', 'name_fa'))
-
-    # Fallback icon fixes for known categories (display-level; does not write DB)
-    fallback_icon_by_name = {
-        'وسایل نقلیه': 'bi-car-front',
-    }
-    for cat in main_categories:
-        if (not getattr(cat, 'icon', None)) or getattr(cat, 'icon', '').strip() in {'', 'bi-tag', 'bi-car'}:
-            if cat.name_fa in fallback_icon_by_name:
-                setattr(cat, 'icon', fallback_icon_by_name[cat.name_fa])
-
+    main_categories = get_snapshot()['nav_categories']
     return {
         'categories': main_categories,
         'all_categories': main_categories,
@@ -144,10 +129,58 @@ def get_price_ranges():
         ]
     }
 
+def get_facet_context(facets, city_id):
+    """شهرها، بازه‌های قیمت و وضعیت‌ها همراه با شمارش facet برای فیلترهای صفحه"""
+    # کپی اشیاء داده مرجع؛ نسخه مشترک بین درخواست‌ها نباید تغییر کند
+    cities = [copy.copy(city) for city in get_snapshot()['cities']]
+    selected_city = None
+    for city in cities:
+        city.product_count = facets['city'].get(city.id, 0)
+        if str(city.id) == city_id:
+            selected_city = city.name
+    price_ranges = get_price_ranges()['price_ranges']
+    return {
+        'cities': cities,
+        'selected_city': selected_city,
+        'selected_city_id': city_id,
+        'facets': facets,
+        'price_ranges': price_ranges,
+        'price_range_counts': [(key, label, facets['price'].get(key, 0)) for key, label in price_ranges],
+        'condition_counts': [
+            (key, label, facets['condition'].get(key, 0)) for key, label in Product.CONDITION_CHOICES
+        ],
+    }
+
 def get_tags_context():
     """Get tags for context"""
     return {
-        'tags': Tag.objects.all().order_by('name_fa')
+        'tags': get_snapshot()['tags']
+    }
+
+def get_priority_products_context(request, products_qs, per_page=20, ordering=FEED_ORDERING):
+    """
+    صفحه‌بندی محصولات با اولویت: ویژه -> پیشنهادی -> تخفیف‌دار -> بقیه (هرکدام جدیدترین اول).
+    ترتیب با ستون listing_rank و ایندکس‌های جزئی آن انجام می‌شود؛ فقط محصولات همان صفحه بارگذاری می‌شوند.
+    """
+    counts = products_qs.aggregate(
+        total=Count('pk'),
+        featured=Count('pk', filter=Q(is_featured=True)),
+        suggested=Count('pk', filter=Q(is_featured=False, is_suggested=True)),
+        discounted=Count('pk', filter=Q(is_featured=False, is_suggested=False, is_discounted=True)),
+    )
+    ordered_qs = products_qs.for_cards().order_by(*ordering)
+
+    paginator = Paginator(ordered_qs, per_page)
+    # تعداد کل از همان aggregate بالا؛ Paginator دوباره COUNT نمی‌زند
+    paginator.count = counts['total']
+    page_obj = paginator.get_page(request.GET.get('page'))
+
+    return {
+        'products': page_obj,
+        'total_products': counts['total'],
+        'featured_count': counts['featured'],
+        'suggested_count': counts['suggested'],
+        'discounted_count': counts['discounted'],
     }
 
 def home(request):
@@ -157,105 +190,103 @@ def home(request):
     selected_city_id = request.GET.get('city_id')
     search_query = request.GET.get('q')
 
-    products_qs = Product.objects.filter(is_approved=True)
+    products_qs = Product.objects.filter(is_approved=True).for_cards()
 
     if selected_city_id:
         products_qs = products_qs.filter(city_id=selected_city_id)
     
     if search_query:
-        products_qs = products_qs.filter(
-            Q(name_fa__icontains=search_query) |
-            Q(description_fa__icontains=search_query)
-        ).distinct()
+        products_qs = search_products(products_qs, search_query)
 
     # Priority sorting
-    products_qs = products_qs.order_by('-is_featured', '-is_suggested', '-is_discounted', '-created_at')
+    products_qs = products_qs.order_by(*FEED_ORDERING)
 
     paginator = Paginator(products_qs, 20)
     page_number = request.GET.get('page')
     page_obj = paginator.get_page(page_number)
 
+    # کرسر ادامه فید برای infinite scroll (از آخرین محصول همین صفحه)
+    feed_cursor = None
+    if page_obj.has_next():
+        feed_cursor = encode_feed_cursor(page_obj[-1])
+
+    # دسته‌بندی‌ها و شهرها از داده‌های مرجع کش شده، بدون کوئری
+    snapshot = get_snapshot()
+    cities = snapshot['cities']
     selected_city = None
     if selected_city_id:
-        try:
-            selected_city = City.objects.get(id=selected_city_id)
-        except City.DoesNotExist:
-            selected_city = None
+        selected_city = next((city for city in cities if str(city.id) == selected_city_id), None)
 
-    # Get main categories (use Category instead of MainCategory)
-    main_categories = Category.objects.filter(parent__isnull=True).order_by('order', 'name_fa')
-    print(f"Main categories count: {main_categories.count()}")
-    
     # Get advertisements for home page
-    home_advertisements = Advertisement.objects.filter(
-        location='home',
-        is_active=True,
-        start_date__lte=timezone.now(),
-        end_date__gte=timezone.now()
-    ).order_by('display_order', '-created_at')
+    home_advertisements = active_advertisements('home')
     
     context = {
         'products': page_obj,
-        'main_categories': main_categories,
-        'cities': City.objects.all(),
+        'main_categories': snapshot['root_categories'],
+        'cities': cities,
         'selected_city_id': selected_city_id,
         'selected_city': selected_city,
         'search_query': search_query,
         'home_advertisements': home_advertisements,
+        'feed_cursor': feed_cursor,
     }
     return render(request, 'home.html', context)
 
 def load_more_products(request):
-    """API endpoint برای لود محصولات بیشتر - ساده و سریع"""
+    """
+    API endpoint برای لود محصولات بیشتر (infinite scroll)
+    - حالت کرسر (cursor): صفحه بعد با شرط seek روی ایندکس ترکیبی، بدون OFFSET و COUNT
+    - حالت صفحه (page): برای سازگاری با کلاینت‌های قدیمی
+    تعداد کل فقط با include_total=1 محاسبه می‌شود.
+    """
     from django.http import JsonResponse
-    from django.core.paginator import Paginator
-    
+
+    page_size = 20
     try:
         # دریافت پارامترهای فیلتر
         city_id = request.GET.get('city_id')
         search_query = request.GET.get('q')
-        page = int(request.GET.get('page', 1))
-        
-        print(f"Load more products - page: {page}, city_id: {city_id}")
-        
+        cursor_token = request.GET.get('cursor')
+        include_total = request.GET.get('include_total') == '1'
+
+        try:
+            cursor = decode_feed_cursor(cursor_token) if cursor_token else None
+        except ValueError:
+            return JsonResponse({
+                'products': [],
+                'has_next': False,
+                'error': 'invalid cursor'
+            }, status=400)
+
         # نمایش محصولات با امکان فیلتر
-        products_qs = Product.objects.filter(is_approved=True)
-        print(f"Total products before filters: {products_qs.count()}")
-        
+        products_qs = Product.objects.filter(is_approved=True).select_related('city').with_primary_image()
+
         # فیلتر بر اساس شهر
         if city_id:
             products_qs = products_qs.filter(city_id=city_id)
-            print(f"Products after city filter: {products_qs.count()}")
-        
+
         # فیلتر جستجو
         if search_query:
-            products_qs = products_qs.filter(
-                Q(name_fa__icontains=search_query) |
-                Q(description_fa__icontains=search_query)
-            ).distinct()
-            print(f"Products after search filter: {products_qs.count()}")
-        
-        # Order products by priority and date
-        products_qs = products_qs.order_by(
-            '-is_featured',
-            '-is_suggested', 
-            '-is_discounted',
-            '-created_at'
-        )
-        
-        # Simple pagination
-        paginator = Paginator(products_qs, 20)
-        page_obj = paginator.get_page(page)
-        
-        print(f"Total products: {paginator.count}, Page: {page}, Has next: {page_obj.has_next()}")
-        
+            products_qs = search_products(products_qs, search_query)
+
+        page = None
+        if cursor is not None or 'page' not in request.GET:
+            page_products, next_cursor = feed_page_after(products_qs, cursor, page_size)
+            has_next = next_cursor is not None
+        else:
+            page = max(int(request.GET.get('page', 1)), 1)
+            offset = (page - 1) * page_size
+            rows = list(products_qs.order_by(*FEED_ORDERING)[offset:offset + page_size + 1])
+            has_next = len(rows) > page_size
+            page_products = rows[:page_size]
+            next_cursor = encode_feed_cursor(page_products[-1]) if has_next else None
+
         # Convert products to JSON
-        from django.utils import timezone
-        
         products_data = []
-        for product in page_obj:
+        now = timezone.now()
+        for product in page_products:
             # Calculate natural time
-            time_diff = timezone.now() - product.created_at
+            time_diff = now - product.created_at
             if time_diff.days > 0:
                 created_at_natural = f"{time_diff.days} روز پیش"
             elif time_diff.seconds > 3600:
@@ -266,14 +297,23 @@ def load_more_products(request):
                 created_at_natural = f"{minutes} دقیقه پیش"
             else:
                 created_at_natural = "همین الان"
-            
+
+            # ابعاد و placeholder عکس از دیتابیس (بدون خواندن فایل)
+            image_width, image_height = product.card_image_size or (None, None)
+            placeholder = product.card_image_placeholder
             products_data.append({
                 'id': product.id,
                 'name': product.name_fa or product.name_en or product.name_ps or 'نامشخص',
                 'price': product.price or 0,
                 'discount_price': product.discount_price,
                 'city': product.city.name if product.city else 'نامشخص',
-                'image': product.images.first().image.url if product.images.first() else None,
+                'image': product.card_image_url,
+                'image_srcset': product.card_image_srcset,
+                'image_webp_srcset': product.card_image_webp_srcset,
+                'image_width': image_width,
+                'image_height': image_height,
+                'image_color': placeholder['color'],
+                'image_blurhash': placeholder['blurhash'],
                 'is_featured': product.is_featured,
                 'is_discounted': product.is_discounted,
                 'is_suggested': product.is_suggested,
@@ -282,27 +322,26 @@ def load_more_products(request):
                 'url': f'/app/product/{product.id}/',
                 'type': 'product'
             })
-        
+
         response_data = {
             'products': products_data,
-            'has_next': page_obj.has_next(),
-            'current_page': page,
-            'total_pages': paginator.num_pages,
-            'total_products': paginator.count
+            'has_next': has_next,
+            'next_cursor': next_cursor,
         }
-        
-        print(f"Response products count: {len(products_data)}")
-        print(f"Response has_next: {page_obj.has_next()}")
-        print(f"Response total_products: {paginator.count}")
+        if page is not None:
+            response_data['current_page'] = page
+        if include_total:
+            total_products = products_qs.count()
+            response_data['total_products'] = total_products
+            response_data['total_pages'] = (total_products + page_size - 1) // page_size
         return JsonResponse(response_data)
-        
+
     except Exception as e:
         print(f"Error in load_more_products: {str(e)}")
         return JsonResponse({
             'products': [],
             'has_next': False,
-            'current_page': 1,
-            'total_pages': 0,
+            'next_cursor': None,
             'error': str(e)
         })
 
@@ -456,12 +495,7 @@ from django.template.loader import render_to_string
 def product_list(request):
     """Product list view"""
     # Get active advertisements for products page
-    advertisements = Advertisement.objects.filter(
-        location='products',
-        is_active=True,
-        start_date__lte=timezone.now(),
-        end_date__gte=timezone.now()
-    ).order_by('-created_at')[:3]  # Get up to 3 most recent ads
+    advertisements = active_advertisements('products', ordering=('-created_at',))[:3]  # Get up to 3 most recent ads
 
     # Get filter parameters
     category_id = request.GET.get('category')
@@ -470,64 +504,50 @@ def product_list(request):
     search_query = request.GET.get('q')
     sort_by = request.GET.get('sort', '-created_at')
     price_range = request.GET.get('price_range')
+    condition = request.GET.get('condition')
     tag_id = request.GET.get('tag')
     is_featured = request.GET.get('featured') == 'true'
     is_discounted = request.GET.get('discounted') == 'true'
     
-    # Base queryset
-    products = Product.objects.filter(is_approved=True)
-    
     # Get featured, suggested and discounted products
-    featured_products = Product.objects.filter(is_approved=True, is_featured=True).order_by('-created_at')[:8]
-    suggested_products = Product.objects.filter(is_approved=True, is_suggested=True).order_by('-created_at')[:8]
-    discounted_products = Product.objects.filter(is_approved=True, is_discounted=True).order_by('-created_at')[:8]
-    
-    # Apply filters
-    if main_category_id:
-        # Get all categories that belong to this main category
-        categories = Category.objects.filter(id=main_category_id)
-        products = products.filter(category__in=categories)
-    elif category_id:
-        products = products.filter(category_id=category_id)
-    if city_id:
-        products = products.filter(city_id=city_id)
+    featured_products = Product.objects.filter(is_approved=True, is_featured=True).for_cards().order_by('-created_at')[:8]
+    suggested_products = Product.objects.filter(is_approved=True, is_suggested=True).for_cards().order_by('-created_at')[:8]
+    discounted_products = Product.objects.filter(is_approved=True, is_discounted=True).for_cards().order_by('-created_at')[:8]
+    
+    # فیلترهای غیر بُعدی: پایه شمارش فیلترها (facets)
+    products = Product.objects.filter(is_approved=True)
     if search_query:
-        products = products.filter(
-            Q(name_fa__icontains=search_query) |
-            Q(description_fa__icontains=search_query) |
-            Q(tags__name_fa__icontains=search_query)
-        ).distinct()
-    if price_range:
-        if price_range == '0-1000':
-            products = products.filter(price__gte=0, price__lte=1000)
-        elif price_range == '1000-5000':
-            products = products.filter(price__gt=1000, price__lte=5000)
-        elif price_range == '5000-10000':
-            products = products.filter(price__gt=5000, price__lte=10000)
-        elif price_range == '10000-50000':
-            products = products.filter(price__gt=10000, price__lte=50000)
-        elif price_range == '50000-100000':
-            products = products.filter(price__gt=50000, price__lte=100000)
-        elif price_range == '100000+':
-            products = products.filter(price__gt=100000)
+        products = search_products(products, search_query)
     if tag_id:
         products = products.filter(tags__id=tag_id)
     if is_featured:
         products = products.filter(is_featured=True)
     if is_discounted:
         products = products.filter(is_discounted=True)
+
+    # یک کوئری گروه‌بندی شده (یا کش) برای شمارش شهر، دسته‌بندی، قیمت و وضعیت
+    selected_category_id = main_category_id or category_id
+    facets = count_facets(
+        facet_rows(products, facet_signature(search_query, tag_id, is_featured, is_discounted)),
+        {'city': city_id, 'category': selected_category_id, 'price': price_range, 'condition': condition},
+    )
     
-    # Apply sorting
-    products = products.order_by(sort_by)
-    
-    # Get selected city name if any
-    selected_city = None
+    # Apply facet filters
+    if selected_category_id:
+        products = products.filter(category_id=selected_category_id)
     if city_id:
-        try:
-            city = City.objects.get(id=city_id)
-            selected_city = city.name
-        except (City.DoesNotExist, ValueError):
-            pass
+        products = products.filter(city_id=city_id)
+    if price_range in PRICE_RANGE_FILTERS:
+        products = products.filter(PRICE_RANGE_FILTERS[price_range])
+    if condition:
+        products = products.filter(condition=condition)
+    products = products.for_cards()
+    
+    # Apply sorting (جستجو بدون مرتب‌سازی صریح: مرتبط‌ترین اول)
+    if search_query and 'sort' not in request.GET:
+        products = products.order_by('-search_rank', '-created_at')
+    else:
+        products = products.order_by(sort_by)
     
     context = {
         'advertisements': advertisements,
@@ -537,100 +557,42 @@ def product_list(request):
         'discounted_products': discounted_products,
         'selected_category': category_id,
         'selected_main_category': main_category_id,
-        'selected_city': selected_city,
-        'selected_city_id': city_id,
         'search_query': search_query,
         'sort_by': sort_by,
         'selected_price_range': price_range,
+        'selected_condition': condition,
         'selected_tag': tag_id,
         'is_featured': is_featured,
         'is_discounted': is_discounted,
+        'total_products': facets['total'],
     }
-    context.update(get_cities_context(request))
-    context.update(get_categories_context())
-    context.update(get_price_ranges())
+    # شهرها با شمارش facet به جای COUNT روی کل محصولات در get_cities_context
+    context.update(get_facet_context(facets, city_id))
+    categories = [copy.copy(category) for category in get_categories_context()['categories']]
+    for category in categories:
+        category.product_count = facets['category'].get(category.id, 0)
+    context.update(categories=categories, all_categories=categories, main_categories=categories)
     context.update(get_tags_context())
     return render(request, 'product_list.html', context)
 
 def product_detail(request, product_id):
-    """نمایش جزئیات محصول با کش"""
-    # بررسی کش برای جزئیات محصول
-    cached_product = CacheManager.get_cached_product_detail(product_id)
-    
-    if cached_product:
-        # استفاده از کش
-        product_data = cached_product
-        product = None  # برای سازگاری با کد موجود
-    else:
-        # دریافت از دیتابیس
-        product = get_object_or_404(
-            Product.objects.select_related('category')
-            .prefetch_related('tags', 'images'),
-            pk=product_id,
-            is_approved=True
-        )
-        
-        # کش کردن جزئیات محصول
-        CacheManager.cache_product_detail(product)
-        
-        product_data = {
-            'id': product.id,
-            'title': product.name_fa,
-            'description': product.description_fa,
-            'price': str(product.price),
-            'city_name': product.city.name if product.city else None,
-            'category_name': product.category.name_fa if product.category else None,
-            'image_url': product.image.url if hasattr(product, 'image') and product.image else None,
-            'created_at': product.created_at.isoformat(),
-            'is_suggested': product.is_suggested,
-            'owner_name': product.owner.username if hasattr(product, 'owner') and product.owner else None,
-        }
-    
-    # دریافت محصولات مرتبط
-    if product:
-        related_products = Product.objects.filter(
-            category=product.category, 
-            is_approved=True
-        ).exclude(pk=product_id).order_by('?')[:4]
-        
-        seller_products = Product.objects.filter(
-            seller_contact=product.seller_contact,
-            is_approved=True
-        ).exclude(pk=product_id).order_by('-created_at')[:4]
-    else:
-        # اگر از کش استفاده می‌کنیم، محصولات مرتبط را از دیتابیس می‌گیریم
-        category_name = product_data.get('category_name')
-        if category_name:
-            category = Category.objects.filter(name_fa=category_name).first()
-            if category:
-                related_products = Product.objects.filter(
-                    category=category,
-                    is_approved=True
-                ).exclude(pk=product_id).order_by('?')[:4]
-            else:
-                related_products = []
-        else:
-            related_products = []
-        
-        seller_products = []  # برای سادگی، seller_products را خالی می‌گذاریم
-    
-    if not product:
-        # اگر از کش فقط آیدی یا دیکشنری داشتیم، محصول را از دیتابیس بگیر
-        product = Product.objects.get(pk=product_id)
-    
-    # دریافت کامنت‌های محصول از UserFeedback
-    comments = UserFeedback.objects.filter(
-        subject__icontains=f"نظر محصول {product.id}"
-    ).order_by('-timestamp')[:10]
+    """نمایش جزئیات محصول از مدل کش شده صفحه (در کش معتبر فقط کوئری کارت‌های محصولات دیگر)"""
+    product_page = CacheManager.get_cached_product_detail(product_id)
+    if product_page is None:
+        product_page = CacheManager.cache_product_detail(product_id)
+        if product_page is None:
+            raise Http404('محصول یافت نشد')
     
     # فرم کامنت
     comment_form = ProductCommentForm()
     
+    related_products, seller_products = page_cards(product_page)
     context = {
-        'product': product,
+        'product': product_page,
         'related_products': related_products,
         'seller_products': seller_products,
-        'comments': comments,
+        'comments': product_page['recent_comments'],
+        'comment_count': product_page['comment_count'],
         'comment_form': comment_form,
     }
     return render(request, 'product_detail.html', context)
@@ -639,7 +601,7 @@ def product_detail(request, product_id):
 @csrf_protect
 @login_required
 def add_product_comment(request, product_id):
-    """افزودن کامنت به محصول با UserFeedback"""
+    """افزودن کامنت به محصول"""
     if request.method == 'POST':
         product = get_object_or_404(Product, pk=product_id, is_approved=True)
         comment_text = request.POST.get('comment_text', '').strip()
@@ -652,21 +614,20 @@ def add_product_comment(request, product_id):
         elif len(comment_text) > 500:
             messages.error(request, 'نظر شما نمی‌تواند بیش از ۵۰۰ کاراکتر باشد.')
         else:
-            # ایجاد UserFeedback به عنوان کامنت
-            comment = UserFeedback.objects.create(
+            # تعداد نظرات و کش صفحه محصول در signals به‌روز می‌شوند
+            ProductComment.objects.create(
+                product=product,
                 email=request.user.email or request.user.username,
-                subject=f"نظر محصول {product.id} - {product.name_fa[:30]}",
                 message=comment_text,
                 user=request.user
             )
             
             # ارسال نوتیفیکیشن به صاحب محصول (اگر کاربر لاگین کرده باشد)
             if product.user and product.user != request.user:
-                UserFeedback.objects.create(
-                    email=product.user.email or product.user.username,
-                    subject=f"NOTIFICATION_COMMENT_{product.id}_{comment.id}",
-                    message=f'کاربر {request.user.username} روی محصول "{product.name_fa}" نظر جدیدی گذاشته است.',
-                    user=product.user
+                notify(
+                    product.user, 'comment',
+                    f'کاربر {request.user.username} روی محصول "{product.name_fa}" نظر جدیدی گذاشته است.',
+                    link=reverse('app:product_detail', args=[product.id]) + '#comments',
                 )
             
             messages.success(request, 'نظر شما با موفقیت ثبت شد.')
@@ -674,31 +635,51 @@ def add_product_comment(request, product_id):
     return redirect('app:product_detail', product_id=product_id)
 
 
+def get_conversation_param(request):
+    """شناسه گفتگو از GET/POST (فروشنده برای پاسخ به یک خریدار مشخص)"""
+    value = request.GET.get('conversation') or request.POST.get('conversation') or ''
+    return int(value) if value.isdigit() else None
+
+
 @login_required
 def start_chat(request, product_id):
     """شروع چت با صاحب محصول"""
     product = get_object_or_404(Product, pk=product_id, is_approved=True)
-    
-    # بررسی اینکه کاربر با خودش چت نکند
-    if product.user == request.user:
-        messages.error(request, 'نمی‌توانید با خودتان چت کنید!')
-        return redirect('app:product_detail', product_id=product_id)
-    
-    # بررسی اینکه صاحب محصول لاگین کرده باشد
-    if not product.user:
-        messages.error(request, 'صاحب این محصول در دسترس نیست!')
-        return redirect('app:product_detail', product_id=product_id)
+    conversation_id = get_conversation_param(request)
+    
+    if conversation_id:
+        # ورود هر دو طرف به یک گفتگوی مشخص
+        conversation = find_conversation(request.user, product, conversation_id)
+        if conversation is None:
+            raise Http404
+        other_user = conversation.other_user(request.user)
+    else:
+        # بررسی اینکه کاربر با خودش چت نکند
+        if product.user == request.user:
+            messages.error(request, 'نمی‌توانید با خودتان چت کنید!')
+            return redirect('app:product_detail', product_id=product_id)
+        
+        # بررسی اینکه صاحب محصول لاگین کرده باشد
+        if not product.user:
+            messages.error(request, 'صاحب این محصول در دسترس نیست!')
+            return redirect('app:product_detail', product_id=product_id)
+        
+        # گفتگو با اولین پیام ساخته می‌شود
+        conversation = find_conversation(request.user, product)
+        other_user = product.user
     
     # دریافت پیام‌های قبلی این چت
-    chat_messages = UserFeedback.objects.filter(
-        subject__startswith=f"CHAT_{product_id}_",
-        user__in=[request.user, product.user]
-    ).order_by('timestamp')
+    chat_messages = []
+    if conversation:
+        chat_messages = recent_messages(conversation)
+        mark_read(conversation, request.user)
     
     context = {
         'product': product,
-        'other_user': product.user,
+        'other_user': other_user,
+        'conversation': conversation,
         'chat_messages': chat_messages,
+        'last_message_id': chat_messages[-1].id if chat_messages else 0,
     }
     return render(request, 'chat.html', context)
 
@@ -716,29 +697,30 @@ def send_chat_message(request, product_id):
         if len(message_text) > 500:
             return JsonResponse({'success': False, 'error': 'پیام نمی‌تواند بیش از ۵۰۰ کاراکتر باشد'})
         
+        conversation_id = get_conversation_param(request)
+        conversation = find_conversation(request.user, product, conversation_id)
+        if conversation is None:
+            if conversation_id or not product.user or product.user == request.user:
+                return JsonResponse({'success': False, 'error': 'گفتگو یافت نشد'})
+            conversation = get_or_start_conversation(product, request.user)
+        
         # ایجاد پیام چت
-        chat_message = UserFeedback.objects.create(
-            email=request.user.email or request.user.username,
-            subject=f"CHAT_{product_id}_{request.user.id}_{product.user.id}",
-            message=message_text,
-            user=request.user
-        )
+        chat_message = post_message(conversation, request.user, message_text)
         
         # ارسال نوتیفیکیشن به گیرنده
-        if product.user != request.user:
-            UserFeedback.objects.create(
-                email=product.user.email or product.user.username,
-                subject=f"NOTIFICATION_CHAT_{product_id}_{chat_message.id}",
-                message=f'پیام جدید از {request.user.username} درباره محصول "{product.name_fa}"',
-                user=product.user
-            )
+        notify(
+            conversation.other_user(request.user), 'chat',
+            f'پیام جدید از {request.user.username} درباره محصول "{product.name_fa}"',
+            link=reverse('app:start_chat', args=[product_id]) + f'?conversation={conversation.id}',
+        )
         
         return JsonResponse({
             'success': True,
             'message': message_text,
             'sender': request.user.username,
             'message_id': chat_message.id,
-            'timestamp': timezone.now().strftime('%H:%M')
+            'conversation_id': conversation.id,
+            'timestamp': timezone.localtime(chat_message.created_at).strftime('%H:%M')
         })
     
     return JsonResponse({'success': False, 'error': 'درخواست نامعتبر'})
@@ -748,24 +730,19 @@ def send_chat_message(request, product_id):
 def get_chat_messages(request, product_id):
     """دریافت پیام‌های چت (برای AJAX)"""
     product = get_object_or_404(Product, pk=product_id, is_approved=True)
-    last_message_id = request.GET.get('last_message_id', 0)
-    
-    # دریافت پیام‌های جدید
-    chat_messages = UserFeedback.objects.filter(
-        subject__startswith=f"CHAT_{product_id}_",
-        user__in=[request.user, product.user],
-        id__gt=last_message_id
-    ).order_by('timestamp')
-    
-    messages_data = []
-    for msg in chat_messages:
-        messages_data.append({
-            'id': msg.id,
-            'message': msg.message,
-            'sender': msg.user.username,
-            'is_own': msg.user == request.user,
-            'timestamp': msg.timestamp.strftime('%H:%M')
-        })
+    last_message_id = request.GET.get('last_message_id', '0')
+    last_message_id = int(last_message_id) if last_message_id.isdigit() else 0
+    
+    conversation = find_conversation(request.user, product, get_conversation_param(request))
+    if conversation is None:
+        return JsonResponse({'success': True, 'messages': []})
+    
+    # دریافت پیام‌های جدید (پیمایش بازه روی ایندکس (conversation_id, id))
+    messages_data = [
+        serialize_message(msg, conversation, request.user)
+        for msg in messages_after(conversation, last_message_id)
+    ]
+    mark_read(conversation, request.user)
     
     return JsonResponse({
         'success': True,
@@ -773,20 +750,64 @@ def get_chat_messages(request, product_id):
     })
 
 
+# اتصال SSE بعد از این مدت بسته می‌شود و مرورگر دوباره وصل می‌شود (آزاد شدن منابع worker)
+EVENT_STREAM_LIFETIME = 60 * 5
+EVENT_STREAM_HEARTBEAT = 15
+
+
+def allow_event_origin(request, response):
+    """PUSH_EVENTS_URL روی دامنه دیگر (مثلا events.soodava.com): اجازه EventSource با کوکی به صفحات سایت"""
+    origin = request.headers.get('Origin')
+    if origin and origin in settings.CSRF_TRUSTED_ORIGINS:
+        response['Access-Control-Allow-Origin'] = origin
+        response['Access-Control-Allow-Credentials'] = 'true'
+        patch_vary_headers(response, ['Origin'])
+    return response
+
+
+async def event_stream(request):
+    """
+    Server-Sent Events: پیام‌های چت و تعداد اعلان‌های کاربر (فقط زیر ASGI، پروسه events).
+    زیر WSGI یا برای کاربر مهمان 204 برمی‌گردد و مرورگر دوباره وصل نمی‌شود؛ صفحات به polling برمی‌گردند.
+    """
+    if not isinstance(request, ASGIRequest):
+        return allow_event_origin(request, HttpResponse(status=204))
+    user = await request.auser()
+    if not user.is_authenticated:
+        return allow_event_origin(request, HttpResponse(status=204))
+
+    async def events():
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + EVENT_STREAM_LIFETIME
+        async with subscribe(user_channel(user.id), BROADCAST_CHANNEL) as queue:
+            yield 'retry: 5000\n\n'
+            while True:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    payload = await asyncio.wait_for(queue.get(), min(EVENT_STREAM_HEARTBEAT, remaining))
+                except asyncio.TimeoutError:
+                    # comment برای زنده نگه داشتن اتصال از پشت proxy
+                    yield ': ping\n\n'
+                    continue
+                yield format_event(payload)
+
+    response = StreamingHttpResponse(events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return allow_event_origin(request, response)
+
+
 @login_required
 def notifications(request):
     """نمایش نوتیفیکیشن‌های کاربر"""
     # دریافت نوتیفیکیشن‌های کاربر
-    user_notifications = UserFeedback.objects.filter(
-        user=request.user,
-        subject__startswith="NOTIFICATION_"
-    ).order_by('-timestamp')
+    # وضعیت خوانده شدن قبل از علامت‌گذاری برای نمایش اعلان‌های جدید
+    user_notifications = user_feed(request.user)
     
-    # علامت‌گذاری همه نوتیفیکیشن‌ها به عنوان خوانده شده
-    for notification in user_notifications:
-        if "_READ_" not in notification.subject:
-            notification.subject = notification.subject + "_READ_"
-            notification.save()
+    # علامت‌گذاری همه نوتیفیکیشن‌ها به عنوان خوانده شده (یک UPDATE و یک INSERT دسته‌ای)
+    read_all_notifications(request.user)
     
     context = {
         'notifications': user_notifications,
@@ -798,13 +819,7 @@ def notifications(request):
 def get_unread_notifications_count(request):
     """دریافت تعداد نوتیفیکیشن‌های خوانده نشده"""
     try:
-        count = UserFeedback.objects.filter(
-            user=request.user,
-            subject__startswith="NOTIFICATION_"
-        ).exclude(
-            subject__contains="_READ_"
-        ).count()
-        return JsonResponse({'count': count})
+        return JsonResponse({'count': unread_count(request.user)})
     except Exception as e:
         print(f"Error in get_unread_notifications_count: {e}")
         return JsonResponse({'count': 0})
@@ -814,20 +829,18 @@ def get_unread_notifications_count(request):
 def get_recent_notifications(request):
     """دریافت نوتیفیکیشن‌های اخیر برای dropdown"""
     try:
-        notifications = UserFeedback.objects.filter(
-            user=request.user,
-            subject__startswith="NOTIFICATION_"
-        ).order_by('-timestamp')[:5]
+        notifications = user_feed(request.user, limit=5)
         
         notifications_data = []
         for notification in notifications:
-            is_read = "_READ_" in notification.subject
             notifications_data.append({
                 'id': notification.id,
                 'message': notification.message,
-                'subject': notification.subject,
-                'is_read': is_read,
-                'timestamp': notification.timestamp.isoformat()
+                'kind': notification.kind,
+                'link': notification.link,
+                'is_read': notification.is_read,
+                'read_url': notification.read_url,
+                'timestamp': notification.created_at.isoformat()
             })
         
         return JsonResponse({
@@ -845,19 +858,25 @@ def get_recent_notifications(request):
 @login_required
 def mark_notification_read(request, notification_id):
     """علامت‌گذاری نوتیفیکیشن به عنوان خوانده شده"""
-    try:
-        notification = UserFeedback.objects.get(
-            id=notification_id, 
-            user=request.user,
-            subject__startswith="NOTIFICATION_"
-        )
-        # Add _READ_ to subject to mark as read
-        if "_READ_" not in notification.subject:
-            notification.subject = notification.subject + "_READ_"
-            notification.save()
+    if read_notification(request.user, notification_id) or request.user.notifications.filter(pk=notification_id).exists():
         return JsonResponse({'success': True})
-    except UserFeedback.DoesNotExist:
-        return JsonResponse({'success': False, 'error': 'نوتیفیکیشن یافت نشد'})
+    return JsonResponse({'success': False, 'error': 'نوتیفیکیشن یافت نشد'})
+
+
+@login_required
+def mark_broadcast_read(request, broadcast_id):
+    """علامت‌گذاری اعلان همگانی به عنوان خوانده شده"""
+    if read_broadcast(request.user, broadcast_id) or Broadcast.objects.filter(pk=broadcast_id).exists():
+        return JsonResponse({'success': True})
+    return JsonResponse({'success': False, 'error': 'نوتیفیکیشن یافت نشد'})
+
+
+@login_required
+def mark_all_notifications_read(request):
+    """علامت‌گذاری همه نوتیفیکیشن‌ها به عنوان خوانده شده"""
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'error': 'درخواست نامعتبر'})
+    return JsonResponse({'success': True, 'count': read_all_notifications(request.user)})
 
 
 @staff_member_required
@@ -871,20 +890,11 @@ def send_notification_to_all_users(request):
             messages.error(request, 'عنوان و پیام نمی‌تواند خالی باشد!')
             return redirect('app:send_notification_to_all_users')
         
-        # ارسال به همه کاربران
-        users = User.objects.filter(is_active=True)
-        sent_count = 0
-        
-        for user in users:
-            UserFeedback.objects.create(
-                email=user.email or user.username,
-                subject=f"NOTIFICATION_ADMIN_{timezone.now().strftime('%Y%m%d_%H%M%S')}",
-                message=f"{title}\n\n{message}",
-                user=user
-            )
-            sent_count += 1
+        # یک ردیف برای همه کاربران؛ وضعیت خوانده شدن هر کاربر هنگام خواندن ثبت می‌شود
+        broadcast(f"{title}\n\n{message}", sender=request.user)
         
-        messages.success(request, f'نوتیفیکیشن با موفقیت به {sent_count} کاربر ارسال شد!')
+        # بدون شمارش کاربران: ارسال همگانی به تعداد کاربران بستگی ندارد
+        messages.success(request, 'نوتیفیکیشن با موفقیت برای همه کاربران ارسال شد!')
         return redirect('app:send_notification_to_all_users')
     
     return render(request, 'admin/send_notification.html')
@@ -904,12 +914,7 @@ def send_notification_to_user(request):
         
         try:
             user = User.objects.get(username=username)
-            UserFeedback.objects.create(
-                email=user.email or user.username,
-                subject=f"NOTIFICATION_ADMIN_{timezone.now().strftime('%Y%m%d_%H%M%S')}",
-                message=f"{title}\n\n{message}",
-                user=user
-            )
+            notify(user, 'admin', f"{title}\n\n{message}")
             messages.success(request, f'نوتیفیکیشن با موفقیت به کاربر {username} ارسال شد!')
         except User.DoesNotExist:
             messages.error(request, f'کاربر با نام کاربری {username} یافت نشد!')
@@ -932,50 +937,6 @@ from django.contrib import messages
 from .forms import ProductForm
 from .models import Product, ProductImage
 
-def compress_image(image_file, max_size=(600, 600), quality=50):
-    """
-    فشرده‌سازی فوق‌العاده سریع برای سرعت حداکثر:
-    - کاهش کیفیت به 50 برای سرعت بیشتر
-    - کاهش اندازه عکس به 600x600 برای سرعت بیشتر
-    - پرهیز از پردازش فایل‌های کوچک
-    - استفاده از الگوریتم‌های سریع‌ترین
-    """
-    try:
-        # اگر فایل خیلی کوچک است، همان را برگردان
-        original_size_bytes = getattr(image_file, 'size', None)
-        if original_size_bytes is not None and original_size_bytes <= 150 * 1024:  # 150KB
-            return image_file
-
-        # باز کردن تصویر
-        img = Image.open(image_file)
-
-        # تبدیل به RGB اگر RGBA/LA/P باشد (سریع‌تر)
-        if img.mode in ('RGBA', 'LA', 'P'):
-            img = img.convert('RGB')
-
-        # کاهش ابعاد اگر بزرگ است (الگوریتم سریع‌ترین)
-        if img.width > max_size[0] or img.height > max_size[1]:
-            img.thumbnail(max_size, Image.Resampling.NEAREST)
-
-        # ذخیره با پارامترهای سریع‌ترین
-        output = io.BytesIO()
-        img.save(
-            output,
-            format='JPEG',
-            quality=quality,
-            optimize=False,
-            progressive=False,
-            subsampling=2
-        )
-        output.seek(0)
-
-        # نام فایل خروجی
-        filename = os.path.splitext(image_file.name)[0] + '.jpg'
-        return ContentFile(output.getvalue(), filename)
-    except Exception:
-        # در صورت خطا، فایل اصلی را استفاده کن
-        return image_file
-
 def get_product_form_context(form):
     """تابع کمکی برای ایجاد context فرم محصول"""
     return {
@@ -1063,12 +1024,10 @@ def register_product(request):
                     product.delete()
                     return render(request, 'register_product.html', get_product_form_context(form))
                 
-                # ذخیره عکس‌ها با فشرده‌سازی فوق‌العاده سریع
+                # فقط ذخیره فایل‌های اصلی؛ نسخه‌های thumb/card/full بعد از پاسخ در image_pool ساخته می‌شوند
                 try:
-                    # پردازش سریع عکس‌ها بدون نمایش پیام
-                    for img in images:
-                        compressed_img = compress_image(img)
-                        ProductImage.objects.create(product=product, image=compressed_img)
+                    image_ids = [ProductImage.objects.create(product=product, image=img, is_processing=True).pk for img in images]
+                    schedule_derivatives(image_ids)
                     
                     messages.success(request, "محصول شما با موفقیت ثبت شد و در سایت نمایش داده خواهد شد.")
                     return redirect('app:home')
@@ -1265,10 +1224,10 @@ def user_dashboard(request):
     })
     
     # فیلتر کردن محصولات بر اساس کاربر
-    products = Product.objects.filter(user=request.user).order_by('-created_at')
+    products = Product.objects.filter(user=request.user).for_cards().order_by('-created_at')
     
     # محصولات پیشنهادی (بدون دکمه حذف)
-    suggested_products = Product.objects.filter(is_suggested=True, is_approved=True).order_by('-created_at')[:6]
+    suggested_products = Product.objects.filter(is_suggested=True, is_approved=True).for_cards().order_by('-created_at')[:6]
     
     # لیست آگهی‌های شغلی کاربر
     user_jobads = JobAd.objects.filter(owner_profile_id=profile.profile_id)
@@ -1295,9 +1254,7 @@ def delete_user_product(request, pk):
 def landing(request):
     """Landing page view"""
     # Get cities with product counts
-    cities = City.objects.annotate(
-        product_count=Count('product', filter=Q(product__is_approved=True))
-    ).order_by('-product_count')
+    cities = sorted(get_snapshot()['cities'], key=lambda city: -city.product_count)
     
     context = {
         'cities': cities,
@@ -1351,7 +1308,7 @@ def review_abuse_report(request, pk):
 @login_required
 def user_products(request):
     """نمایش محصولات کاربر"""
-    products = Product.objects.filter(user=request.user).order_by('-created_at')
+    products = Product.objects.filter(user=request.user).with_primary_image().order_by('-created_at')
     
     context = {
         'products': products,
@@ -1368,34 +1325,29 @@ def category_detail(request, category_id):
         category=category,
         is_approved=True
     )
-    
-    # اولویت‌بندی محصولات: ویژه -> پیشنهادی -> تخفیف‌دار -> بقیه
-    products_data = list(products_qs)
-    
-    featured_products = sorted([p for p in products_data if p.is_featured], key=lambda p: p.created_at, reverse=True)
-    suggested_products = sorted([p for p in products_data if p.is_suggested and not p.is_featured], key=lambda p: p.created_at, reverse=True)
-    discounted_products = sorted([p for p in products_data if p.is_discounted and not p.is_featured and not p.is_suggested], key=lambda p: p.created_at, reverse=True)
-    remaining_products = sorted([
-        p for p in products_data if not (p.is_featured or p.is_suggested or p.is_discounted)
-    ], key=lambda p: p.created_at, reverse=True)
-    
-    # ترکیب محصولات با اولویت
-    all_products = featured_products + suggested_products + discounted_products + remaining_products
-    
-    # Pagination
-    paginator = Paginator(all_products, 20)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    
+
+    # شمارش فیلترهای شهر، قیمت و وضعیت با یک کوئری گروه‌بندی شده (یا از کش)
+    city_id = request.GET.get('city_id')
+    price_range = request.GET.get('price_range')
+    condition = request.GET.get('condition')
+    facets = count_facets(
+        facet_rows(products_qs, facet_signature(category_id=category.id)),
+        {'city': city_id, 'category': None, 'price': price_range, 'condition': condition},
+    )
+    if city_id:
+        products_qs = products_qs.filter(city_id=city_id)
+    if price_range in PRICE_RANGE_FILTERS:
+        products_qs = products_qs.filter(PRICE_RANGE_FILTERS[price_range])
+    if condition:
+        products_qs = products_qs.filter(condition=condition)
+
     context = {
         'category': category,
-        'products': page_obj,
-        'total_products': len(products_data),
-        'featured_count': len(featured_products),
-        'suggested_count': len(suggested_products),
-        'discounted_count': len(discounted_products),
+        'selected_price_range': price_range,
+        'selected_condition': condition,
     }
-    context.update(get_cities_context(request))
+    context.update(get_priority_products_context(request, products_qs))
+    context.update(get_facet_context(facets, city_id))
     context.update(get_categories_context())
     return render(request, 'category_detail.html', context)
 
@@ -1403,38 +1355,16 @@ def tag_detail(request, tag_id):
     """نمایش محصولات یک برچسب"""
     tag = get_object_or_404(Tag, id=tag_id)
     
-    # دریافت محصولات برچسب با اولویت‌بندی
+    # دریافت محصولات برچسب
     products_qs = Product.objects.filter(
         tags=tag,
         is_approved=True
     )
     
-    # اولویت‌بندی محصولات: ویژه -> پیشنهادی -> تخفیف‌دار -> بقیه
-    products_data = list(products_qs)
-    
-    featured_products = sorted([p for p in products_data if p.is_featured], key=lambda p: p.created_at, reverse=True)
-    suggested_products = sorted([p for p in products_data if p.is_suggested and not p.is_featured], key=lambda p: p.created_at, reverse=True)
-    discounted_products = sorted([p for p in products_data if p.is_discounted and not p.is_featured and not p.is_suggested], key=lambda p: p.created_at, reverse=True)
-    remaining_products = sorted([
-        p for p in products_data if not (p.is_featured or p.is_suggested or p.is_discounted)
-    ], key=lambda p: p.created_at, reverse=True)
-    
-    # ترکیب محصولات با اولویت
-    all_products = featured_products + suggested_products + discounted_products + remaining_products
-    
-    # Pagination
-    paginator = Paginator(all_products, 20)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    
     context = {
         'tag': tag,
-        'products': page_obj,
-        'total_products': len(products_data),
-        'featured_count': len(featured_products),
-        'suggested_count': len(suggested_products),
-        'discounted_count': len(discounted_products),
     }
+    context.update(get_priority_products_context(request, products_qs))
     context.update(get_cities_context(request))
     context.update(get_categories_context())
     return render(request, 'tag_detail.html', context)
@@ -1444,49 +1374,58 @@ def search(request):
     query = request.GET.get('q', '')
     city_id = request.GET.get('city_id')
     
+    context = {
+        'query': query,
+        'city_id': city_id,
+    }
     if query:
-        products_qs = Product.objects.filter(
-            Q(name_fa__icontains=query) |
-            Q(description_fa__icontains=query) |
-            Q(tags__name_fa__icontains=query)
-        ).filter(is_approved=True).distinct()
+        products_qs = search_products(Product.objects.filter(is_approved=True), query)
         
         # فیلتر بر اساس شهر
         if city_id:
             products_qs = products_qs.filter(city_id=city_id)
         
-        # اولویت‌بندی محصولات: ویژه -> پیشنهادی -> تخفیف‌دار -> بقیه
-        products_data = list(products_qs)
-        
-        featured_products = sorted([p for p in products_data if p.is_featured], key=lambda p: p.created_at, reverse=True)
-        suggested_products = sorted([p for p in products_data if p.is_suggested and not p.is_featured], key=lambda p: p.created_at, reverse=True)
-        discounted_products = sorted([p for p in products_data if p.is_discounted and not p.is_featured and not p.is_suggested], key=lambda p: p.created_at, reverse=True)
-        remaining_products = sorted([
-            p for p in products_data if not (p.is_featured or p.is_suggested or p.is_discounted)
-        ], key=lambda p: p.created_at, reverse=True)
-        
-        # ترکیب محصولات با اولویت
-        all_products = featured_products + suggested_products + discounted_products + remaining_products
-        
-        # Pagination
-        paginator = Paginator(all_products, 20)
-        page_number = request.GET.get('page')
-        page_obj = paginator.get_page(page_number)
-        
-        products = page_obj
+        # در هر گروه اولویت، مرتبط‌ترین نتایج اول
+        ordering = ('-listing_rank', '-search_rank', '-created_at', '-id')
+        context.update(get_priority_products_context(request, products_qs, ordering=ordering))
+
+        # نتایج کم: احتمالا غلط تایپی؛ جستجوی تقریبی سه‌حرفی
+        if context['total_products'] < FUZZY_MIN_RESULTS and full_text_enabled():
+            with fuzzy_search_session():
+                fuzzy_qs = fuzzy_search_products(Product.objects.filter(is_approved=True), query)
+                if city_id:
+                    fuzzy_qs = fuzzy_qs.filter(city_id=city_id)
+                fuzzy_context = get_priority_products_context(request, fuzzy_qs, ordering=ordering)
+                # صفحه همین‌جا خوانده می‌شود، نه در قالب و بعد از پایان تراکنش
+                page = fuzzy_context['products']
+                page.object_list = list(page.object_list)
+            if fuzzy_context['total_products'] > context['total_products']:
+                context.update(fuzzy_context)
+                context['fuzzy_results'] = True
     else:
-        products = Product.objects.none()
-        page_obj = None
-    
-    context = {
-        'products': products,
-        'query': query,
-        'city_id': city_id,
-    }
+        context['products'] = Product.objects.none()
     context.update(get_cities_context(request))
     context.update(get_categories_context())
     return render(request, 'search_results.html', context)
 
+SUGGESTION_URL_NAMES = {
+    'category': 'app:category_detail',
+    'tag': 'app:tag_detail',
+    'product': 'app:product_detail',
+}
+
+def search_suggestions(request):
+    """پیشنهاد دسته‌بندی، برچسب و محصول برای پیشوند تایپ شده (از ایندکس حافظه، بدون کوئری)"""
+    from django.http import JsonResponse
+    try:
+        limit = min(max(int(request.GET.get('limit', 8)), 1), 20)
+    except ValueError:
+        limit = 8
+    suggestions = get_suggestions(request.GET.get('q', ''), get_language_suffix(), limit)
+    for item in suggestions:
+        item['url'] = reverse(SUGGESTION_URL_NAMES[item['type']], args=[item['id']])
+    return JsonResponse({'suggestions': suggestions})
+
 def contact(request):
     """صفحه تماس با ما"""
     if request.method == 'POST':
@@ -1773,7 +1712,7 @@ def jobs_list(request):
     city_id = request.GET.get('city')
     jobs = JobAd.objects.all()
     if query:
-        jobs = jobs.filter(title__icontains=query) | jobs.filter(description__icontains=query)
+        jobs = jobs.filter(normalized_text__contains=normalize_text(query))
     if city_id:
         jobs = jobs.filter(city_id=city_id)
     jobs = jobs.order_by('-created_at')
@@ -1829,11 +1768,7 @@ def contact_messages(request):
     # فیلتر بر اساس جستجو
     search_query = request.GET.get('q', '')
     if search_query:
-        messages_list = messages_list.filter(
-            Q(email__icontains=search_query) |
-            Q(subject__icontains=search_query) |
-            Q(message__icontains=search_query)
-        )
+        messages_list = messages_list.filter(normalized_text__contains=normalize_text(search_query))
     
     # فیلتر بر اساس تاریخ
     date_filter = request.GET.get('date', '')
@@ -1861,10 +1796,7 @@ def requests_list(request):
     # فیلتر بر اساس جستجو
     search_query = request.GET.get('q', '')
     if search_query:
-        requests_list = requests_list.filter(
-            Q(request_text__icontains=search_query) |
-            Q(contact__icontains=search_query)
-        )
+        requests_list = requests_list.filter(normalized_text__contains=normalize_text(search_query))
     
     context = {
         'requests': requests_list,
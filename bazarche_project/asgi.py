@@ -19,3 +19,8 @@ if 'DJANGO_SETTINGS_MODULE' not in os.environ:
         os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'bazarche_project.settings')
 
 application = get_asgi_application()
+
+# این پروسه فقط api/events/ را سرو می‌کند (ایندکس پیشنهاد جستجو را wsgi.py می‌سازد)
+from bazarche_app.push import check_config  # noqa: E402
+
+check_config()
@@ -120,12 +120,15 @@ TEMPLATES = [
                 'bazarche_app.context_processors.main_categories',
                 'bazarche_app.context_processors.search_query',
                 'bazarche_app.context_processors.sidebar_advertisements',
+                'bazarche_app.context_processors.push_events',
             ],
         },
     },
 ]
 
 WSGI_APPLICATION = 'bazarche_project.wsgi.application'
+# رویدادهای SSE (api/events/) فقط زیر ASGI فعال هستند؛ پروسه events در Procfile (DEPLOYMENT_GUIDE.md)
+ASGI_APPLICATION = 'bazarche_project.asgi.application'
 
 
 # Database
@@ -182,6 +185,12 @@ CACHES = {
     }
 }
 
+# کانال push رویدادهای SSE (bazarche_app/push.py)؛ با پروسه events همیشه لازم است، چون publish در
+# workerهای web اجرا می‌شود و اتصال‌ها در پروسه events هستند. None: فقط همان پروسه
+PUSH_REDIS_URL = 'redis://127.0.0.1:6379/4'
+# آدرس api/events/ روی پروسه events (مسیر proxy شده یا آدرس کامل)؛ None: صفحات EventSource باز نمی‌کنند و polling می‌کنند
+PUSH_EVENTS_URL = None
+
 # Session Configuration
 SESSION_ENGINE = 'django.contrib.sessions.backends.cache'
 SESSION_CACHE_ALIAS = 'sessions'
@@ -209,9 +218,17 @@ IMAGE_PROCESSING = {
     'FORMATS': ['JPEG', 'PNG', 'WEBP'],
     'WEBP_QUALITY': 80,
     'THUMBNAIL_SIZE': (300, 300),
-    'PROCESSING_THREADS': 4,  # استفاده از 4 هسته
+    'CARD_SIZE': (600, 600),  # کارت محصولات (نمایش 2x)
+    # سقف حجم هر نسخه؛ کیفیت تا MIN_QUALITY پایین می‌آید تا در آن جا شود
+    'BYTE_BUDGETS': {'thumb': 20 * 1024, 'card': 50 * 1024, 'full': 150 * 1024},
+    'MIN_QUALITY': 40,
+    # پروسه‌های پردازش عکس برای هر worker وب (image_pool.py)؛ با ۲ worker یعنی ۴ پروسه اضافه
+    'PROCESSING_THREADS': 2,
 }
 
+# ساخت کامل ایندکس پیشنهاد جستجو (suggest.py) در thread پس‌زمینه، نه در درخواست
+SUGGEST_BACKGROUND_BUILD = True
+
 # File Upload Optimization
 FILE_UPLOAD_MAX_MEMORY_SIZE = 25 * 1024 * 1024  # 25MB
 DATA_UPLOAD_MAX_MEMORY_SIZE = 25 * 1024 * 1024  # 25MB
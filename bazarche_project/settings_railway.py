@@ -109,12 +109,14 @@ TEMPLATES = [
                 'django.contrib.messages.context_processors.messages',
                 'bazarche_app.context_processors.main_categories',
                 'bazarche_app.context_processors.search_query',
+                'bazarche_app.context_processors.push_events',
             ],
         },
     },
 ]
 
 WSGI_APPLICATION = 'bazarche_project.wsgi.application'
+ASGI_APPLICATION = 'bazarche_project.asgi.application'
 
 # Database - PostgreSQL for Railway
 DATABASES = {
@@ -190,12 +192,19 @@ CACHES = {
     },
 }
 
+# کانال push رویدادهای SSE؛ سرویس events بدون REDIS_URL هیچ پیامی از web دریافت نمی‌کند
+PUSH_REDIS_URL = os.getenv('REDIS_URL') or None
+# آدرس api/events/ روی سرویس events، مثلا https://events.soodava.com/app/api/events/
+PUSH_EVENTS_URL = os.getenv('PUSH_EVENTS_URL') or None
+
 # Session settings
 SESSION_ENGINE = 'django.contrib.sessions.backends.db'  # Use database instead of cache
 SESSION_COOKIE_AGE = 1209600  # 2 weeks
 SESSION_COOKIE_SECURE = True
 SESSION_COOKIE_HTTPONLY = True
 SESSION_COOKIE_SAMESITE = 'Lax'
+# مثلا .soodava.com وقتی PUSH_EVENTS_URL روی زیردامنه دیگری است
+SESSION_COOKIE_DOMAIN = os.getenv('SESSION_COOKIE_DOMAIN') or None
 
 # django-allauth settings
 ACCOUNT_LOGIN_METHODS = {'username', 'email'}
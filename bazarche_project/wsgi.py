@@ -19,3 +19,8 @@ if 'DJANGO_SETTINGS_MODULE' not in os.environ:
         os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'bazarche_project.settings')
 
 application = get_wsgi_application()
+
+# ایندکس پیشنهاد جستجو در پس‌زمینه ساخته می‌شود تا اولین درخواست‌ها منتظر نمانند
+from bazarche_app.suggest import warm_up  # noqa: E402
+
+warm_up()
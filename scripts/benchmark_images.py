@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+"""
+مقایسه پردازش عکس جدید (bazarche_app/images.py) با compress_image قدیمی.
+
+برای هر عکس و هر روش، در یک پروسه تازه اندازه گرفته می‌شود:
+- زمان CPU
+- افزایش حداکثر حافظه (VmHWM)
+- حجم خروجی
+
+Usage:
+    python scripts/benchmark_images.py photo1.jpg photo2.jpg --runs 3
+    python scripts/benchmark_images.py            # عکس مصنوعی 12 مگاپیکسلی با چرخش EXIF
+"""
+import argparse
+import io
+import os
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(BASE_DIR)
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'bazarche_project.settings')
+
+from PIL import Image
+
+
+def legacy_compress(path, max_size=(600, 600), quality=50):
+    """همان compress_image قبلی views.py (decode کامل، NEAREST، JPEG کیفیت 50)؛ خروجی: تعداد بایت"""
+    if os.path.getsize(path) <= 150 * 1024:
+        return {'jpeg': os.path.getsize(path)}
+    img = Image.open(path)
+    if img.mode in ('RGBA', 'LA', 'P'):
+        img = img.convert('RGB')
+    if img.width > max_size[0] or img.height > max_size[1]:
+        img.thumbnail(max_size, Image.Resampling.NEAREST)
+    output = io.BytesIO()
+    img.save(output, format='JPEG', quality=quality, optimize=False, progressive=False, subsampling=2)
+    return {'jpeg': len(output.getvalue())}
+
+
+def pipeline(path, config):
+    """مسیر جدید: همه نسخه‌ها و قالب‌ها؛ خروجی: تعداد بایت هر نسخه/قالب"""
+    from bazarche_app.images import render_file
+    result = render_file(path, config)
+    return {
+        f'{name}.{fmt.lower()}': len(data)
+        for name, (_width, _height, encoded) in result['variants'].items()
+        for fmt, data in encoded.items()
+    }
+
+
+def memory_kb(field):
+    """VmRSS یا VmHWM از /proc/self/status (لینوکس)؛ None در سیستم‌های دیگر"""
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def reset_peak_memory():
+    """
+    صفر کردن حداکثر حافظه (VmHWM). ru_maxrss در لینوکس از پروسه والد به ارث می‌رسد
+    (بعد از execve هم) و برای پروسه تازه قابل اعتماد نیست.
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as clear_refs:
+            clear_refs.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def measure(method, path, config):
+    """اجرا در پروسه تازه تا حافظه هر اجرا جدا باشد"""
+    if method == 'pipeline':
+        # import ماژول‌ها قبل از اندازه‌گیری حافظه
+        import bazarche_app.images  # noqa: F401
+    if reset_peak_memory():
+        baseline = memory_kb('VmRSS')
+    else:
+        baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    started = time.process_time()
+    sizes = pipeline(path, config) if method == 'pipeline' else legacy_compress(path)
+    cpu = time.process_time() - started
+    peak = memory_kb('VmHWM') or resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return cpu, max(peak - baseline, 0) / 1024, sizes
+
+
+def synthetic_photo(directory):
+    """عکس 4000x3000 شبیه عکس گوشی (گرادیان + نویز) با EXIF چرخش 90 درجه"""
+    width, height = 4000, 3000
+    gradient = Image.linear_gradient('L').resize((width, height))
+    noise = Image.effect_noise((width, height), 40)
+    img = Image.merge('RGB', (gradient, noise, Image.blend(gradient, noise, 0.5)))
+    exif = Image.Exif()
+    exif[0x0112] = 6
+    path = os.path.join(directory, 'synthetic_12mp.jpg')
+    img.save(path, format='JPEG', quality=92, exif=exif)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('paths', nargs='*', help='عکس‌های ورودی')
+    parser.add_argument('--runs', type=int, default=3, help='تعداد اجرای هر روش برای هر عکس')
+    args = parser.parse_args()
+
+    from bazarche_app.images import render_config
+    config = render_config()
+
+    with tempfile.TemporaryDirectory() as directory:
+        paths = args.paths or [synthetic_photo(directory)]
+        context = multiprocessing.get_context('spawn')
+        for path in paths:
+            print(f'\n{os.path.basename(path)} ({os.path.getsize(path) / 1024:.0f} KB)')
+            for method in ('legacy', 'pipeline'):
+                runs = []
+                for _ in range(args.runs):
+                    with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                        runs.append(pool.submit(measure, method, path, config).result())
+                cpu = min(run[0] for run in runs)
+                peak = max(run[1] for run in runs)
+                sizes = runs[0][2]
+                print(f'  {method:<9} cpu {cpu * 1000:7.0f} ms   peak +{peak:6.1f} MB   total {sum(sizes.values()) / 1024:7.1f} KB')
+                if method == 'pipeline':
+                    for key, size in sizes.items():
+                        print(f'            {key:<12} {size / 1024:7.1f} KB')
+
+
+if __name__ == '__main__':
+    main()